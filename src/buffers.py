@@ -0,0 +1,80 @@
+"""
+@file buffers.py
+
+@brief Contains the BufferPool class, used to reuse image buffers between frames
+
+OpenCV functions allocate a new array for their output unless one is given
+with their dst argument. Allocating several full-frame arrays every frame is
+slow, and the allocator and garbage collector add jitter to frame times. A
+BufferPool hands out named arrays that are allocated once and reused on
+every later request with the same name.
+
+Each buffer is backed by a flat array, which is only reallocated if a larger
+size is requested. Smaller requests (such as a region of interest that
+changes size every frame) get a contiguous view of the front of the flat
+array, so they do not allocate either.
+
+A buffer is overwritten the next time its name is requested, so anything
+that needs to outlive the frame must be copied. Buffers used from more than
+one thread at a time need distinct names.
+
+Standard usage (pseudocode example)::
+
+pool = BufferPool()
+while True:
+  frame = get_video_frame()
+  blur = cv2.GaussianBlur(frame, (15,15), 0,
+    dst=pool.get('blur', frame.shape))
+"""
+import numpy as np # 3rd party packages
+
+class BufferPool:
+  def __init__(self):
+    """
+    @brief Initializes an empty pool
+    """
+    self.flat = {} # name -> flat backing array
+
+
+  def get(self, name, shape, dtype=np.uint8):
+    """
+    @brief Gets the named buffer with the given shape and type
+
+    @param name The name of the buffer. Names can include anything hashable,
+      such as a (name, color) tuple
+    @param shape The shape of the buffer
+    @param dtype The numpy type of the buffer
+
+    @return A contiguous array of the given shape. Its contents are whatever
+      was last written to the buffer
+    """
+    size = int(np.prod(shape))
+    flat = self.flat.get(name)
+    if flat is None or flat.dtype != dtype or flat.size < size:
+      flat = np.empty(size, dtype=dtype)
+      self.flat[name] = flat
+    return flat[:size].reshape(shape)
+
+
+  def clear(self):
+    """
+    @brief Frees all buffers in the pool
+    """
+    self.flat = {}
+
+
+def get_buffer(pool, name, shape, dtype=np.uint8):
+  """
+  @brief Gets a buffer from a pool that may not exist
+
+  @param pool The BufferPool, or None
+  @param name The name of the buffer
+  @param shape The shape of the buffer
+  @param dtype The numpy type of the buffer
+
+  @return The buffer, or None if there is no pool. OpenCV functions allocate
+    their output when given None as dst
+  """
+  if pool is None:
+    return None
+  return pool.get(name, shape, dtype)
@@ -3,9 +3,21 @@
 
 @brief Main script for tracking, displaying and moving robot
 
+Each frame goes through four stages: capture, detect (find the objects, robot
+and scene), plan (choose the closest object and predict its trajectory) and
+send (send movement packets to the pi). The Goalie class holds the state
+shared between frames and runs each stage as a method.
+
+The stages can run one after another in a single loop, or pipelined with
+each stage on its own thread (see pipeline.py), in which case the frame rate
+is set by the slowest stage rather than the sum of all of them. Either way,
+frames are annotated on a worker thread (see overlay.py), and displayed in
+the main thread, as OpenCV windows must be.
+
 @author Neil Jassal
 """
 import time # for fps counter
+import threading
 
 import cv2
 import numpy as np
@@ -19,142 +31,312 @@ import tracker as bt
 import graphics as gfx
 from fps import FPS
 from trajectory import TrajectoryPlanner
-from videostream import WebcamVideoStream
-
-
-def stream(tracker, camera=0, server=0):
-  """ 
-  @brief Captures video and runs tracking and moves robot accordingly
-
-  @param tracker The BallTracker object to be used
-  @param camera The camera number (0 is default) for getting frame data
-    camera=1 is generally the first webcam plugged in
-  """
-
-  ######## GENERAL PARAMETER SETUP ########
-  MOVE_DIST_THRESH = 20 # distance at which robot will stop moving
-  SOL_DIST_THRESH = 150 # distance at which solenoid fires
-  PACKET_DELAY = 1 # number of frames between sending data packets to pi
-  OBJECT_RADIUS = 13 # opencv radius for circle detection
-  AXIS_SAFETY_PERCENT = 0.05 # robot stops if within this % dist of axis edges
-
-  packet_cnt = 0
-  tracker.radius = OBJECT_RADIUS
-
-  ######## SERVER SETUP ########
-  motorcontroller_setup = False
-  if server:
-    # Create a TCP/IP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # Obtain server address by going to network settings and getting eth ip
-    server_address = ('169.254.171.10',10000) # CHANGE THIS
-    #server_address = ('localhost', 10000) # for local testing
-    print 'starting up on %s port %s' % server_address
-    sock.bind(server_address)
-    sock.listen(1)
-    connection, client_address = None, None
-    while True:
-      # Wait for a connection
-      print 'waiting for a connection'
-      connection, client_address = sock.accept()
-      break
-
-
-  ######## CV SETUP ########
-
-  # create video capture object for
-  #cap = cv2.VideoCapture(camera)
-  cap = WebcamVideoStream(camera).start() # WEBCAM
-  #cap = cv2.VideoCapture('../media/goalie-test.mov')
-  #cap = cv2.VideoCapture('../media/bounce.mp4')
-
-  cv2.namedWindow(tracker.window_name)
-
-  # create trajectory planner object
-  # value of bounce determines # of bounces. 0 is default (no bounces)
-  # bounce not currently working correctly
-  planner = TrajectoryPlanner(frames=4, bounce=0)
-
-  # create FPS object for frame rate tracking
-  fps_timer = FPS(num_frames=20)
-
-
-  while(True):
-    # start fps timer
-    fps_timer.start_iteration()
-
-    ######## CAPTURE AND PROCESS FRAME ########
-    ret, frame = True, cap.read() # WEBCAM
-    #ret, frame = cap.read() # for non-webcam testing
-    if ret is False:
-      print 'Frame not read'
-      exit()
+from motion import MotionGate
+from multitracker import MultiObjectTracker
+from pipeline import Pipeline
+from preview import PreviewPublisher
+from overlay import OverlayRenderer
+from quality import QualityController, get_level
+from latency import LatencyTracker
+from videostream import WebcamVideoStream, ProcessVideoStream, \
+  FileVideoStream, CaptureProfile
+
+
+######## GENERAL PARAMETER SETUP ########
+MOVE_DIST_THRESH = 20 # distance at which robot will stop moving
+SOL_DIST_THRESH = 150 # distance at which solenoid fires
+SOL_TIME_THRESH = 0.1 # seconds before predicted impact the solenoid fires
+MAX_BOUNCES = 3 # most rail bounces predicted before the robot axis
+PACKET_DELAY = 1 # number of frames between sending data packets to pi
+OBJECT_RADIUS = 13 # opencv radius for circle detection
+AXIS_SAFETY_PERCENT = 0.05 # robot stops if within this % dist of axis edges
+REPORT_FRAMES = 100 # number of frames between pipeline reports
+# trajectory planner mode. A Kalman filter predicts from an object's second
+# detection instead of its fifth, and through missed frames. 'fit' misses
+# straight shots at the robot, which 'param' handles but only from 4 points
+TRAJECTORY_MODE = 'kalman'
+
+
+class FrameData:
+  def __init__(self, frame, timestamp=None, seq=None):
+    """
+    @brief Holds a frame and the results of each stage run on it
+
+    @param frame The captured frame
+    @param timestamp Capture time of the frame in seconds
+    @param seq Sequence number of the frame
+    """
+    self.frame = frame
+    self.timestamp = timestamp
+    self.seq = seq
+    self.moving = True # False if the motion gate skipped the frame
+
+    # Set by the detect stage
+    self.object_list = [] # list of Circle objects found
+    self.robot = None # single Circle for the robot position
+    self.robot_markers = [] # 2-elem list of Circle objects for robot markers
+    self.walls = [] # 2-elem list of Line objects for the rails
+    self.robot_axis = None # Line object between the robot axis markers
+    self.scene_version = None # SceneCache version, None if not cached
+
+    # Set by the plan stage
+    self.closest_obj = None # object closest to the robot axis
+    self.closest_pt = None # closest point to it on the robot axis
+    self.closest_line = None # Line between the two, only for viewing
+    self.traj_list = [] # list of Lines for bounces, and final line traj
+    self.traj = None # final trajectory Line
+    self.intercept = None # Intercept where traj meets the robot axis, or None
+
+    # Time each stage finished, for latency measurement
+    self.detect_time = None
+    self.plan_time = None
+    self.sent_time = None # None if no packet was sent
+    self.ack_seq = None # token sent for the pi to reply with, if any
+
+
+class Goalie:
+  def __init__(self, tracker, cap, connection=None, copy_frames=0,
+    quality=None, ack=0, mode=TRAJECTORY_MODE, drag=0.0):
+    """
+    @brief Initializes the state shared between frames
+
+    @param tracker The BallTracker object to be used
+    @param cap The started WebcamVideoStream or ProcessVideoStream to capture
+      frames from
+    @param connection The socket connected to the pi, or None to not send
+    @param copy_frames If true, the detect stage copies the frame out of the
+      tracker's buffers. Needed when stages run in parallel, since the
+      buffers are overwritten by the next frame while this one is displayed
+    @param quality A QualityController to adjust the processing settings to
+      hold a frame time budget, or None to always use the full settings
+    @param ack If true, MM packets carry the frame's sequence number, and the
+      pi replies once the motor starts (see read_replies), to measure the
+      latency up to the motor. The pi client must support it
+    @param mode Trajectory planner mode, 'fit', 'param' or 'kalman' (see
+      TRAJECTORY_MODE)
+    @param drag In 'kalman' mode, the rate the puck's velocity decays at, per
+      second, from friction with the table. 0 for constant velocity
+    """
+    self.tracker = tracker
+    self.cap = cap
+    self.connection = connection
+    self.copy_frames = copy_frames
+    self.quality = quality
+    self.ack = ack
+    self.latency = LatencyTracker()
+
+    self.packet_cnt = 0
+    self.motorcontroller_setup = False
+    self.last_seq = None # sequence number of the last captured frame
+
+    # create multi-object tracker, each tracked object gets its own trajectory
+    # planner. value of bounce determines the most bounces off the rails
+    # predicted, 0 for none
+    self.tracks = MultiObjectTracker(frames=4, bounce=MAX_BOUNCES, mode=mode,
+      drag=drag)
+    # planner of the object closest to the axis, empty until one is found
+    self.planner = TrajectoryPlanner(frames=4, bounce=MAX_BOUNCES, mode=mode,
+      drag=drag)
+    # planners are changed by detect and read by plan, which may be running
+    # in different threads
+    self.planner_lock = threading.Lock()
+
+    # create motion gate to skip processing while the table is still
+    self.motion_gate = MotionGate()
+
+    # results of the last frame that was processed, reused for frames skipped
+    # by the motion gate
+    self.last_detect = FrameData(None)
+    self.last_plan = FrameData(None)
+
+
+  def capture(self):
+    """
+    @brief Captures the next frame
+
+    Waits for a frame newer than the last one captured, so the same frame is
+    never processed twice.
+
+    Frames from a ProcessVideoStream are views of its shared memory ring,
+    which the capture process keeps overwriting, so they are copied out. A
+    frame overwritten while it was being copied is dropped.
+
+    @return FrameData for the frame, or None if no new frame is ready yet
+    """
+    # WEBCAM
+    frame, timestamp, seq = self.cap.read_next(self.last_seq, timeout=0.1)
+    if seq is None:
+      return None
+    self.last_seq = seq
+    if isinstance(self.cap, ProcessVideoStream):
+      frame = frame.copy()
+      if not self.cap.is_valid(seq):
+        return None
+    return FrameData(frame, timestamp, seq)
+
+
+  def detect(self, data):
+    """
+    @brief Finds the objects, robot and scene in the frame
+
+    The objects found are assigned to tracks, keeping each object's points
+    separate.
+
+    @param data The FrameData from capture
+
+    @return The FrameData with the detect results filled in
+    """
+    tracker = self.tracker
+
+    # skip processing if nothing in the frame has moved, and reuse the
+    # results of the last processed frame
+    data.moving = self.motion_gate.check(data.frame)
+    if not data.moving:
+      frame = tracker.scale_frame(frame=data.frame, w=640, h=480, scale=1)
+      last = self.last_detect
+      data.object_list = last.object_list
+      data.robot = last.robot
+      data.robot_markers = last.robot_markers
+      data.walls = last.walls
+      data.robot_axis = last.robot_axis
+      data.scene_version = last.scene_version
 
-    # resize to 640x480, flip and blur
-    frame,img_hsv = tracker.setup_frame(frame=frame, w=640,h=480,
-      scale=1, blur_window=15)
-
-
-    ######## TRACK OBJECTS ########
-    # use the HSV image to get Circle objects for robot and objects.
-    # object_list is list of Circle objects found.
-    # robot is single Circle for the robot position
-    # robot_markers is 2-elem list of Circle objects for robot markers
-    object_list = tracker.find_circles(img_hsv.copy(), tracker.track_colors,
-      tracker.num_objects)
-    robot, robot_markers = tracker.find_robot_system(img_hsv)
-    walls = tracker.get_rails(img_hsv, robot_markers, colors.Yellow)
-    planner.walls = walls
-
-    # Get the line/distances between the robot markers
-    # robot_axis is Line object between the robot axis markers
+    else:
+      # processing settings, lowered by the quality controller if over budget
+      blur_window = 15
+      pyramid_scale = None # use the tracker's own
+      if self.quality is not None:
+        settings = self.quality.get_settings()
+        blur_window = settings['blur_window']
+        pyramid_scale = settings['pyramid_scale']
+        tracker.morph_iterations = settings['morph_iterations']
+      start_time = utils.get_time()
+
+      # resize to 640x480, flip and blur
+      # detections carry the frame's capture time, for velocity in pixels/sec
+      frame,img_hsv = tracker.setup_frame(frame=data.frame, w=640,h=480,
+        scale=1, blur_window=blur_window, pyramid_scale=pyramid_scale,
+        timestamp=data.timestamp, seq=data.seq)
+
+
+      ######## TRACK OBJECTS ########
+      # use the HSV image to get Circle objects for robot and objects.
+      # markers, walls and axis are cached once stable (see scene.py)
+      # the color passes run in parallel if the tracker has workers
+      (data.object_list, data.robot, data.robot_markers, data.walls,
+        data.robot_axis) = tracker.find_all(img_hsv, self.planner,
+        colors.Yellow)
+      if tracker.scene is not None:
+        data.scene_version = tracker.scene.version
+
+      # assign objects to tracks, keeping each object's points separate
+      with self.planner_lock:
+        self.tracks.set_scene(data.walls, data.robot_axis)
+        self.tracks.update(data.object_list)
+      self.last_detect = data
+
+      if self.quality is not None:
+        self.quality.update(utils.get_time() - start_time)
+
+    data.detect_time = utils.get_time()
+
+    if self.copy_frames:
+      frame = frame.copy()
+    data.frame = frame
+    return data
+
+
+  def plan(self, data):
+    """
+    @brief Chooses the object closest to the robot axis, and predicts its
+      trajectory
+
+    @param data The FrameData from detect
+
+    @return The FrameData with the plan results filled in
+    """
+    if not data.moving:
+      last = self.last_plan
+      data.closest_obj = last.closest_obj
+      data.closest_pt = last.closest_pt
+      data.closest_line = last.closest_line
+      data.traj_list = last.traj_list
+      data.traj = last.traj
+      data.intercept = last.intercept
+      data.plan_time = utils.get_time()
+      return data
+
+    # Get the distances to the robot axis
     # points is list of Point objects of closest intersection w/ robot axis
     # distanes is a list of distances of each point to the robot axis
-    robot_axis = utils.line_between_circles(robot_markers)
-    points, distances = utils.distance_from_line(object_list, robot_axis)
-    planner.robot_axis = robot_axis
+    points, distances = utils.distance_from_line(data.object_list,
+      data.robot_axis)
 
     ######## TRAJECTORY PLANNING ########
-    # get closest object and associated point, generate trajectory
+    # get closest object and associated point, generate trajectory from
+    # the planner of its track
     closest_obj_index = utils.min_index(distances) # index of min value
-    closest_line = None
-    closest_pt = None
-    if closest_obj_index is not None:
-      closest_obj = object_list[closest_obj_index]
-      closest_pt = points[closest_obj_index]
-
-      closest_line = utils.get_line(closest_obj, closest_pt) # only for viewing
-      planner.add_point(closest_obj)
-
-
-    # Get trajectory - list of elements for bounces, and final line traj
-    # Last line intersects with robot axis
-    traj_list = planner.get_trajectory_list(colors.Cyan)
-    traj = planner.traj
-
+    with self.planner_lock:
+      if closest_obj_index is not None:
+        data.closest_obj = data.object_list[closest_obj_index]
+        data.closest_pt = points[closest_obj_index]
+
+        # only for viewing
+        data.closest_line = utils.get_line(data.closest_obj, data.closest_pt)
+        track = self.tracks.get_track(data.closest_obj)
+        if track is not None:
+          self.planner = track.planner
+
+      # Get trajectory - list of elements for bounces, and final line traj
+      # Last line intersects with robot axis
+      data.traj_list = self.planner.get_trajectory_list(colors.Cyan)
+      data.traj = self.planner.traj
+      # when and where the object reaches the robot axis
+      data.intercept = self.planner.get_intercept()
+
+    self.last_plan = data
+    data.plan_time = utils.get_time()
+    return data
+
+
+  def send(self, data):
+    """
+    @brief Sends the movement packet for the frame to the pi
+
+    @param data The FrameData from plan
+
+    @return The FrameData, unchanged
+    """
+    robot = data.robot
+    robot_markers = data.robot_markers
+    closest_obj = data.closest_obj
+    closest_pt = data.closest_pt
+    connection = self.connection
 
     ######## SEND DATA TO CLIENT ########
-    if packet_cnt != PACKET_DELAY:
-      packet_cnt = packet_cnt + 1
+    if not data.moving:
+      pass # nothing new to send
+    elif self.packet_cnt != PACKET_DELAY:
+      self.packet_cnt = self.packet_cnt + 1
     else:
-      packet_cnt = 0 # reset packet counter
+      self.packet_cnt = 0 # reset packet counter
 
       # error checking to ensure will run properly
       if len(robot_markers) is not 2 or robot is None or closest_pt is None:
         pass
-      elif server:
+      elif connection is not None:
         try:
-          if motorcontroller_setup is False:
+          if self.motorcontroller_setup is False:
             # send S packet for motorcontroller setup
-            motorcontroller_setup = True
+            self.motorcontroller_setup = True
 
 
             ######## SETUP MOTORCONTROLLER ########
             axis_pt1 = robot_markers[0].to_pt_string()
             axis_pt2 = robot_markers[1].to_pt_string()
-            data = 'SM '+axis_pt1+' '+axis_pt2+' '+robot.to_pt_string()
-            print data
-            connection.sendall(data)
+            packet = 'SM '+axis_pt1+' '+axis_pt2+' '+robot.to_pt_string()
+            print packet
+            self.send_packet(data, packet)
 
           # setup is done, send packet with movement data
           else:
@@ -162,8 +344,22 @@ def stream(tracker, camera=0, server=0):
             print 'dist: ' + str(obj_robot_dist) # USE FOR CALIBRATION
 
             ######## SOLENOID ACTIVATION CODE ########
-            # check if solenoid should fire
-            if obj_robot_dist <= SOL_DIST_THRESH: # fire solenoid, dont move
+            # check if solenoid should fire: when the predicted impact is
+            # close enough in time, less the time since the frame was
+            # captured. Uses distance if there is no prediction, or frames
+            # are not timed live (video not played in realtime)
+            intercept = data.intercept
+            live = getattr(self.cap, 'realtime', 1)
+            if intercept is not None and intercept.timestamp is not None \
+              and live:
+              time_left = intercept.time - self.cap.get_age(data.timestamp)
+              print 'impact in: %.3f +- %.3f' % (time_left,
+                intercept.time_std)
+              # an impact long past is a stale prediction, not a shot
+              fire = -SOL_TIME_THRESH < time_left <= SOL_TIME_THRESH
+            else:
+              fire = obj_robot_dist <= SOL_DIST_THRESH
+            if fire: # fire solenoid, dont move
               print 'activate solenoid!'
               # TODO SEND SOLENOID ACTIVATE
 
@@ -180,24 +376,24 @@ def stream(tracker, camera=0, server=0):
             #   rob_ax2_dist/axis_length <= AXIS_SAFETY_PERCENT:
             #   # in danger zone, kill motor movement
             #   print 'INVALID ROBOT LOCATION: stopping motor'
-            #   data = 'KM'
-            #   connection.sendall(data)
+            #   packet = 'KM'
+            #   self.send_packet(data, packet)
 
             # if in danger zone near axis edge, move towards other edge
             if rob_ax1_dist/axis_length <= AXIS_SAFETY_PERCENT:
               print 'INVALID ROBOT LOCATION'
-              data = 'MM '+robot.to_pt_string()+' '+robot_markers[1].to_pt_string()
+              packet = 'MM '+robot.to_pt_string()+' '+robot_markers[1].to_pt_string()
             elif rob_ax2_dist/axis_length <= AXIS_SAFETY_PERCENT:
               print 'INVALID ROBOT LOCATION'
-              data = 'MM '+robot.to_pt_string()+' '+robot_markers[0].to_pt_string()
+              packet = 'MM '+robot.to_pt_string()+' '+robot_markers[0].to_pt_string()
 
             # check if robot should stop moving
             elif obj_robot_dist <= MOVE_DIST_THRESH: # obj close to robot
               # Send stop command, obj is close enough to motor to hit
-              data = 'KM'
-              print data
-              connection.sendall(data)
-              pass 
+              packet = 'KM'
+              print packet
+              self.send_packet(data, packet)
+              pass
 
             # Movement code
             else: # far enough so robot should move
@@ -209,64 +405,256 @@ def stream(tracker, camera=0, server=0):
               #   traj_axis_pt = utils.clamp_point_to_line(
               #     axis_intersect, robot_axis)
 
-              #   data = 'D '+robot.to_pt_string()+' '+traj_axis_pt.to_string()
-              #   connection.sendall(data)
+              #   packet = 'D '+robot.to_pt_string()+' '+traj_axis_pt.to_string()
+              #   self.send_packet(data, packet)
 
               #### FOR CLOSEST POINT ON AXIS ####
               if closest_pt is not None and robot is not None:
                 # if try to move more than length of axis, stop instead
                 if utils.get_pt2pt_dist(robot,closest_pt) > axis_length:
                   print 'TRYING TO MOVE OUT OF RANGE'
-                  data = 'KM'
-                  print data
-                  connection.sendall(data)
+                  packet = 'KM'
+                  print packet
+                  self.send_packet(data, packet)
                 else:
-                  data = 'MM ' + robot.to_pt_string() + ' ' + \
+                  packet = 'MM ' + robot.to_pt_string() + ' ' + \
                     closest_pt.to_string()
-                  print data
-                  connection.sendall(data)
+                  print packet
+                  self.send_packet(data, packet)
 
         except IOError:
           pass # don't send anything
 
+    # frames skipped by the motion gate did no work, so are not measured.
+    # Delays are measured from the wall clock capture time, which differs
+    # from the frame's timestamp for video not played in realtime
+    if data.moving:
+      self.latency.add_frame(self.cap.get_capture_time(data.timestamp),
+        data.detect_time, data.plan_time, data.sent_time, data.ack_seq)
+    return data
+
+
+  def send_packet(self, data, packet):
+    """
+    @brief Sends a packet to the pi, and stamps the frame with the send time
+
+    @param data The FrameData the packet was made from
+    @param packet The packet string
+    """
+    if self.ack and packet.startswith('MM'):
+      data.ack_seq = data.seq
+      packet += ' ' + str(data.seq) # token for the pi to reply with
+    self.connection.sendall(packet)
+    data.sent_time = utils.get_time()
+
+
+  def read_replies(self):
+    """
+    @brief Reads the pi's replies to MM packets, until the connection closes
+
+    Run on its own thread when ack is enabled. Each reply is a line of
+    'AK seq pi_ms', where pi_ms is the time the pi took from receiving the
+    packet to starting the motor, in milliseconds.
+    """
+    buf = ''
+    while True:
+      try:
+        received = self.connection.recv(1024)
+      except IOError:
+        return
+      if not received:
+        return
+      reply_time = utils.get_time()
+      buf += received
+      lines = buf.split('\n')
+      buf = lines.pop() # partial line, completed by the next recv
+      for line in lines:
+        reply = line.split()
+        if len(reply) is 3 and reply[0] == 'AK':
+          self.latency.add_reply(int(reply[1]), float(reply[2]) / 1000.0,
+            reply_time)
+
+
+def stream(tracker, camera=0, server=0, pipelined=1, process_capture=0,
+  video=None, realtime=1, loop=0, headless=0, preview=None, budget=None,
+  profile=None, ack=0, mode=TRAJECTORY_MODE, drag=0.0):
+  """
+  @brief Captures video and runs tracking and moves robot accordingly
 
+  @param tracker The BallTracker object to be used
+  @param camera The camera number (0 is default) for getting frame data
+    camera=1 is generally the first webcam plugged in
+  @param server If true, waits for the pi to connect and sends it packets
+  @param pipelined If true, capture, detect, plan and send each run on their
+    own thread. Otherwise they run one after another in the display loop
+  @param process_capture If true, frames are captured in a separate process
+    and shared through shared memory (see ProcessVideoStream)
+  @param video Path of a video file to replay instead of the camera, such as
+    '../media/bounce.mp4'. The stream ends with the video
+  @param realtime If true, the video plays at its own frame rate. Otherwise
+    every frame is processed, as fast as possible, for benchmarking
+  @param loop If true, the video restarts once it ends
+  @param headless If true, frames are not annotated or displayed. Stop with
+    ctrl-c instead of q
+  @param preview A PreviewPublisher to send a small annotated copy of every
+    few frames to, or None
+  @param budget Target detection time per frame in seconds. Processing
+    resolution, blur and morphology are lowered to stay within it (see
+    QualityController), starting from the tracker's pyramid_scale. None
+    always uses the full settings
+  @param profile A CaptureProfile to configure the camera with, or None to
+    use its defaults
+  @param ack If true, the pi replies to MM packets, to measure latency up to
+    the motor starting. Needs a pi client that supports it
+  @param mode Trajectory planner mode, 'fit' to fit a line through the last
+    few points, 'param' to fit their position against time, or 'kalman' to
+    follow each object with a Kalman filter (see TRAJECTORY_MODE)
+  @param drag In 'kalman' mode, the rate the puck's velocity decays at, per
+    second. 0 for constant velocity
+  """
+  tracker.radius = OBJECT_RADIUS
 
-    ######## ANNOTATE FRAME FOR VISUALIZATION ########
-    frame = gfx.draw_lines(img=frame, line_list=walls)
-
-    frame = gfx.draw_robot_axis(img=frame, line=robot_axis) # draw axis line
-    frame = gfx.draw_robot(frame, robot) # draw robot
-    frame = gfx.draw_robot_markers(frame, robot_markers) # draw markers
-
-    frame = gfx.draw_circles(frame, object_list) # draw objects
-
-    # eventually won't need to print this one
-    frame = gfx.draw_line(img=frame, line=closest_line) # closest obj>axis
-
-    # draw full set of trajectories, including bounces
-    #frame = gfx.draw_lines(img=frame, line_list=traj_list)
-    #frame = gfx.draw_line(img=frame, line=traj) # for no bounces
-
-    frame = gfx.draw_point(img=frame, pt=closest_pt)
-    #frame=gfx.draw_line(frame,planner.debug_line) # for debug
+  ######## SERVER SETUP ########
+  connection = None
+  if server:
+    # Create a TCP/IP socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Obtain server address by going to network settings and getting eth ip
+    server_address = ('169.254.171.10',10000) # CHANGE THIS
+    #server_address = ('localhost', 10000) # for local testing
+    print 'starting up on %s port %s' % server_address
+    sock.bind(server_address)
+    sock.listen(1)
+    connection, client_address = None, None
+    while True:
+      # Wait for a connection
+      print 'waiting for a connection'
+      connection, client_address = sock.accept()
+      break
 
 
+  ######## CV SETUP ########
 
-    ######## FPS COUNTER ########
-    fps_timer.get_fps()
-    fps_timer.display(frame)
+  # create video capture object for
+  if video is not None: # for testing w/o webcam
+    cap = FileVideoStream(video, realtime=realtime, loop=loop).start()
+  elif process_capture:
+    # WEBCAM, in its own process
+    cap = ProcessVideoStream(camera, profile=profile).start()
+  else:
+    cap = WebcamVideoStream(camera, profile=profile).start() # WEBCAM
+
+  if not headless:
+    cv2.namedWindow(tracker.window_name)
+
+  # frames must be copied out of the tracker's buffers to be rendered on
+  # another thread, and shared memory frames are overwritten once the
+  # capture ring wraps around
+  quality = None
+  if budget is not None:
+    quality = QualityController(budget,
+      level=get_level(tracker.pyramid_scale))
+  goalie = Goalie(tracker, cap, connection,
+    copy_frames=pipelined or process_capture or not headless,
+    quality=quality, ack=ack, mode=mode, drag=drag)
+  if ack and connection is not None:
+    reader = threading.Thread(target=goalie.read_replies, name='replies')
+    reader.daemon = True
+    reader.start()
 
+  # create FPS object for frame rate tracking
+  fps_timer = FPS(num_frames=20)
 
-    ######## DISPLAY FRAME ON SCREEN ########
-    cv2.imshow(tracker.window_name,frame)
-    # quit by pressing q
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-      break
+  # annotates frames, on a worker thread unless headless
+  renderer = OverlayRenderer(fps_timer)
+  if not headless:
+    renderer.start()
+
+  # each stage runs on its own thread, keeping only the latest frame. When
+  # replaying video as fast as possible, every frame is kept instead
+  pipeline = None
+  if pipelined:
+    pipeline = Pipeline(queue_size=1, drop=video is None or realtime)
+    pipeline.add_source('capture', goalie.capture)
+    pipeline.add_stage('detect', goalie.detect)
+    pipeline.add_stage('plan', goalie.plan)
+    pipeline.add_stage('send', goalie.send)
+    pipeline.start()
+
+  frame_cnt = 0
+  start_time = time.time()
+  try:
+    while(True):
+      # start fps timer
+      fps_timer.start_iteration()
+
+      ######## CAPTURE AND PROCESS FRAME ########
+      # checked first, so frames still in the pipeline are not missed
+      finished = getattr(cap, 'finished', False)
+      if pipeline is not None:
+        data = pipeline.get(timeout=0.1)
+      else:
+        data = goalie.capture()
+        if data is not None:
+          data = goalie.send(goalie.plan(goalie.detect(data)))
+
+      if data is None and finished:
+        break # end of the video
+
+      if data is not None:
+        frame_cnt += 1
+
+        ######## FPS COUNTER ########
+        fps_timer.get_fps()
+
+        ######## ANNOTATE FRAME FOR VISUALIZATION ########
+        if not headless:
+          renderer.submit(data)
+        # only previewed frames are annotated in headless mode
+        elif preview is not None and preview.due():
+          preview.publish(renderer.render(data))
+
+        if frame_cnt % REPORT_FRAMES is 0:
+          if pipeline is not None:
+            print pipeline.report()
+          if quality is not None:
+            print quality.report()
+          print goalie.latency.report()
+          dropped, failed = cap.get_stats()
+          print 'camera: %d dropped, %d failed, %.1f ms old, %s fps' % (
+            dropped, failed, 1000.0 * cap.get_age(data.timestamp),
+            fps_timer.fps_str)
+
+      ######## DISPLAY FRAME ON SCREEN ########
+      if not headless:
+        frame = renderer.get()
+        if frame is not None:
+          cv2.imshow(tracker.window_name,frame)
+          if preview is not None and preview.due():
+            preview.publish(frame)
+
+        # quit by pressing q
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+          break
+  except KeyboardInterrupt: # quit headless mode with ctrl-c
+    pass
+
+  elapsed_time = time.time() - start_time
+  print '%d frames in %.1f s, %.1f fps' % (frame_cnt, elapsed_time,
+    frame_cnt / elapsed_time)
+  if pipeline is not None:
+    pipeline.stop()
+    print pipeline.report()
+  print goalie.latency.report()
+
+  renderer.stop()
+  if preview is not None:
+    preview.stop()
 
   # release capture
-  cap.stop() # WEBCAM
-  #cap.release() # for testing w/o webcam
-  cv2.destroyAllWindows()
+  cap.stop()
+  if not headless:
+    cv2.destroyAllWindows()
 
 
 def main():
@@ -285,10 +673,20 @@ def main():
     rail_color=rail_color,
     track_colors=track_colors, 
     radius=13,
-    num_objects = 1) 
-
-  stream(tracker, camera=0, server=1) # begin tracking and object detection
-
+    num_objects = 1,
+    lut_bits=6,
+    roi_tracking=1,
+    scene_cache=1,
+    pyramid_scale=2,
+    workers=None)
+
+  # begin tracking and object detection, within 25ms of detection per frame
+  # frames are captured at the processing size, as MJPG with no buffering
+  stream(tracker, camera=0, server=1, budget=0.025,
+    profile=CaptureProfile(width=640, height=480, fps=60, fourcc='MJPG'))
+  # headless, with previews sent to a laptop running preview.show_previews
+  #stream(tracker, camera=0, server=1, headless=1,
+  #  preview=PreviewPublisher(address=('169.254.171.11', 10001)))
 
 
 if __name__ == "__main__":
@@ -71,7 +71,7 @@ def draw_circle(img, c):
   if c is None:
     return img
 
-  x,y,radius = c.x, c.y, c.radius
+  x,y,radius = int(c.x), int(c.y), int(c.radius)
   cv2.circle(img, (x,y), radius, c.color.bgr, 2)
   cv2.circle(img, (x,y), 5, colors.Red.bgr, -1) # center 
   return img
@@ -143,14 +143,15 @@ def draw_robot_axis(img, robot_pos=None, line=None):
     return img
 
   if line is not None:
-    img = cv2.line(img, (line.x1,line.y1), (line.x2,line.y2),
+    img = cv2.line(img, (int(line.x1),int(line.y1)),
+      (int(line.x2),int(line.y2)),
       color=line.color.bgr, thickness=line.thickness)
 
   # No line object given, draw line using robot_pos
   elif robot_pos is not None:
     img = cv2.line(img, 
-      (robot_pos[0].x, robot_pos[0].y),
-      (robot_pos[1].x, robot_pos[1].y),
+      (int(robot_pos[0].x), int(robot_pos[0].y)),
+      (int(robot_pos[1].x), int(robot_pos[1].y)),
       color=colors.Red.bgr, thickness=3)  
 
   return img
\ No newline at end of file
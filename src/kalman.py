@@ -0,0 +1,176 @@
+"""
+@file kalman.py
+
+@brief Contains the KalmanFilter class, which estimates an object's motion
+
+A line fit through the last n points needs n detections before it predicts
+anything, and uses no timing. The KalmanFilter instead keeps an estimate of
+the object's position and velocity, [x, y, vx, vy], and its covariance. Each
+timestamped detection first moves the estimate forward to the detection's
+time (predict), then corrects it with the detection (update). The velocity
+is usable from the second detection, and missed frames only mean a longer
+step forward to the next detection, with a larger uncertainty.
+
+The motion model is constant velocity, with optional drag, where the
+velocity decays as exp(-drag * t), for a puck slowing down on the table.
+Unmodeled accelerations (hits, bounces) are process noise.
+
+Time is in seconds, positions in pixels and velocities in pixels per second.
+If detections are stamped with frame numbers instead, the time unit is
+frames, and the noise parameters and drag must be scaled to match before the
+first update (see scale_time).
+
+Standard usage (pseudocode example)::
+
+kf = KalmanFilter(drag=0.5)
+while True:
+  point = get_video_frame().get_object_location() # timestamped Point
+  kf.update(point.x, point.y, point.timestamp)
+  print kf.get_position(), kf.get_velocity()
+"""
+import math # built-in packages
+
+import numpy as np # 3rd party packages
+
+# only position is measured
+H = np.array([[1.0, 0.0, 0.0, 0.0],
+              [0.0, 1.0, 0.0, 0.0]])
+
+
+class KalmanFilter:
+  def __init__(self, process_noise=1e5, measurement_noise=2.0,
+    init_velocity=2000.0, drag=0.0):
+    """
+    @brief Initializes parameters, with no estimate yet
+
+    @param process_noise Spectral density of the unmodeled acceleration, in
+      pixels^2/s^3. Higher follows hits and bounces faster, but is noisier
+    @param measurement_noise Standard deviation of a detection, in pixels
+    @param init_velocity Standard deviation of the velocity before the
+      second detection, in pixels per second
+    @param drag Rate the velocity decays at, per second. 0 for constant
+      velocity
+    """
+    self.process_noise = process_noise
+    self.R = np.eye(2) * measurement_noise * measurement_noise
+    self.init_velocity = init_velocity
+    self.drag = drag
+
+    self.x = None # state estimate [x, y, vx, vy], None until first update
+    self.P = None # state covariance
+    self.t = None # time of the estimate
+    self.updates = 0 # number of detections added
+
+
+  def scale_time(self, unit):
+    """
+    @brief Converts the noise parameters and drag to another time unit
+
+    The parameters are given per second. Detections stamped in another unit,
+    such as frame numbers, need them converted before the first update.
+
+    @param unit Length of the new time unit in seconds, such as 1/60.0 for
+      the frames of a 60 fps camera
+    """
+    self.process_noise *= unit ** 3
+    self.init_velocity *= unit
+    self.drag *= unit
+
+
+  def transition(self, dt):
+    """
+    @brief Gets the state transition and process noise over a time step
+
+    @param dt The time step
+
+    @return (F, Q) 4x4 numpy arrays
+    """
+    if self.drag > 0:
+      decay = math.exp(-self.drag * dt)
+      gain = (1.0 - decay) / self.drag # distance per unit of velocity
+    else:
+      decay = 1.0
+      gain = dt
+    F = np.array([[1.0, 0.0, gain, 0.0],
+                  [0.0, 1.0, 0.0, gain],
+                  [0.0, 0.0, decay, 0.0],
+                  [0.0, 0.0, 0.0, decay]])
+
+    # white noise acceleration, the same on both axes
+    q = self.process_noise
+    pp = q * dt * dt * dt / 3.0
+    pv = q * dt * dt / 2.0
+    vv = q * dt
+    Q = np.array([[pp, 0.0, pv, 0.0],
+                  [0.0, pp, 0.0, pv],
+                  [pv, 0.0, vv, 0.0],
+                  [0.0, pv, 0.0, vv]])
+    return F, Q
+
+
+  def predict(self, t):
+    """
+    @brief Moves the estimate forward to a time, without a detection
+
+    @param t The time to move to. Times before the estimate are ignored
+    """
+    if self.x is None or t <= self.t:
+      return
+    F, Q = self.transition(t - self.t)
+    self.x = F.dot(self.x)
+    self.P = F.dot(self.P).dot(F.T) + Q
+    self.t = t
+
+
+  def update(self, x, y, t):
+    """
+    @brief Moves the estimate to the detection's time, and corrects it
+
+    @param x The detected x position
+    @param y The detected y position
+    @param t The time of the detection
+    """
+    if self.x is None: # first detection, velocity unknown
+      self.x = np.array([x, y, 0.0, 0.0], dtype=np.float64)
+      self.P = np.diag([self.R[0, 0], self.R[1, 1],
+        self.init_velocity ** 2, self.init_velocity ** 2])
+      self.t = t
+      self.updates = 1
+      return
+
+    self.predict(t)
+
+    residual = np.array([x, y], dtype=np.float64) - H.dot(self.x)
+    S = H.dot(self.P).dot(H.T) + self.R
+    K = self.P.dot(H.T).dot(np.linalg.inv(S)) # Kalman gain
+    self.x = self.x + K.dot(residual)
+    self.P = (np.eye(4) - K.dot(H)).dot(self.P)
+    self.updates += 1
+
+
+  def get_position(self, t=None):
+    """
+    @brief Gets the estimated position
+
+    @param t Time to predict the position at, or None for the time of the
+      estimate. The estimate itself is not changed
+
+    @return (x, y), or None if there is no estimate
+    """
+    if self.x is None:
+      return None
+    if t is None or t <= self.t:
+      return (self.x[0], self.x[1])
+    F, unused = self.transition(t - self.t)
+    x = F.dot(self.x)
+    return (x[0], x[1])
+
+
+  def get_velocity(self):
+    """
+    @brief Gets the estimated velocity
+    @return (vx, vy), or None if there have been fewer than two detections
+    """
+    if self.updates < 2:
+      return None
+    return (self.x[2], self.x[3])
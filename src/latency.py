@@ -0,0 +1,141 @@
+"""
+@file latency.py
+
+@brief Contains the LatencyTracker class, which measures end-to-end latency
+
+What decides whether the goalie blocks a shot is how old a frame is when the
+command made from it reaches the motor, not the frame rate. Every frame is
+stamped when it is captured, when detection and planning are done, and when
+its packet is sent, all with utils.get_time. The LatencyTracker keeps a
+rolling window of each stamp's delay after capture, and reports the 50th,
+95th and 99th percentiles.
+
+With the pi's cooperation, packets carry the frame's sequence number, and
+the pi replies once the motor has started stepping, with the time it took
+from receiving the packet. The two machines' clocks are not synchronized,
+so the network delay is taken as half the round trip time, less the pi's
+own time: received = sent + (round trip - pi time) / 2, and
+step = received + pi time.
+
+Standard usage (pseudocode example)::
+
+latency = LatencyTracker()
+while True:
+  capture_time = utils.get_time()
+  process(get_video_frame())
+  latency.add('detect', utils.get_time() - capture_time)
+  print latency.report()
+"""
+import threading # built-in packages
+from collections import deque
+
+import numpy as np # 3rd party packages
+
+import utils # application-specific
+
+# stamps in the order they happen to a frame, each measured from capture
+STAGES = ['detect', 'plan', 'sent', 'received', 'step']
+
+
+class LatencyTracker:
+  def __init__(self, window=300, max_pending=64):
+    """
+    @brief Initializes empty windows
+
+    @param window Number of most recent frames the percentiles are taken over
+    @param max_pending Most sent packets kept waiting for a reply from the pi
+    """
+    self.window = window
+    self.max_pending = max_pending
+    self.delays = {} # stage -> deque of delays after capture, in seconds
+    self.pending = {} # seq -> (capture time, sent time) awaiting a reply
+    self.lock = threading.Lock() # replies are added from their own thread
+
+
+  def add(self, stage, delay):
+    """
+    @brief Adds a delay to a stage's window
+
+    @param stage The name of the stage, such as 'detect'
+    @param delay Time from the frame's capture to the stage, in seconds
+    """
+    if stage not in self.delays:
+      self.delays[stage] = deque(maxlen=self.window)
+    self.delays[stage].append(delay)
+
+
+  def add_frame(self, capture_time, detect_time=None, plan_time=None,
+    sent_time=None, seq=None):
+    """
+    @brief Adds every stamp of a frame
+
+    @param capture_time Capture time of the frame
+    @param detect_time Time detection finished, or None
+    @param plan_time Time planning finished, or None
+    @param sent_time Time the frame's packet was sent, or None if not sent
+    @param seq Sequence number of a sent packet, to match with the pi's
+      reply (see add_reply), or None if no reply will come
+    """
+    if capture_time is None:
+      return
+    with self.lock:
+      for stage, stamp in [('detect', detect_time), ('plan', plan_time),
+        ('sent', sent_time)]:
+        if stamp is not None:
+          self.add(stage, stamp - capture_time)
+
+      if seq is not None and sent_time is not None:
+        if len(self.pending) >= self.max_pending: # reply lost, forget oldest
+          del self.pending[min(self.pending)]
+        self.pending[seq] = (capture_time, sent_time)
+
+
+  def add_reply(self, seq, pi_time, reply_time=None):
+    """
+    @brief Adds the pi's reply to a packet
+
+    @param seq Sequence number of the packet
+    @param pi_time Time the pi took from receiving the packet to starting
+      the motor, in seconds
+    @param reply_time Time the reply arrived, or None for now
+    """
+    if reply_time is None:
+      reply_time = utils.get_time()
+    with self.lock:
+      if seq not in self.pending:
+        return
+      capture_time, sent_time = self.pending.pop(seq)
+
+      network_time = max(0.0, reply_time - sent_time - pi_time) / 2
+      received_time = sent_time + network_time
+      self.add('received', received_time - capture_time)
+      self.add('step', received_time + pi_time - capture_time)
+
+
+  def get_percentiles(self, stage):
+    """
+    @brief Gets the percentiles of a stage's delays
+
+    @param stage The name of the stage
+
+    @return (p50, p95, p99) in seconds, or None if the stage has no delays
+    """
+    delays = self.delays.get(stage)
+    if not delays:
+      return None
+    return tuple(np.percentile(delays, [50, 95, 99]))
+
+
+  def report(self):
+    """
+    @brief Gets a one-line report of every stage's percentiles
+    @return String of 'stage p50/p95/p99 ms' per stage
+    """
+    items = []
+    with self.lock:
+      for stage in STAGES + sorted(set(self.delays) - set(STAGES)):
+        percentiles = self.get_percentiles(stage)
+        if percentiles is not None:
+          items.append('%s %.1f/%.1f/%.1f' % ((stage,) +
+            tuple(1000.0 * p for p in percentiles)))
+    return 'latency p50/p95/p99 ms: ' + ', '.join(items)
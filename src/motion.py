@@ -0,0 +1,99 @@
+"""
+@file motion.py
+
+@brief Contains the MotionGate class, used to skip frames where nothing moved
+
+Between shots the table sits still for long stretches, and running detection
+and planning on every frame wastes CPU. The MotionGate compares a tiny
+grayscale copy of each frame against the last frame that was processed, and
+only lets the frame through if enough pixels have changed. Frames that are
+skipped can reuse the results of the last processed frame.
+
+Comparing against the last processed frame (rather than the previous frame)
+means slow changes, such as lighting drift, still pass the gate once they add
+up. A frame is also let through after a set number of skipped frames, so the
+results never get too old.
+
+Standard usage (pseudocode example)::
+
+gate = MotionGate()
+while True:
+  frame = get_video_frame()
+  if gate.check(frame):
+    results = process(frame)
+  # otherwise reuse results from the last processed frame
+"""
+import cv2
+
+from buffers import BufferPool # application-specific
+
+class MotionGate:
+  def __init__(self, size=(160,120), threshold=20, min_changed=0.0005,
+    refresh_frames=30):
+    """
+    @brief Initializes parameters
+
+    @param size (w, h) size the frame is downsampled to before comparing
+    @param threshold Grayscale difference (0-255) at which a pixel counts
+      as changed
+    @param min_changed Fraction of pixels that must change for the frame to
+      count as moving. With the default size, 0.0005 is about 10 pixels,
+      a third of the area of a 13 pixel radius puck in a 640x480 frame
+    @param refresh_frames A frame is let through after this many frames in a
+      row have been skipped
+    """
+    self.size = size
+    self.threshold = threshold
+    self.min_changed = max(1, int(min_changed * size[0] * size[1]))
+    self.refresh_frames = refresh_frames
+
+    self.buffers = BufferPool()
+    self.reference = None # downsampled gray of the last processed frame
+    self.skipped = 0 # frames skipped in a row
+    self.total_skipped = 0 # frames skipped since creation
+    self.changed = 0 # changed pixel count of the last checked frame
+
+
+  def check(self, frame):
+    """
+    @brief Determines if the frame has changed enough to be processed
+
+    @param frame The BGR frame to check
+
+    @return True if the frame should be processed, False if it can be skipped
+    """
+    w, h = self.size
+    small = cv2.resize(frame, self.size,
+      dst=self.buffers.get('small', (h, w) + frame.shape[2:]),
+      interpolation=cv2.INTER_AREA)
+    gray = small
+    if len(small.shape) > 2:
+      gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY,
+        dst=self.buffers.get('gray', (h, w)))
+
+    moving = True
+    if self.reference is not None and self.skipped < self.refresh_frames:
+      diff = cv2.absdiff(gray, self.reference,
+        dst=self.buffers.get('diff', (h, w)))
+      cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+      self.changed = cv2.countNonZero(diff)
+      moving = self.changed >= self.min_changed
+
+    if not moving:
+      self.skipped += 1
+      self.total_skipped += 1
+      return False
+
+    # processed frames become the new reference
+    self.reference = self.buffers.get('reference', (h, w))
+    self.reference[:] = gray
+    self.skipped = 0
+    return True
+
+
+  def reset(self):
+    """
+    @brief Forgets the reference frame, so the next frame is processed
+    """
+    self.reference = None
+    self.skipped = 0
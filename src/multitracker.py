@@ -0,0 +1,199 @@
+"""
+@file multitracker.py
+
+@brief Contains the MultiObjectTracker class, for tracking several objects
+
+Each object is followed by a Track with a stable id and its own
+TrajectoryPlanner, so points from different objects are never mixed in one
+planner. Every frame, the new detections are assigned to the existing tracks
+by greedy nearest-neighbour matching against where each track predicts its
+object to be: the closest (track, detection) pair is matched first, then the
+next closest among those left, and so on. Pairs further apart than the gate
+distance are never matched.
+
+Detections left unmatched start new tracks, and tracks left unmatched are
+counted as missed. A track is dropped after too many missed frames in a row.
+
+Standard usage (pseudocode example)::
+
+tracks = MultiObjectTracker(frames=4)
+while True:
+  frame = get_video_frame()
+  detections = frame.get_object_locations() # list of shapes.Circle
+  tracks.update(detections)
+  for track in tracks.get_tracks():
+    traj = track.planner.get_trajectory()
+"""
+import utils # application-specific
+from trajectory import TrajectoryPlanner
+
+class Track:
+  def __init__(self, track_id, point, frames=5, bounce=0, mode='fit',
+    drag=0.0):
+    """
+    @brief Starts a track at the given point
+
+    @param track_id The unique id of the track
+    @param point The Point or Circle the track starts at
+    @param frames The number of points the track's planner fits to
+    @param bounce The number of bounces the track's planner predicts
+    @param mode The mode of the track's planner, 'fit', 'param' or 'kalman'
+    @param drag The velocity decay rate of the track's planner, per second,
+      in 'kalman' mode
+    """
+    self.id = track_id
+    self.planner = TrajectoryPlanner(frames=frames, bounce=bounce, walls=[],
+      mode=mode, drag=drag)
+    self.point = None # most recent detection
+    self.hits = 0 # total number of detections
+    self.misses = 0 # frames missed in a row
+    self.add_point(point)
+
+
+  def add_point(self, point):
+    """
+    @brief Adds a detection to the track
+    @param point The Point or Circle matched to this track
+    """
+    point.track_id = self.id
+    self.point = point
+    self.planner.add_point(point)
+    self.hits += 1
+    self.misses = 0
+
+
+  def predict_point(self):
+    """
+    @brief Predicts where the object is in the current frame
+    @return A Point of the predicted location
+    """
+    return self.planner.predict_point(self.misses + 1)
+
+
+class MultiObjectTracker:
+  def __init__(self, frames=5, bounce=0, max_dist=80, max_misses=5,
+    min_hits=2, mode='fit', drag=0.0):
+    """
+    @brief Initializes parameters
+
+    @param frames The number of points each track's planner fits to
+    @param bounce The number of bounces each track's planner predicts
+    @param max_dist Gate distance in pixels. A detection further than this
+      from a track's predicted location cannot be matched to it
+    @param max_misses A track is dropped after this many missed frames
+    @param min_hits A track must have this many detections to be confirmed
+    @param mode The mode of each track's planner, 'fit', 'param' or 'kalman'
+      (see TrajectoryPlanner)
+    @param drag The velocity decay rate of each track's planner, per second,
+      in 'kalman' mode
+    """
+    self.frames = frames
+    self.bounce = bounce
+    self.mode = mode
+    self.drag = drag
+    self.max_dist = max_dist
+    self.max_misses = max_misses
+    self.min_hits = min_hits
+
+    self.tracks = []
+    self.next_id = 0
+
+    # Scene given to every track's planner
+    self.walls = []
+    self.robot_axis = None
+
+
+  def set_scene(self, walls, robot_axis):
+    """
+    @brief Sets the walls and robot axis used by every track's planner
+
+    @param walls A list of Line objects representing walls
+    @param robot_axis The Line representing the robot axis
+    """
+    self.walls = walls
+    self.robot_axis = robot_axis
+    for track in self.tracks:
+      track.planner.walls = walls
+      track.planner.robot_axis = robot_axis
+
+
+  def update(self, detections):
+    """
+    @brief Assigns a frame's detections to tracks
+
+    Each detection gets a track_id attribute with the id of its track.
+
+    @param detections List of Point or Circle objects detected this frame
+
+    @return List of the tracks matched or started this frame
+    """
+    # every (distance, track, detection) pair within the gate distance
+    max_dist_sq = self.max_dist * self.max_dist
+    pairs = []
+    for t, track in enumerate(self.tracks):
+      pred_pt = track.predict_point()
+      for d, det in enumerate(detections):
+        dist = utils.get_pt2pt_dist(pred_pt, det, squared=1)
+        if dist <= max_dist_sq:
+          pairs.append((dist, t, d))
+    pairs.sort()
+
+    # greedily match the closest pairs first
+    track_used = [False] * len(self.tracks)
+    det_used = [False] * len(detections)
+    updated = []
+    for dist, t, d in pairs:
+      if track_used[t] or det_used[d]:
+        continue
+      track_used[t] = True
+      det_used[d] = True
+      self.tracks[t].add_point(detections[d])
+      updated.append(self.tracks[t])
+
+    # missed tracks, dropped once missed too long
+    for t, track in enumerate(self.tracks):
+      if not track_used[t]:
+        track.misses += 1
+    self.tracks = [track for track in self.tracks
+      if track.misses <= self.max_misses]
+
+    # unmatched detections start new tracks
+    for d, det in enumerate(detections):
+      if not det_used[d]:
+        track = Track(self.next_id, det, self.frames, self.bounce, self.mode,
+          self.drag)
+        track.planner.walls = self.walls
+        track.planner.robot_axis = self.robot_axis
+        self.next_id += 1
+        self.tracks.append(track)
+        updated.append(track)
+
+    return updated
+
+
+  def get_tracks(self, confirmed=1):
+    """
+    @brief Gets the current tracks
+
+    @param confirmed Only return tracks with at least min_hits detections
+
+    @return List of Track objects
+    """
+    if not confirmed:
+      return list(self.tracks)
+    return [track for track in self.tracks if track.hits >= self.min_hits]
+
+
+  def get_track(self, point):
+    """
+    @brief Gets the track a detection was assigned to
+
+    @param point A detection passed to update
+
+    @return The Track, or None if the detection has no track
+    """
+    track_id = getattr(point, 'track_id', None)
+    for track in self.tracks:
+      if track.id == track_id:
+        return track
+    return None
@@ -0,0 +1,158 @@
+"""
+@file overlay.py
+
+@brief Contains the OverlayRenderer class, which annotates frames for display
+
+The rails, robot axis and robot markers only move when the scene does, so
+redrawing them every frame is wasted work. The OverlayRenderer draws them
+once into a cached static layer, along with a mask of the pixels drawn, and
+only redraws the layer when the scene changes (as given by the SceneCache
+version). Each frame, the static layer is copied onto the frame through the
+mask, and only the dynamic elements (objects, robot, closest point) are
+drawn.
+
+Rendering can be done on a worker thread, keeping only the latest frame, so
+annotation adds no time to the thread doing detection and sending commands.
+Frames given to the worker must not be reused until they are rendered.
+
+Standard usage (pseudocode example)::
+
+renderer = OverlayRenderer().start()
+while True:
+  data = process(get_video_frame())
+  renderer.submit(data)
+  frame = renderer.get() # latest rendered frame, or None
+  if frame is not None:
+    cv2.imshow(window_name, frame)
+renderer.stop()
+"""
+import cv2 # 3rd party packages
+import numpy as np
+
+import graphics as gfx # application-specific
+from buffers import BufferPool
+from pipeline import LatestQueue, Stage
+
+class OverlayRenderer:
+  def __init__(self, fps_timer=None):
+    """
+    @brief Initializes an empty static layer
+
+    @param fps_timer The FPS object to draw the frame rate of, or None
+    """
+    self.fps_timer = fps_timer
+    self.buffers = BufferPool()
+
+    # Static layer, with the scene version and frame shape it was drawn for
+    self.static = None
+    self.static_mask = None
+    self.static_where = None # mask > 0, shaped to broadcast over channels
+    self.static_version = None
+    self.static_shape = None
+    self.static_draws = 0 # number of times the static layer was drawn
+
+    self.stage = None # worker, if started
+
+
+  def start(self):
+    """
+    @brief Starts the worker thread, for submit and get
+    @return The renderer itself
+    """
+    self.stage = Stage('render', self.render, LatestQueue(1), LatestQueue(1))
+    self.stage.start()
+    return self
+
+
+  def submit(self, data):
+    """
+    @brief Queues a frame to be rendered by the worker thread
+
+    @param data The FrameData to render. Its frame is drawn on, and must not
+      be reused until rendered
+    """
+    self.stage.in_queue.put(data)
+
+
+  def get(self, timeout=0):
+    """
+    @brief Gets the latest frame rendered by the worker thread
+
+    @param timeout Seconds to wait for a frame, 0 to not wait
+
+    @return The annotated frame, or None if none was rendered since the last
+      call
+    """
+    return self.stage.out_queue.get(timeout)
+
+
+  def render(self, data):
+    """
+    @brief Annotates a frame with its results
+
+    @param data The FrameData to render. Its frame is drawn on
+
+    @return The annotated frame
+    """
+    frame = data.frame
+    self.update_static(data)
+    np.copyto(frame, self.static, where=self.static_where)
+
+    frame = gfx.draw_robot(frame, data.robot) # draw robot
+    frame = gfx.draw_circles(frame, data.object_list) # draw objects
+
+    # eventually won't need to print this one
+    frame = gfx.draw_line(img=frame, line=data.closest_line) # closest obj>axis
+
+    # draw full set of trajectories, including bounces
+    #frame = gfx.draw_lines(img=frame, line_list=data.traj_list)
+    #frame = gfx.draw_line(img=frame, line=data.traj) # for no bounces
+
+    frame = gfx.draw_point(img=frame, pt=data.closest_pt)
+
+    if self.fps_timer is not None:
+      self.fps_timer.display(frame)
+    return frame
+
+
+  def update_static(self, data):
+    """
+    @brief Redraws the static layer if the scene has changed
+
+    @param data The FrameData being rendered. Its scene_version is None if
+      the scene is not cached, in which case the layer is redrawn every frame
+    """
+    shape = data.frame.shape
+    if data.scene_version is not None and \
+      data.scene_version == self.static_version and \
+      shape == self.static_shape:
+      return
+
+    static = self.buffers.get('static', shape)
+    static[:] = 0
+    static = gfx.draw_lines(img=static, line_list=data.walls)
+    static = gfx.draw_robot_axis(img=static, line=data.robot_axis) # axis
+    static = gfx.draw_robot_markers(static, data.robot_markers) # markers
+
+    # every pixel drawn on, whatever its color
+    mask = self.buffers.get('static_mask', shape[:2])
+    cv2.transform(static, np.ones((1, 3)), dst=mask)
+    cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY, dst=mask)
+
+    self.static = static
+    self.static_mask = mask
+    self.static_where = (mask > 0)[:, :, None]
+    self.static_version = data.scene_version
+    self.static_shape = shape
+    self.static_draws += 1
+
+
+  def stop(self):
+    """
+    @brief Stops the worker thread, if started
+    """
+    if self.stage is None:
+      return
+    self.stage.stopped = True
+    self.stage.in_queue.close()
+    self.stage.thread.join(1.0)
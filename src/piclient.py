@@ -13,10 +13,19 @@ SM axis_pt1 axis_pt2 robot_pt
   axis_pt2 is a Point object representing the other edge of the robot axis
 
 Move Motor - sends command to move from robot point to target point
-MM robot_pt target_pt
+MM robot_pt target_pt [seq]
   MM = Move Motor
   robot_pt is a Point object representing the robot's position
   target_pt is a Point object representing the target position to move to
+  seq is optional, the sequence number of the frame the packet was made from.
+    If given, the client replies once the motor has started, for latency
+    measurement (see latency.py)
+
+Acknowledge - sent back to the computer in reply to an MM packet with seq
+AK seq pi_ms
+  AK = Acknowledge
+  seq is the sequence number from the MM packet
+  pi_ms is the time in ms from receiving the packet to starting the motor
 
 Kill Motor - stops motor movement
 KM
@@ -63,6 +72,7 @@ def main():
     try:   
       # Receive data
       data = sock.recv(1024)
+      recv_t = time.time() # for latency replies
       data_list = data.split() # splits by ' ' by default
 
       # Checks to ensure setup has been done or not - this is accounted for
@@ -117,7 +127,7 @@ def main():
         #motorcontroller.stop()
 
       # check for motor movement command
-      if data_list[0] == 'MM' and len(data_list) is 3: # MM packet
+      if data_list[0] == 'MM' and len(data_list) in (3, 4): # MM packet
         # Parse data packet and send to motorcontroller
         print data
         robot_pt_list = data_list[1].split(',')
@@ -128,6 +138,12 @@ def main():
         target_pt = shapes.Point(int(float(target_pt_list[0])),
           int(float(target_pt_list[1])))
 
+        # reply with the time taken to start the motor, if asked for
+        if len(data_list) is 4:
+          step_t = time.time()
+          sock.sendall('AK %s %.2f\n' % (data_list[3],
+            1000.0 * (step_t - recv_t)))
+
         # send motorcontroller command UNCOMMENT THIS
         # motorcontroller.move_to_loc(robot_coord=robot,
           # target_coord=target, style=SINGLE)
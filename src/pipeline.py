@@ -0,0 +1,277 @@
+"""
+@file pipeline.py
+
+@brief Contains the Pipeline class, which runs processing stages in parallel
+
+Running capture, detection, planning and sending one after another makes the
+frame period the sum of every stage. The Pipeline runs each stage on its own
+thread instead, connected by small queues, so a new frame can be captured
+while the last one is detected and the one before it is planned. Throughput
+is then set by the slowest stage rather than the sum.
+
+The queues between stages are bounded, and use latest-frame-wins
+backpressure: when a stage falls behind and its input queue is full, the
+oldest waiting item is dropped to make room for the newest. Stages never
+work on stale frames, and drops are counted per queue. For replaying video
+as fast as possible, where every frame should be processed, the queues can
+block instead, so faster stages wait for slower ones.
+
+OpenCV releases the GIL while it works, so image processing stages do run in
+parallel on multiple cores.
+
+Standard usage (pseudocode example)::
+
+pipeline = Pipeline()
+pipeline.add_source('capture', read_frame) # called repeatedly
+pipeline.add_stage('detect', detect)       # called on each item
+pipeline.add_stage('plan', plan)
+pipeline.start()
+while True:
+  item = pipeline.get() # output of the last stage
+  display(item)
+  print pipeline.report()
+pipeline.stop()
+"""
+import time # built-in packages
+import threading
+from collections import deque
+
+class LatestQueue:
+  def __init__(self, maxsize=1, drop=1):
+    """
+    @brief Initializes an empty queue
+
+    @param maxsize The most items the queue holds
+    @param drop If true, putting an item when full drops the oldest one.
+      Otherwise put waits until there is room
+    """
+    self.maxsize = maxsize
+    self.drop = drop
+    self.items = deque()
+    self.cond = threading.Condition()
+    self.dropped = 0 # number of items dropped to make room
+    self.closed = False
+
+
+  def put(self, item):
+    """
+    @brief Adds an item, dropping the oldest (or waiting) if the queue is full
+    @param item The item to add
+    """
+    with self.cond:
+      while not self.drop and len(self.items) >= self.maxsize and \
+        not self.closed:
+        self.cond.wait(0.1)
+      if len(self.items) >= self.maxsize:
+        self.items.popleft()
+        self.dropped += 1
+      self.items.append(item)
+      self.cond.notify()
+
+
+  def get(self, timeout=None):
+    """
+    @brief Removes and returns the oldest item, waiting for one if empty
+
+    @param timeout Seconds to wait for an item, or None to wait forever
+
+    @return The item, or None if the wait timed out or the queue was closed
+    """
+    with self.cond:
+      end_time = None
+      if timeout is not None:
+        end_time = time.time() + timeout
+      while not self.items and not self.closed:
+        remaining = None
+        if end_time is not None:
+          remaining = end_time - time.time()
+          if remaining <= 0:
+            return None
+        self.cond.wait(remaining)
+      if not self.items:
+        return None
+      item = self.items.popleft()
+      self.cond.notify() # wake a put waiting for room
+      return item
+
+
+  def depth(self):
+    """
+    @brief Gets the number of items waiting in the queue
+    @return The queue depth
+    """
+    return len(self.items)
+
+
+  def close(self):
+    """
+    @brief Wakes up any waiting get, which then returns None
+    """
+    with self.cond:
+      self.closed = True
+      self.cond.notify_all()
+
+
+class Stage:
+  def __init__(self, name, func, in_queue, out_queue):
+    """
+    @brief Initializes a stage, which is started by the Pipeline
+
+    @param name The name of the stage, used in reports
+    @param func The function to run. Source stages (no in_queue) call it with
+      no arguments, others with each item from in_queue. Results that are
+      not None are put on out_queue
+    @param in_queue The LatestQueue to take items from, or None for a source
+    @param out_queue The LatestQueue to put results on
+    """
+    self.name = name
+    self.func = func
+    self.in_queue = in_queue
+    self.out_queue = out_queue
+
+    self.stopped = False
+    self.thread = None
+
+    # Statistics
+    self.count = 0 # number of items processed
+    self.busy_time = 0.0 # total seconds spent in func
+
+
+  def start(self):
+    """
+    @brief Starts the stage's thread
+    """
+    self.thread = threading.Thread(target=self.run, name=self.name)
+    self.thread.daemon = True
+    self.thread.start()
+
+
+  def run(self):
+    """
+    @brief Runs the stage until stopped
+    """
+    while not self.stopped:
+      if self.in_queue is None:
+        item = None
+      else:
+        item = self.in_queue.get(timeout=0.1)
+        if item is None: # timed out or closed, check if stopped
+          continue
+
+      start_time = time.time()
+      if self.in_queue is None:
+        result = self.func()
+      else:
+        result = self.func(item)
+      self.busy_time += time.time() - start_time
+      self.count += 1
+
+      if result is not None:
+        self.out_queue.put(result)
+
+
+class Pipeline:
+  def __init__(self, queue_size=1, drop=1):
+    """
+    @brief Initializes an empty pipeline
+
+    @param queue_size Default size of the queue after each stage
+    @param drop If true, full queues drop their oldest item. Otherwise stages
+      wait for room, and every item is processed
+    """
+    self.queue_size = queue_size
+    self.drop = drop
+    self.stages = []
+    self.queues = [] # queues[i] is the output queue of stages[i]
+
+
+  def add_source(self, name, func, queue_size=None):
+    """
+    @brief Adds the first stage, which produces items
+
+    @param name The name of the stage
+    @param func Function called repeatedly with no arguments. It should block
+      until an item is ready, and return None if there is none
+    @param queue_size Size of the stage's output queue
+    """
+    self.add_stage(name, func, queue_size, source=1)
+
+
+  def add_stage(self, name, func, queue_size=None, source=0):
+    """
+    @brief Adds a stage, taking its input from the last stage added
+
+    @param name The name of the stage
+    @param func Function called with each item from the last stage. Its
+      result is passed on to the next stage, unless it is None
+    @param queue_size Size of the stage's output queue
+    @param source If true, the stage takes no input (see add_source)
+    """
+    if queue_size is None:
+      queue_size = self.queue_size
+    in_queue = None
+    if not source:
+      in_queue = self.queues[-1]
+    out_queue = LatestQueue(queue_size, self.drop)
+    self.stages.append(Stage(name, func, in_queue, out_queue))
+    self.queues.append(out_queue)
+
+
+  def start(self):
+    """
+    @brief Starts every stage
+    @return The pipeline itself
+    """
+    for stage in self.stages:
+      stage.start()
+    return self
+
+
+  def get(self, timeout=None):
+    """
+    @brief Gets the next output of the last stage
+
+    @param timeout Seconds to wait for an item, or None to wait forever
+
+    @return The item, or None if the wait timed out
+    """
+    return self.queues[-1].get(timeout)
+
+
+  def stop(self):
+    """
+    @brief Stops every stage and waits for their threads to end
+    """
+    for stage in self.stages:
+      stage.stopped = True
+    for queue in self.queues:
+      queue.close()
+    for stage in self.stages:
+      if stage.thread is not None:
+        stage.thread.join(1.0)
+
+
+  def get_stats(self):
+    """
+    @brief Gets statistics for every stage
+
+    @return List of (name, count, avg_ms, depth, dropped) tuples, one per
+      stage. depth and dropped are of the stage's output queue
+    """
+    stats = []
+    for stage, queue in zip(self.stages, self.queues):
+      avg_ms = 0.0
+      if stage.count > 0:
+        avg_ms = 1000.0 * stage.busy_time / stage.count
+      stats.append((stage.name, stage.count, avg_ms, queue.depth(),
+        queue.dropped))
+    return stats
+
+
+  def report(self):
+    """
+    @brief Gets a one-line report of every stage
+    @return String of 'name: N frames, X ms, depth D, dropped K' per stage
+    """
+    return ' | '.join('%s: %d frames, %.1f ms, depth %d, dropped %d' % stat
+      for stat in self.get_stats())
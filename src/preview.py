@@ -0,0 +1,162 @@
+"""
+@file preview.py
+
+@brief Contains the PreviewPublisher class, which sends low-rate previews
+
+In headless mode nothing is drawn or displayed, which saves several
+milliseconds per frame. To still be able to see what the tracker is doing,
+a PreviewPublisher sends a small annotated copy of every Nth frame to
+another machine (or a file). The frame is downsampled in the caller's
+thread, and JPEG encoding and sending are done on a worker thread, keeping
+only the latest preview, so previews never hold up the control path.
+
+Previews are sent as one JPEG per UDP datagram, and can be viewed with
+show_previews.
+
+Standard usage (pseudocode example)::
+
+preview = PreviewPublisher(address=('169.254.171.11', 10001), every=10)
+while True:
+  results = process(get_video_frame())
+  if preview.due():
+    preview.publish(annotate(results))
+preview.stop()
+
+# on the viewing machine
+show_previews(port=10001)
+"""
+import os # built-in packages
+import socket
+
+import cv2 # 3rd party packages
+import numpy as np
+
+from pipeline import LatestQueue, Stage # application-specific
+
+MAX_DATAGRAM = 65507 # largest UDP payload
+
+
+class PreviewPublisher:
+  def __init__(self, address=None, path=None, every=10, scale=0.25,
+    quality=70):
+    """
+    @brief Initializes parameters and starts the worker thread
+
+    @param address (host, port) to send previews to over UDP, or None
+    @param path File to write the latest preview to, or None. The file is
+      replaced whole, so readers never see a partly written image
+    @param every A preview is sent every this many frames
+    @param scale The preview is downsampled by this much (0-1)
+    @param quality JPEG quality (0-100)
+    """
+    self.address = address
+    self.path = path
+    self.every = every
+    self.scale = scale
+    self.quality = quality
+
+    self.sock = None
+    if address is not None:
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    self.frame_count = 0
+    self.sent = 0 # number of previews sent
+
+    # only the latest preview waits to be sent
+    self.stage = Stage('preview', self.send, LatestQueue(1), LatestQueue(1))
+    self.stage.start()
+
+
+  def due(self):
+    """
+    @brief Counts a frame, and determines if it should be previewed
+
+    Call once per frame, so frames that are not previewed are not annotated.
+
+    @return True if a preview should be published for this frame
+    """
+    self.frame_count += 1
+    return self.frame_count % self.every is 0
+
+
+  def publish(self, frame):
+    """
+    @brief Downsamples the frame and queues it to be sent
+
+    @param frame The annotated frame. It is not changed, and can be reused as
+      soon as this returns
+    """
+    small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale,
+      interpolation=cv2.INTER_AREA)
+    self.stage.in_queue.put(small)
+
+
+  def send(self, small):
+    """
+    @brief Encodes and sends a preview, run on the worker thread
+
+    @param small The downsampled frame
+
+    @return None, nothing is passed on
+    """
+    ret, jpeg = cv2.imencode('.jpg', small,
+      [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+    if not ret:
+      return None
+    data = jpeg.tostring()
+
+    if self.sock is not None:
+      if len(data) > MAX_DATAGRAM:
+        print 'Preview too large to send, lower the scale or quality'
+      else:
+        try:
+          self.sock.sendto(data, self.address)
+        except IOError:
+          pass # don't send anything
+
+    if self.path is not None:
+      tmp_path = self.path + '.tmp'
+      with open(tmp_path, 'wb') as f:
+        f.write(data)
+      os.rename(tmp_path, self.path)
+
+    self.sent += 1
+    return None
+
+
+  def stop(self):
+    """
+    @brief Stops the worker thread
+    """
+    self.stage.stopped = True
+    self.stage.in_queue.close()
+    self.stage.thread.join(1.0)
+    if self.sock is not None:
+      self.sock.close()
+
+
+def show_previews(port=10001, window_name='Robot Goalie Preview'):
+  """
+  @brief Receives and displays previews sent by a PreviewPublisher
+
+  Quit by pressing q.
+
+  @param port The UDP port to receive previews on
+  @param window_name The name of the display window
+  """
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  sock.bind(('', port))
+  sock.settimeout(0.1)
+  cv2.namedWindow(window_name)
+  while True:
+    try:
+      data = sock.recv(MAX_DATAGRAM)
+      frame = cv2.imdecode(np.fromstring(data, np.uint8), cv2.IMREAD_COLOR)
+      if frame is not None:
+        cv2.imshow(window_name, frame)
+    except socket.timeout:
+      pass
+    if cv2.waitKey(1) & 0xFF == ord('q'):
+      break
+  sock.close()
+  cv2.destroyAllWindows()
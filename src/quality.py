@@ -0,0 +1,138 @@
+"""
+@file quality.py
+
+@brief Contains the QualityController class, which holds a frame time budget
+
+The time to process a frame depends on the processing resolution, the blur
+window and the number of morphology passes. The QualityController watches
+the measured processing time against a budget, and steps through a list of
+quality levels: when the average time over a window of frames is over
+budget, it drops to the next lower quality level, and when there is enough
+headroom for long enough, it goes back up a level.
+
+Each level is a (pyramid_scale, blur_window, morph_iterations) tuple, from
+highest quality to lowest. pyramid_scale sets the processing resolution
+(see BallTracker.setup_frame), while circles are still refined on the full
+frame.
+
+Standard usage (pseudocode example)::
+
+quality = QualityController(budget=0.025, level=get_level(pyramid_scale))
+while True:
+  settings = quality.get_settings()
+  start_time = utils.get_time()
+  process(get_video_frame(), settings)
+  quality.update(utils.get_time() - start_time)
+  print quality.report()
+"""
+
+# (pyramid_scale, blur_window, morph_iterations), highest quality first
+LEVELS = [
+  (1, 15, 2),
+  (2, 15, 2),
+  (2, 11, 2),
+  (2, 11, 1),
+  (4, 11, 1),
+  (4, 7, 1),
+]
+
+def get_level(pyramid_scale, levels=LEVELS):
+  """
+  @brief Gets the highest quality level at a pyramid scale
+
+  Used to start a QualityController at the resolution the tracker was set
+  up for, rather than at full resolution.
+
+  @param pyramid_scale The pyramid scale to start at
+  @param levels List of levels, highest quality first
+
+  @return Index of the first level with at least the given pyramid scale, or
+    of the last level if there is none
+  """
+  for i, level in enumerate(levels):
+    if level[0] >= pyramid_scale:
+      return i
+  return len(levels) - 1
+
+
+class QualityController:
+  def __init__(self, budget=0.025, levels=LEVELS, level=0, window=10,
+    headroom=0.6, hold_frames=60):
+    """
+    @brief Initializes parameters
+
+    @param budget Target processing time per frame, in seconds
+    @param levels List of (pyramid_scale, blur_window, morph_iterations)
+      tuples, highest quality first
+    @param level Index of the level to start at
+    @param window Number of frames the processing time is averaged over
+      before each decision
+    @param headroom Quality is raised when the average time is under this
+      fraction of the budget
+    @param hold_frames Quality is only raised after this many frames at the
+      current level, so it does not flip back and forth
+    """
+    self.budget = budget
+    self.levels = levels
+    self.level = level
+    self.window = window
+    self.headroom = headroom
+    self.hold_frames = hold_frames
+
+    self.total_time = 0.0 # processing time summed over the current window
+    self.count = 0 # frames in the current window
+    self.level_frames = 0 # frames since the level last changed
+    self.avg_time = 0.0 # average processing time of the last window
+    self.changes = 0 # number of level changes
+
+
+  def get_settings(self):
+    """
+    @brief Gets the settings of the current level
+    @return Dict of pyramid_scale, blur_window and morph_iterations
+    """
+    pyramid_scale, blur_window, morph_iterations = self.levels[self.level]
+    return {'pyramid_scale': pyramid_scale, 'blur_window': blur_window,
+      'morph_iterations': morph_iterations}
+
+
+  def update(self, frame_time):
+    """
+    @brief Adds the processing time of a frame, and changes level if needed
+
+    @param frame_time Time taken to process the frame, in seconds
+
+    @return True if the level changed
+    """
+    self.total_time += frame_time
+    self.count += 1
+    self.level_frames += 1
+    if self.count < self.window:
+      return False
+
+    self.avg_time = self.total_time / self.count
+    self.total_time = 0.0
+    self.count = 0
+
+    old_level = self.level
+    if self.avg_time > self.budget:
+      self.level = min(self.level + 1, len(self.levels) - 1)
+    elif self.avg_time < self.budget * self.headroom and \
+      self.level_frames >= self.hold_frames:
+      self.level = max(self.level - 1, 0)
+
+    if self.level == old_level:
+      return False
+    self.level_frames = 0
+    self.changes += 1
+    return True
+
+
+  def report(self):
+    """
+    @brief Gets a one-line report of the current level and settings
+    @return The report string
+    """
+    return 'quality: level %d, %.1f ms of %.1f ms budget, %s' % (self.level,
+      1000.0 * self.avg_time, 1000.0 * self.budget,
+      ', '.join('%s %d' % item for item in sorted(self.get_settings().items())))
@@ -0,0 +1,152 @@
+"""
+@file scene.py
+
+@brief Contains the SceneCache class, which caches fixed scene elements
+
+The robot axis markers and rail markers do not move during a match, so they
+do not need to be detected every frame. The SceneCache watches the detected
+markers, and once they have been found in the same place for a number of
+frames (the warm-up), locks them in along with the Line objects built from
+them. While locked, the markers only need to be detected every few frames to
+check they have not moved. If a check fails, the cache unlocks and the scene
+is detected every frame until it is stable again.
+
+The same Line objects are returned every frame while locked, so anything
+derived from them (such as by TrajectoryPlanner) can be reused as well. The
+version number changes whenever the returned elements change.
+
+Standard usage (pseudocode example)::
+
+scene = SceneCache(warmup_frames=10, check_interval=30)
+while True:
+  if scene.due():
+    markers, walls, axis = scene.update(*detect_scene(frame))
+  else:
+    markers, walls, axis = scene.skip()
+"""
+import itertools # built-in packages
+
+import shapes # application-specific
+import utils
+
+class SceneCache:
+  def __init__(self, warmup_frames=10, check_interval=30, tolerance=5):
+    """
+    @brief Initializes parameters
+
+    @param warmup_frames Number of consecutive frames the scene must be
+      detected in the same place before it is locked
+    @param check_interval Once locked, the scene is detected every this many
+      frames to check it has not moved
+    @param tolerance Distance in pixels a marker can move and still be
+      considered in the same place
+    """
+    self.warmup_frames = warmup_frames
+    self.check_interval = check_interval
+    self.tolerance = tolerance
+
+    self.locked = False
+    self.stable_count = 0 # consecutive matching detections while unlocked
+    self.frame_count = 0 # frames since the last detection while locked
+    self.version = 0 # incremented whenever the returned elements change
+
+    # Scene elements. While unlocked, these are the latest detections
+    self.robot_markers = [] # 2-elem list of Circles
+    self.walls = [] # 2-elem list of Lines for the rails
+    self.robot_axis = None # Line between the robot markers
+
+
+  def due(self):
+    """
+    @brief Determines if the scene should be detected this frame
+    @return True if unlocked, or if locked and a check is due
+    """
+    return not self.locked or self.frame_count >= self.check_interval - 1
+
+
+  def skip(self):
+    """
+    @brief Uses the cached scene for a frame where detection was skipped
+
+    @return robot_markers The cached robot markers
+    @return walls The cached rail Lines
+    @return robot_axis The cached robot axis Line
+    """
+    self.frame_count += 1
+    return self.robot_markers, self.walls, self.robot_axis
+
+
+  def update(self, robot_markers, walls, robot_axis):
+    """
+    @brief Updates the cache with newly detected scene elements
+
+    While unlocked, the detections are returned as-is, and the scene locks once
+    the full scene has matched for warmup_frames frames. While locked, the
+    cached elements are returned if the detections still match them. If not,
+    the cache unlocks and the detections are returned.
+
+    @param robot_markers 2-elem list of Circles for the robot markers
+    @param walls 2-elem list of Lines for the rails
+    @param robot_axis Line between the robot markers
+
+    @return robot_markers The robot markers to use this frame
+    @return walls The rail Lines to use this frame
+    @return robot_axis The robot axis Line to use this frame
+    """
+    self.frame_count = 0
+    matches = self.matches(robot_markers, walls)
+
+    if self.locked:
+      if matches:
+        return self.robot_markers, self.walls, self.robot_axis
+      print 'Scene moved, unlocking scene cache'
+      self.locked = False
+      self.stable_count = 0
+
+    # scene must be complete to count towards locking
+    if len(robot_markers) is not 2 or len(walls) is not 2:
+      self.stable_count = 0
+    elif matches:
+      self.stable_count += 1
+    else:
+      self.stable_count = 1
+
+    self.robot_markers = robot_markers
+    self.walls = walls
+    self.robot_axis = robot_axis
+    self.version += 1
+
+    if self.stable_count >= self.warmup_frames:
+      self.locked = True
+    return self.robot_markers, self.walls, self.robot_axis
+
+
+  def matches(self, robot_markers, walls):
+    """
+    @brief Determines if detected elements are in the same place as the cache
+
+    Elements can be detected in any order, so every one-to-one assignment of
+    detected points to cached points is tried. There are at most 4 points, so
+    at most 24 assignments.
+
+    @param robot_markers 2-elem list of Circles for the robot markers
+    @param walls 2-elem list of Lines for the rails
+
+    @return True if every element is within tolerance of the cached one
+    """
+    if len(robot_markers) is not len(self.robot_markers) or \
+      len(walls) is not len(self.walls):
+      return False
+
+    # rails are compared by their first endpoints, the rail markers
+    cached_pts = self.robot_markers + \
+      [shapes.Point(ln.x1, ln.y1) for ln in self.walls]
+    new_pts = robot_markers + [shapes.Point(ln.x1, ln.y1) for ln in walls]
+
+    tol_sq = self.tolerance * self.tolerance
+    for order in itertools.permutations(new_pts):
+      if all(utils.get_pt2pt_dist(pt, new_pt, squared=1) <= tol_sq
+        for pt, new_pt in zip(cached_pts, order)):
+        return True
+    return False
+
@@ -0,0 +1,239 @@
+"""
+@file segmentation.py
+
+@brief Contains the LabelSegmenter class for single-pass color segmentation
+
+Rather than thresholding the frame with cv2.inRange once per color, every
+pixel is classified once into a label image. Each color is given one bit of
+the label, so a pixel of the label image holds the set of colors it matches
+(0 is background). The mask for any one color is pulled from the label image
+with a single table lookup.
+
+The HSV bounds in colors.py are boxes, so a pixel is within range k if its
+H, S and V values are each within the bounds of range k. Each channel is
+mapped through a 256-entry lookup table of bitsets, bit k being set if that
+channel value lies within range k. ANDing the three channel bitsets gives
+the set of ranges a pixel falls in, and a final lookup table maps that set of
+ranges to the set of colors they belong to. A byte holds 8 ranges, so up to
+4 two-range colors are supported.
+
+Colors with overlapping ranges (such as Red and Magenta) are kept apart, as a
+pixel can carry more than one color bit. The masks are the same as those from
+cv2.inRange, except that unused second ranges ((0,0,0) to (0,0,0)) are ignored
+rather than matching black pixels.
+
+The HSV conversion can be skipped entirely by compiling the colors into a
+table indexed by quantized BGR values (see compile_bgr). Each BGR pixel is
+quantized to a few bits per channel, and the label of the bin is the label of
+its center color. The table is built once and cached on disk, so classifying
+a frame becomes a single table lookup straight from the camera frame. Pixels
+near the edge of a color range may be classified differently than in HSV, as
+the whole bin takes the label of its center.
+"""
+import os # built-in packages
+import hashlib
+
+import numpy as np # 3rd party packages
+import cv2
+
+from buffers import get_buffer # application-specific
+
+MAX_RANGES = 8 # number of range bits available in a uint8 bitset
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.robogoalie')
+
+class LabelSegmenter:
+  def __init__(self, color_list, bgr_bits=None, cache_dir=CACHE_DIR):
+    """
+    @brief Compiles the given colors into channel and label lookup tables
+
+    @param color_list List of colors (from colors.py) to classify. Duplicates
+      and None entries are skipped
+    @param bgr_bits If given, also compile a BGR table with this many bits per
+      channel (1 to 8), so frames can be classified without HSV conversion
+    @param cache_dir Directory the BGR table is cached in
+    """
+    self.colors = []
+    self.labels = {} # color -> label bit in the label image
+
+    # lower and upper bounds of each range, and the label it belongs to
+    ranges = []
+    for color in color_list:
+      if color is None or color in self.labels:
+        continue
+      self.labels[color] = 1 << len(self.colors)
+      self.colors.append(color)
+
+      ranges.append((color.lower0, color.upper0, self.labels[color]))
+      if tuple(color.lower1) != (0,0,0) or tuple(color.upper1) != (0,0,0):
+        ranges.append((color.lower1, color.upper1, self.labels[color]))
+
+    if len(ranges) > MAX_RANGES:
+      print 'Too many colors for fused segmentation (max %d HSV ranges)' % \
+        MAX_RANGES
+      exit()
+
+    # Channel lookup tables. bit k of chan_lut[v, 0, c] is set if value v of
+    # channel c is within range k
+    self.chan_lut = np.zeros((256, 1, 3), dtype=np.uint8)
+    values = np.arange(256)
+    for k, (lower, upper, label) in enumerate(ranges):
+      for c in range(3):
+        in_range = (values >= lower[c]) & (values <= upper[c])
+        self.chan_lut[in_range, 0, c] |= (1 << k)
+
+    # Label lookup table, maps a set of ranges to the set of their colors
+    self.label_lut = np.zeros((256, 1), dtype=np.uint8)
+    for bits in range(1, 256):
+      for k, (lower, upper, label) in enumerate(ranges):
+        if bits & (1 << k):
+          self.label_lut[bits] |= label
+
+    # Mask lookup tables, map a label to 255 if it has the color's bit
+    self.mask_luts = {}
+    for color, label in self.labels.items():
+      self.mask_luts[color] = np.where(
+        np.arange(256) & label, 255, 0).astype(np.uint8)
+
+    # BGR table, compiled on request
+    self.ranges = ranges
+    self.bgr_bits = None
+    self.bgr_table = None
+    self.index_luts = None
+    if bgr_bits is not None:
+      self.compile_bgr(bgr_bits, cache_dir)
+
+
+  def __contains__(self, color):
+    return color in self.labels
+
+
+  def classify(self, img_hsv, buffers=None, name='labels'):
+    """
+    @brief Classifies every pixel of the HSV image into a label image
+
+    @param img_hsv The HSV image to classify
+    @param buffers Optional BufferPool to write the label image (and
+      intermediate images) into, rather than allocating them
+    @param name Name of the label image in the pool
+
+    @return The label image. Each pixel holds the bits of its colors, or 0
+    """
+    shape = img_hsv.shape[:2]
+    bits = cv2.LUT(img_hsv, self.chan_lut,
+      get_buffer(buffers, (name, 'bits'), img_hsv.shape))
+
+    # AND the channel bitsets together into the H channel
+    h, s, v = [cv2.extractChannel(bits, c,
+      get_buffer(buffers, (name, c), shape)) for c in range(3)]
+    cv2.bitwise_and(h, s, h)
+    cv2.bitwise_and(h, v, h)
+    return cv2.LUT(h, self.label_lut, get_buffer(buffers, name, shape))
+
+
+  def compile_bgr(self, bits=5, cache_dir=CACHE_DIR):
+    """
+    @brief Compiles the colors into a quantized BGR to label table
+
+    Every BGR bin center is converted to HSV and classified, giving a table of
+    2^(3*bits) labels. The table is loaded from cache_dir if it was already
+    built for the same colors and bits, and saved there otherwise.
+
+    Per-channel lookup tables are also built, mapping a channel value to its
+    bin shifted into place, so the table index of a pixel is the sum of its
+    three channel lookups.
+
+    @param bits The number of bits per channel to keep (1 to 8)
+    @param cache_dir Directory to cache the table in, or None to not cache
+    """
+    shift = 8 - bits
+    size = 1 << (3 * bits)
+
+    # table is keyed by everything that affects its contents
+    key = repr([bits] + [(tuple(lower), tuple(upper), label)
+      for (lower, upper, label) in self.ranges])
+    path = None
+    if cache_dir is not None:
+      name = 'bgr_labels_' + hashlib.md5(key).hexdigest() + '.npy'
+      path = os.path.join(cache_dir, name)
+
+    table = None
+    if path is not None and os.path.exists(path):
+      table = np.load(path)
+      if table.shape != (size,):
+        table = None # stale or corrupt cache, rebuild
+
+    if table is None:
+      # bin centers of every quantized color, as a (size x 1) BGR image
+      index = np.arange(size)
+      bin_mask = (1 << bits) - 1
+      center = (1 << shift) >> 1
+      bgr = np.empty((size, 1, 3), dtype=np.uint8)
+      bgr[:, 0, 0] = (((index >> (2 * bits)) & bin_mask) << shift) + center
+      bgr[:, 0, 1] = (((index >> bits) & bin_mask) << shift) + center
+      bgr[:, 0, 2] = ((index & bin_mask) << shift) + center
+
+      table = self.classify(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)).ravel()
+      if path is not None:
+        try:
+          if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+          np.save(path, table)
+        except (IOError, OSError):
+          print 'Could not cache BGR label table in ' + cache_dir
+
+    # uint16 indices are enough for up to 5 bits, and are faster to add
+    index_type = np.uint16 if 3 * bits <= 16 else np.int32
+    values = np.arange(256) >> shift
+    self.index_luts = [
+      (values << (2 * bits)).astype(index_type).reshape(256, 1),
+      (values << bits).astype(index_type).reshape(256, 1),
+      values.astype(index_type).reshape(256, 1)]
+    self.bgr_table = table
+    self.bgr_bits = bits
+
+
+  def classify_bgr(self, img_bgr, buffers=None, name='labels'):
+    """
+    @brief Classifies every pixel of a BGR image with the BGR table
+
+    Requires compile_bgr to have been run.
+
+    @param img_bgr The BGR image to classify
+    @param buffers Optional BufferPool to write the label image (and
+      intermediate images) into, rather than allocating them
+    @param name Name of the label image in the pool
+
+    @return The label image, the same as classify gives for the HSV image
+    """
+    shape = img_bgr.shape[:2]
+    index_type = self.index_luts[0].dtype
+
+    # table index is the sum of the shifted channel bins
+    index = None
+    for c in range(3):
+      chan = cv2.extractChannel(img_bgr, c,
+        get_buffer(buffers, (name, c), shape))
+      chan_index = cv2.LUT(chan, self.index_luts[c],
+        get_buffer(buffers, (name, 'index', c), shape, index_type))
+      if index is None:
+        index = chan_index
+      else:
+        cv2.add(index, chan_index, index)
+
+    labels = get_buffer(buffers, name, shape)
+    if labels is None:
+      return np.take(self.bgr_table, index)
+    return np.take(self.bgr_table, index, out=labels)
+
+
+  def mask(self, labels, color, dst=None):
+    """
+    @brief Gets the binary mask of a single color from a label image
+
+    @param labels The label image from classify
+    @param color The color to get the mask of
+    @param dst Optional uint8 buffer to write the mask into
+
+    @return A mask that is 255 where the pixel has the color's bit, else 0
+    """
+    return cv2.LUT(labels, self.mask_luts[color], dst)
@@ -7,6 +7,7 @@ Currently contains classes for:
   Point
   Circle
   Line
+  Intercept
 
 @author Neil Jassal
 """
@@ -16,16 +17,20 @@ import colors
 
 
 class Point:    
-  def __init__(self, x=0, y=0, color=colors.Red):
+  def __init__(self, x=0, y=0, color=colors.Red, timestamp=None, seq=None):
     """
     @brief Sets up initial parameters
 
     @param x The x-coordinate of the point
     @param y The y-coordinate of the point
+    @param timestamp Capture time in seconds of the frame the point is from
+    @param seq Sequence number of the frame the point is from
     """
     self.x = x
     self.y = y
     self.color = color
+    self.timestamp = timestamp
+    self.seq = seq
 
   def to_string(self):
     """
@@ -35,7 +40,8 @@ class Point:
     return str(self.x) + ',' + str(self.y)
 
 class Circle:
-  def __init__(self, x=0, y=0, radius=0, centroid=(0,0), color=colors.Green):
+  def __init__(self, x=0, y=0, radius=0, centroid=(0,0), color=colors.Green,
+    timestamp=None, seq=None):
     """
     @brief Sets up initial parameters
 
@@ -47,6 +53,10 @@ class Circle:
     @param center A tuple of (x,y) coordinates of the centroid. Comes from 
       calcuation of centroid using moments.
     @param color The display color for the circle
+    @param timestamp Capture time in seconds of the frame the circle is from
+    @param seq Sequence number of the frame the circle is from
+
+    Coordinates are floats, as detection gives sub-pixel positions.
     """
     self.x = x
     self.y = y
@@ -54,21 +64,25 @@ class Circle:
     self.radius = radius
     self.centroid = centroid
     self.color = color
+    self.timestamp = timestamp
+    self.seq = seq
+    self.track_id = None # id of the multitracker Track it belongs to
 
   def to_pt_string(self):
     """
     @brief Gets string of the x,y coords of the circle
-    @return String of 'X,Y' format - same as Point to_string() format
+    @return String of 'X,Y' format - same as Point to_string() format.
+      Coordinates are rounded to whole pixels
     """
-    return str(self.x) + ',' + str(self.y)
+    return str(int(round(self.x))) + ',' + str(int(round(self.y)))
     
   def to_string(self):
     """
     @brief Gets string of the form X,Y,radius
     @return String of form 'X,Y,R', X and Y being coordinates of the center
-      and R being the radius
+      and R being the radius, all rounded to whole pixels
     """
-    return str(self.x) + ',' + str(self.y) + ',' + str(self.radius)
+    return self.to_pt_string() + ',' + str(int(round(self.radius)))
 
 
 class Line:
@@ -113,4 +127,34 @@ class Line:
       self.length = math.sqrt(math.pow(x1-x2,2) + math.pow(y1-y2, 2))
 
 
+class Intercept:
+  def __init__(self, x=0, y=0, time=0.0, timestamp=None, time_std=0.0,
+    pos_std=0.0, color=colors.Yellow):
+    """
+    @brief Sets up initial parameters
+
+    @param x The x-coordinate where the object is predicted to arrive
+    @param y The y-coordinate where the object is predicted to arrive
+    @param time Time from the latest sample until the object arrives, in
+      seconds (or frames, if the samples had no timestamps)
+    @param timestamp Time the object arrives, on the same clock as the
+      samples (utils.get_time), or None if the samples had no timestamps
+    @param time_std Standard deviation of the arrival time
+    @param pos_std Standard deviation of the arrival position across the
+      trajectory, in pixels
+    @param color The display color for the intercept
+    """
+    self.x = x
+    self.y = y
+    self.time = time
+    self.timestamp = timestamp
+    self.time_std = time_std
+    self.pos_std = pos_std
+    self.color = color
 
+  def to_pt_string(self):
+    """
+    @brief Gets string of the x,y coords of the intercept
+    @return String of 'X,Y' format, rounded to whole pixels
+    """
+    return str(int(round(self.x))) + ',' + str(int(round(self.y)))
@@ -11,6 +11,8 @@ denoted as a set of two circles with an axis between them.
 """
 
 import heapq # built-in packages
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 import numpy as np # 3rd party packages
 import cv2 as cv2
@@ -19,6 +21,9 @@ from IPython import embed
 import colors # application-specific
 import shapes 
 import utils
+from segmentation import LabelSegmenter
+from scene import SceneCache
+from buffers import BufferPool
 
 class BallTracker:
   """ 
@@ -56,6 +61,15 @@ class BallTracker:
     track_colors=[colors.Blue], 
     radius=10, 
     num_objects = 1,
+    fused=0,
+    lut_bits=None,
+    roi_tracking=0,
+    roi_miss_limit=5,
+    robot_travel=20,
+    scene_cache=0,
+    pyramid_scale=1,
+    blob_engine='contours',
+    workers=0,
     debug=0):
     """
     @brief inits default tracking parameters
@@ -67,6 +81,25 @@ class BallTracker:
     @param track_colors List of colors (from colors.py) to be tracked. 
     @param radius The min radius circle to be detected
     @param num_objects The number of objects to detect.
+    @param fused Classify each frame once into a label image shared by all
+      colors, instead of thresholding the frame once per color
+    @param lut_bits If given, classify frames straight from BGR with a lookup
+      table quantized to this many bits per channel (5 or 6 work well). This
+      implies fused, and skips the HSV conversion in setup_frame
+    @param roi_tracking Search for objects only in a window around their
+      predicted location (see track_objects)
+    @param roi_miss_limit Number of frames the object can be missed in the
+      window before searching the full frame again
+    @param robot_travel Most pixels the robot moves between frames. In ROI
+      tracking, this sizes the window the robot is searched for in
+    @param scene_cache Lock in the robot markers and rails once stable, and
+      only detect them every few frames after (see find_scene)
+    @param pyramid_scale Detect circles on a frame downscaled by this factor
+      (such as 2 or 4), then refine each one on the full frame. 1 disables
+    @param blob_engine How blobs are extracted from each color mask, either
+      'contours' (findContours) or 'components' (connectedComponentsWithStats)
+    @param workers Number of threads to find the colors of find_all on in
+      parallel. 0 finds them one after another, None uses one per CPU core
     @param debug enable debug mode
     """
     
@@ -86,11 +119,59 @@ class BallTracker:
     self.track_colors = track_colors
 
     self.radius = radius
+    self.morph_iterations = 2 # erode and dilate passes to reduce mask noise
+
+    # Preallocated frame and mask buffers, reused every frame
+    self.buffers = BufferPool()
+
+    # Fused segmentation, one label image shared by every color
+    self.segmenter = None
+    if fused or lut_bits is not None:
+      self.segmenter = LabelSegmenter(self.track_colors + [self.robot_color,
+        self.robot_marker_color, self.rail_color], bgr_bits=lut_bits)
+    self.labels = None # label image of the current frame, made on first use
+
+    # Predictive region of interest tracking
+    self.roi_tracking = roi_tracking
+    self.roi_miss_limit = roi_miss_limit
+    self.roi_misses = 0 # consecutive frames the object was not in the window
+    self.roi = None # (x, y, w, h) of the last search window, None if full
+    self.roi_locked = False # object last found in the window, not full frame
+    self.robot_travel = robot_travel
+    self.robot_pos = None # last robot Circle found, centers its window
+    self.robot_misses = 0 # consecutive frames the robot was not in its window
+    self.robot_roi = None # (x, y, w, h) of the last robot window
+
+    # Cache of the fixed robot markers and rails
+    self.scene = None
+    if scene_cache:
+      self.scene = SceneCache()
+
+    # Coarse-to-fine detection. The full frame is kept for refinement
+    self.pyramid_scale = pyramid_scale
+    self.frame_scale = 1 # pyramid scale of the current frame
+    self.frame = None # full resolution frame from setup_frame
+    self.blur_window = 11 # full resolution blur window, used for refinement
+
+    # Capture time and sequence number of the current frame
+    self.frame_time = None
+    self.frame_seq = None
+
+    self.blob_engine = blob_engine
+
+    # Parallel color passes, results found ahead by prefetch
+    self.pool = None
+    if workers is None:
+      workers = cpu_count()
+    if workers > 0:
+      self.pool = ThreadPool(workers)
+    self.prefetched = {} # (color, num_objects, roi) -> circles, this frame
 
     self.debug = debug
 
 
-  def setup_frame(self, frame, w=None, h=None, scale=0.5, blur_window=11):
+  def setup_frame(self, frame, w=None, h=None, scale=0.5, blur_window=11,
+    pyramid_scale=None, timestamp=None, seq=None):
     """
     @brief Rescales and blurs frame for clarity and faster operations
 
@@ -99,30 +180,172 @@ class BallTracker:
     @param h Value in pixels for scaled height width
     @param scale The frame will be scaled multiplicatively by this much (0-1)
     @param blur_window The window size used for the median blur
+    @param pyramid_scale Overrides the tracker's pyramid_scale if given
+    @param timestamp Capture time of the frame in seconds, from the video
+      source. Circles detected in the frame carry it
+    @param seq Sequence number of the frame, from the video source
 
     The scale parameter is only used if w or h are not supplied. If w and h
     are supplied, the frame will be resized to the specific size wxh
 
+    In pyramid mode, the blurred (and HSV) image is downscaled by the pyramid
+    scale, and the blur window is scaled down to match. find_circles takes
+    care of the scaling, and still gives circles in full frame coordinates.
+
+    The returned images are written into the tracker's buffers, and are
+    overwritten by the next call. The frame is not resized (or copied) if it
+    is already the requested size. The HSV image is only read by detection,
+    so it does not need to be copied before use.
+
     @return The updated frame
-    @return The updated frame blurred and in hsv
+    @return The updated frame blurred and in hsv. In lookup table mode the
+      HSV conversion is skipped, and the blurred BGR frame is returned instead
     """ 
-    if w is not None and h is not None: # use specified (w,h)
-      frame = cv2.resize(frame, (w,h), cv2.INTER_NEAREST)
-    else: # use default/specified scale
-      # scale argument is a tuple, not two separate arguments (w, h)
+    frame = self.scale_frame(frame, w, h, scale)
+    h, w = frame.shape[:2]
+
+    if pyramid_scale is None:
+      pyramid_scale = self.pyramid_scale
+    self.frame_scale = pyramid_scale
+    self.frame = frame
+    self.blur_window = blur_window
+    self.frame_time = timestamp
+    self.frame_seq = seq
+
+    small = frame
+    if pyramid_scale > 1:
+      # area interpolation averages over each block, so nothing is skipped
+      small = cv2.resize(frame, (w / pyramid_scale, h / pyramid_scale),
+        dst=self.buffers.get('small', (h / pyramid_scale, w / pyramid_scale) +
+          frame.shape[2:]),
+        interpolation=cv2.INTER_AREA)
+      blur_window = max(1, blur_window / pyramid_scale) | 1 # must be odd
+
+    blur = cv2.GaussianBlur(small, (blur_window,blur_window), 0,
+      dst=self.buffers.get('blur', small.shape)) # -0 frames
+    self.labels = None # new frame, label image must be recomputed
+    self.prefetched = {}
+    if self.use_lut():
+      return frame, blur
+    img_hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV,
+      dst=self.buffers.get('hsv', small.shape))
+    return frame, img_hsv
+
+
+  def scale_frame(self, frame, w=None, h=None, scale=0.5):
+    """
+    @brief Rescales the frame, as the first step of setup_frame
+
+    Used on its own when a frame only needs to be displayed, not processed.
+
+    @param frame The frame to be scaled
+    @param w Value in pixels for scaled frame width
+    @param h Value in pixels for scaled height width
+    @param scale The frame will be scaled multiplicatively by this much (0-1)
+
+    @return The scaled frame, in the tracker's frame buffer. The frame itself
+      is returned if it is already the requested size
+    """
+    if w is None or h is None: # use default/specified scale
       h_scaled,w_scaled = tuple(scale * np.asarray(frame.shape[:2]))
-      frame = cv2.resize(frame, (int(w_scaled), int(h_scaled)), 
-        cv2.INTER_NEAREST)
+      w, h = int(w_scaled), int(h_scaled)
+
+    if frame.shape[:2] != (h, w):
+      # size argument is a tuple, not two separate arguments (w, h)
+      frame = cv2.resize(frame, (w,h),
+        dst=self.buffers.get('frame', (h, w) + frame.shape[2:]),
+        interpolation=cv2.INTER_NEAREST)
     #cv2.flip(src=frame,dst=frame, flipCode=1) # flip over y for visual clarity
+    return frame
+
+
+  def use_lut(self):
+    """
+    @brief Whether frames are classified straight from BGR by lookup table
+    @return True if in lookup table mode
+    """
+    return self.segmenter is not None and self.segmenter.bgr_table is not None
 
-    blur = cv2.GaussianBlur(frame, (blur_window,blur_window), 0) # -0 frames
-    img_hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
-    return frame, img_hsv
+
+  def get_mask(self, img_hsv, color, roi=None):
+    """
+    @brief Gets the binary mask of pixels in the frame matching a color
+
+    In fused mode the mask is pulled from the label image of the frame, which
+    is classified on first use and shared by every color until the next call
+    to setup_frame. Otherwise the frame is thresholded against both HSV ranges
+    of the color.
+
+    @param img_hsv The frame in HSV (or BGR in lookup table mode), as returned
+      by setup_frame
+    @param color The color (from colors.py) to get the mask of
+    @param roi Optional (x, y, w, h) window to get the mask of. Only the
+      window is segmented, unless the full label image is already made
+
+    @return The binary mask, 255 where the pixel matches the color. The mask
+      is a buffer that is overwritten the next time the color is masked
+    """
+    if roi is not None:
+      x, y, w, h = roi
+      img_hsv = img_hsv[y:y+h, x:x+w]
+    shape = img_hsv.shape[:2]
+    mask = self.buffers.get(('mask', color), shape)
+
+    if self.segmenter is not None and color in self.segmenter:
+      if self.labels is not None:
+        labels = self.labels
+        if roi is not None:
+          labels = labels[y:y+h, x:x+w]
+      elif roi is None:
+        # only full-frame label images are kept for other colors to use
+        labels = self.classify(img_hsv, 'labels')
+        self.labels = labels
+      else:
+        labels = self.classify(img_hsv, ('roi_labels', color))
+      return self.segmenter.mask(labels, color, mask)
+
+    # color was not compiled into the lookup table, fall back to HSV
+    if self.use_lut():
+      img_hsv = cv2.cvtColor(img_hsv, cv2.COLOR_BGR2HSV,
+        dst=self.buffers.get(('hsv', color), img_hsv.shape))
+
+    return self.in_range(img_hsv, color, mask)
+
+
+  def classify(self, img_hsv, name):
+    """
+    @brief Classifies an image into a label image with the segmenter
+
+    @param img_hsv The image in HSV (or BGR in lookup table mode)
+    @param name Name of the label image buffer
+
+    @return The label image
+    """
+    if self.use_lut():
+      return self.segmenter.classify_bgr(img_hsv, self.buffers, name)
+    return self.segmenter.classify(img_hsv, self.buffers, name)
+
+
+  def in_range(self, img_hsv, color, mask):
+    """
+    @brief Thresholds an HSV image against both HSV ranges of a color
+
+    @param img_hsv The HSV image to threshold
+    @param color The color (from colors.py) to threshold against
+    @param mask The buffer to write the mask into
+
+    @return The binary mask, 255 where the pixel is within either range
+    """
+    # Mask with range of HSV values, uses both color bounds and combines.
+    range1 = self.buffers.get(('range1', color), mask.shape)
+    cv2.inRange(img_hsv, color.lower0, color.upper0, mask)
+    cv2.inRange(img_hsv, color.lower1, color.upper1, range1)
+    return cv2.bitwise_or(mask, range1, mask)
 
 
   ################ OBJECT DETECTION FUNCTIONS ######################
   def find_circles(self, img_hsv, colors, 
-    num_objects):
+    num_objects, roi=None):
     """
     @brief Finds circle(s) in the frame based on input params, displays 
     on-screen
@@ -130,11 +353,19 @@ class BallTracker:
     Detects circles of the given minimum radius, displays a circle around them 
     and the centroid of each.
 
+    In pyramid mode, circles are found on the downscaled frame, and each is
+    then refined on a small patch of the full frame (see refine_circle). The
+    refined circles have sub-pixel coordinates.
+
     @param img_hsv The frame in HSV to detect circles in
     @param colors The list of colors to be tracked
     @param num_objects The number of objects to detect
+    @param roi Optional (x, y, w, h) window to search in. Circles are still
+      given in full frame coordinates
 
-    @return circle_list List of detected circles (x,y,radius,center)
+    @return circle_list List of detected circles (x,y,radius,center). The
+      circles have float coordinates, and carry the timestamp and sequence
+      number of the frame given to setup_frame
     """
     circle_list = []
 
@@ -142,48 +373,382 @@ class BallTracker:
     if colors == []:
       return circle_list
 
+    roi = self.detection_roi(roi)
     for color in colors:
-      # Mask with range of HSV values, uses both color bounds and combines.
-      # Erode and dilate to reduce noise
-      mask = cv2.bitwise_or(
-        cv2.inRange(img_hsv, color.lower0, color.upper0),
-        cv2.inRange(img_hsv, color.lower1, color.upper1))
-      mask = cv2.erode(mask, None, iterations=2)
-      mask = cv2.dilate(mask, None, iterations=2)
-
-      # destructive, so copy mask if needed later
-      cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE)[-2]
-
-      # only proceed if at least one contour found
-      if len(cnts) > 0:
-        # find largest N contours in mask, then use it to compute min enclosing
-        # circle and centroid
-        contours = heapq.nlargest(num_objects, cnts, 
-          key=cv2.contourArea)
-        for c in contours:
-          ((x,y), radius) = cv2.minEnclosingCircle(c)
-          # only proceed if radius meets certain size
-          if radius > self.radius:
-            M = cv2.moments(c)
-            # if divide by 0 will occur, skip circle
-            if int(M["m00"]) is not 0:
-              centroid = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-              circle = shapes.Circle(x=int(x), y=int(y), 
-                radius=int(radius), centroid=centroid)
-              circle_list.append(circle)
+      circle_list += self.find_color_circles(img_hsv, color, num_objects,
+        roi)
 
     # get the n largest circles, n being num_objects
     circle_list = heapq.nlargest(num_objects, circle_list,
       key=lambda s: s.radius)
+    for circle in circle_list:
+      circle.timestamp = self.frame_time
+      circle.seq = self.frame_seq
+
+    return circle_list
+
+
+  def detection_roi(self, roi):
+    """
+    @brief Converts a window in the full frame to the detection image
+
+    @param roi (x, y, w, h) window in the full frame, or None
+
+    @return The window in the (possibly downscaled) detection image, grown to
+      cover the full frame window, or None
+    """
+    scale = self.frame_scale
+    if roi is None or scale <= 1:
+      return roi
+    x, y, w, h = roi
+    x1, y1 = x / scale, y / scale
+    x2, y2 = -(-(x + w) / scale), -(-(y + h) / scale) # round up
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+  def find_color_circles(self, img_hsv, color, num_objects, roi=None):
+    """
+    @brief Finds the circles of a single color, the color pass of find_circles
+
+    Only buffers named for the color are written, so passes for different
+    colors can run in parallel (see prefetch). Circles already found by
+    prefetch are returned without searching again.
+
+    @param img_hsv The frame in HSV to detect circles in
+    @param color The color to find
+    @param num_objects The number of blobs to find
+    @param roi Optional (x, y, w, h) window in the detection image
+
+    @return List of detected circles, not yet sorted or timestamped
+    """
+    key = (color, num_objects, roi)
+    if key in self.prefetched:
+      return self.prefetched.pop(key)
+
+    scale = self.frame_scale
+    circle_list = []
+
+    # Erode and dilate to reduce noise
+    mask = self.get_mask(img_hsv, color, roi)
+    eroded = self.buffers.get(('eroded', color), mask.shape)
+    cv2.erode(mask, None, dst=eroded, iterations=self.morph_iterations)
+    cv2.dilate(eroded, None, dst=mask, iterations=self.morph_iterations)
+
+    # offset blobs from the window back into detection image coordinates
+    offset = (0, 0)
+    if roi is not None:
+      offset = (roi[0], roi[1])
+
+    if self.blob_engine == 'components':
+      blobs = self.find_blobs_components(mask, num_objects, offset, color)
+    else:
+      blobs = self.find_blobs_contours(mask, num_objects, offset)
+
+    for (x, y, radius, centroid) in blobs:
+      if scale > 1: # refine on full frame, skip if lost
+        circle = self.refine_circle(color, (x + 0.5) * scale - 0.5,
+          (y + 0.5) * scale - 0.5, radius * scale)
+        if circle is not None and circle.radius > self.radius:
+          circle_list.append(circle)
+        continue
+
+      # only proceed if radius meets certain size
+      if radius > self.radius and centroid is not None:
+        circle = shapes.Circle(x=x, y=y, radius=radius, centroid=centroid)
+        circle_list.append(circle)
 
     return circle_list
 
 
+  def prefetch(self, img_hsv, requests):
+    """
+    @brief Finds the circles of several colors in parallel, ahead of time
+
+    Each color pass is run on the thread pool, and its circles are kept until
+    find_circles asks for the same color, number of objects and window this
+    frame. The full frame label image is classified first, so the passes
+    share it instead of racing to make it. OpenCV releases the GIL while it
+    works, so the passes run on separate cores. Does nothing unless the
+    tracker has workers.
+
+    @param img_hsv The frame in HSV, as returned by setup_frame
+    @param requests List of (color, num_objects, roi) tuples, as would be
+      given to find_circles. roi is in full frame coordinates, or None
+    """
+    if self.pool is None:
+      return
+    keys = [(color, num_objects, self.detection_roi(roi))
+      for (color, num_objects, roi) in requests if color is not None]
+
+    if self.segmenter is not None and self.labels is None:
+      for (color, num_objects, roi) in keys:
+        if roi is None and color in self.segmenter:
+          self.labels = self.classify(img_hsv, 'labels')
+          break
+
+    results = self.pool.map(
+      lambda key: self.find_color_circles(img_hsv, *key), keys)
+    self.prefetched = dict(zip(keys, results))
+
+
+  def find_blobs_contours(self, mask, num_objects, offset):
+    """
+    @brief Finds the largest blobs in a mask using contours
+
+    @param mask The binary mask to find blobs in
+    @param num_objects The number of blobs to return
+    @param offset (x, y) offset added to blob coordinates
+
+    @return List of up to num_objects (x, y, radius, centroid) tuples, from
+      the minimum enclosing circle and moments of each contour, largest area
+      first. centroid is None if the contour has no area
+    """
+    # destructive, so copy mask if needed later
+    cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+      cv2.CHAIN_APPROX_SIMPLE, offset=offset)[-2]
+
+    # find largest N contours in mask, then use it to compute min enclosing
+    # circle and centroid
+    blobs = []
+    for c in heapq.nlargest(num_objects, cnts, key=cv2.contourArea):
+      ((x,y), radius) = cv2.minEnclosingCircle(c)
+      M = cv2.moments(c)
+      centroid = None
+      # if divide by 0 will occur, no centroid
+      if int(M["m00"]) is not 0:
+        centroid = (M["m10"] / M["m00"], M["m01"] / M["m00"])
+      blobs.append((x, y, radius, centroid))
+    return blobs
+
+
+  def find_blobs_components(self, mask, num_objects, offset, color):
+    """
+    @brief Finds the largest blobs in a mask using connected components
+
+    connectedComponentsWithStats gives the area, bounding box and centroid of
+    every blob as arrays in one call, so blobs are ranked without a Python
+    loop over contours. The circle of a blob is centered on its bounding box,
+    with a radius of half the larger side, matching the minimum enclosing
+    circle of a round blob.
+
+    @param mask The binary mask to find blobs in
+    @param num_objects The number of blobs to return
+    @param offset (x, y) offset added to blob coordinates
+    @param color The color of the mask, used to name its label buffer
+
+    @return List of up to num_objects (x, y, radius, centroid) tuples,
+      largest area first
+    """
+    labels = self.buffers.get(('components', color), mask.shape, np.int32)
+    num, labels, stats, centroids = cv2.connectedComponentsWithStats(mask,
+      labels, connectivity=8)
+    if num < 2: # only background
+      return []
+
+    # label 0 is the background
+    stats = stats[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    order = np.argsort(-areas, kind='mergesort')[:num_objects]
+
+    # circles from the bounding boxes of the largest blobs
+    stats = stats[order]
+    sizes = stats[:, [cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]] - 1.0
+    centers = stats[:, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP]] + sizes / 2 + offset
+    radii = np.max(sizes, axis=1) / 2
+    centroids = centroids[1:][order] + offset
+
+    return [(c[0], c[1], r, (m[0], m[1]))
+      for c, r, m in zip(centers.tolist(), radii.tolist(), centroids.tolist())]
+
+
+  def refine_circle(self, color, x, y, radius):
+    """
+    @brief Refines a circle found on the downscaled frame using the full frame
+
+    A patch of the full resolution frame around the circle is blurred,
+    thresholded and searched for the contour containing the circle center.
+    The circle is then rebuilt from that contour, centered on its centroid.
+
+    @param color The color (from colors.py) of the circle
+    @param x The x coordinate of the circle center in the full frame
+    @param y The y coordinate of the circle center in the full frame
+    @param radius The radius of the circle in the full frame
+
+    @return The refined Circle, with sub-pixel float coordinates, or None if
+      no contour was found in the patch
+    """
+    # patch covering the circle, plus room for its blur and coarse error
+    frame_h, frame_w = self.frame.shape[:2]
+    half = int(radius * 1.5 + self.frame_scale + self.blur_window)
+    x1 = int(utils.clamp(x - half, 0, frame_w))
+    y1 = int(utils.clamp(y - half, 0, frame_h))
+    x2 = int(utils.clamp(x + half + 1, 0, frame_w))
+    y2 = int(utils.clamp(y + half + 1, 0, frame_h))
+    if x2 - x1 < 1 or y2 - y1 < 1:
+      return None
+
+    patch = self.frame[y1:y2, x1:x2]
+    shape = patch.shape[:2]
+    blur = cv2.GaussianBlur(patch, (self.blur_window, self.blur_window), 0,
+      dst=self.buffers.get(('patch_blur', color), patch.shape))
+
+    mask = self.buffers.get(('patch_mask', color), shape)
+    name = ('patch_labels', color)
+    if self.use_lut():
+      labels = self.segmenter.classify_bgr(blur, self.buffers, name)
+      self.segmenter.mask(labels, color, mask)
+    else:
+      img_hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV,
+        dst=self.buffers.get(('patch_hsv', color), patch.shape))
+      if self.segmenter is not None and color in self.segmenter:
+        labels = self.segmenter.classify(img_hsv, self.buffers, name)
+        self.segmenter.mask(labels, color, mask)
+      else:
+        self.in_range(img_hsv, color, mask)
+
+    eroded = self.buffers.get(('patch_eroded', color), shape)
+    cv2.erode(mask, None, dst=eroded, iterations=self.morph_iterations)
+    cv2.dilate(eroded, None, dst=mask, iterations=self.morph_iterations)
+    cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+      cv2.CHAIN_APPROX_SIMPLE, offset=(x1, y1))[-2]
+    if len(cnts) < 1:
+      return None
+
+    # use the contour containing the coarse center, or the largest if none do
+    contour = None
+    for c in cnts:
+      if cv2.pointPolygonTest(c, (x, y), False) >= 0:
+        contour = c
+        break
+    if contour is None:
+      contour = max(cnts, key=cv2.contourArea)
+
+    M = cv2.moments(contour)
+    if M["m00"] <= 0:
+      return None
+    centroid = (M["m10"] / M["m00"], M["m01"] / M["m00"])
+    ((cx, cy), radius) = cv2.minEnclosingCircle(contour)
+    return shapes.Circle(x=centroid[0], y=centroid[1], radius=radius,
+      centroid=centroid)
+
+
+  def track_objects(self, img_hsv, planner):
+    """
+    @brief Finds the tracked objects, searching near their predicted location
+
+    If roi_tracking is enabled and the planner has a recent point, only a
+    window around the location predicted by the planner is searched. The
+    window is sized by the object radius and its speed, and grows with each
+    frame the object is missed. After roi_miss_limit missed frames, or if
+    more than one object is tracked, the full frame is searched instead.
+
+    The planner may mix points from before and after a full frame search, so
+    the first window after one is centered on the last point, ignoring speed.
+
+    @param img_hsv The frame in HSV, as returned by setup_frame
+    @param planner The TrajectoryPlanner fed with the tracked object
+
+    @return circle_list List of detected circles, as from find_circles
+    """
+    self.roi = self.get_search_roi(planner)
+    circle_list = self.find_circles(img_hsv, self.track_colors,
+      self.num_objects, self.roi)
+
+    if len(circle_list) > 0:
+      # velocity is only trusted once the object is found in a window
+      self.roi_locked = self.roi is not None
+      self.roi_misses = 0
+    elif self.roi is not None:
+      self.roi_misses += 1
+    return circle_list
+
+
+  def get_search_roi(self, planner):
+    """
+    @brief Gets the window track_objects will search this frame
+
+    @param planner The TrajectoryPlanner fed with the tracked object
+
+    @return (x, y, w, h) of the window, or None to search the full frame
+    """
+    if self.roi_tracking and self.num_objects is 1 and \
+      self.roi_misses < self.roi_miss_limit:
+      return self.get_roi(self.frame.shape, planner)
+    return None
+
+
+  def get_roi(self, shape, planner):
+    """
+    @brief Gets the search window around the predicted object location
+
+    @param shape The shape of the frame, to clamp the window to
+    @param planner The TrajectoryPlanner fed with the tracked object
+
+    @return (x, y, w, h) of the window, or None if no prediction can be made
+    """
+    if planner.index is None:
+      return None
+
+    # predict past the frames that have been missed so far
+    frames = self.roi_misses + 1
+    curr_pt = planner.pt_list[planner.curr_index]
+    pred_pt = curr_pt
+    if self.roi_locked:
+      pred_pt = planner.predict_point(frames)
+    travel = utils.get_pt2pt_dist(curr_pt, pred_pt)
+
+    # room for the object itself, plus error in the predicted motion
+    radius = max(getattr(curr_pt, 'radius', 0), self.radius)
+    half = int(2 * radius * frames + travel / frames * (frames + 1))
+    return self.get_window(shape, pred_pt, half)
+
+
+  def get_robot_roi(self):
+    """
+    @brief Gets the window find_robot will search this frame
+
+    The robot moves at a bounded speed, so the window is centered on where it
+    was last found, with room for it to move robot_travel pixels per frame
+    since. After roi_miss_limit missed frames, the full frame is searched.
+
+    @return (x, y, w, h) of the window, or None to search the full frame
+    """
+    if not self.roi_tracking or self.robot_pos is None or \
+      self.robot_misses >= self.roi_miss_limit:
+      return None
+    frames = self.robot_misses + 1
+    radius = max(self.robot_pos.radius, self.radius)
+    half = int(2 * radius + self.robot_travel * frames)
+    return self.get_window(self.frame.shape, self.robot_pos, half)
+
+
+  def get_window(self, shape, center, half):
+    """
+    @brief Gets a square window around a point, clamped to the frame
+
+    @param shape The shape of the frame
+    @param center The Point the window is centered on
+    @param half Half the width of the window, in pixels
+
+    @return (x, y, w, h) of the window, or None if it is off the frame
+    """
+    frame_h, frame_w = shape[:2]
+    x1 = int(utils.clamp(center.x - half, 0, frame_w))
+    y1 = int(utils.clamp(center.y - half, 0, frame_h))
+    x2 = int(utils.clamp(center.x + half, 0, frame_w))
+    y2 = int(utils.clamp(center.y + half, 0, frame_h))
+    if x2 - x1 < 1 or y2 - y1 < 1: # predicted off the frame
+      return None
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
   def find_robot(self, img_hsv):
     """
     @brief Finds the circle representing the robot itself
 
+    If roi_tracking is enabled, only a window around where the robot was last
+    found is searched (see get_robot_roi).
+
     @param img_hsv The HSV image to find the robot in
 
     @return A single circle object representing the robot position
@@ -191,11 +756,16 @@ class BallTracker:
     if self.robot_color is None:
       return []
 
+    self.robot_roi = self.get_robot_roi()
     robot_pos = self.find_circles(img_hsv, colors=[self.robot_color], 
-      num_objects=1)
+      num_objects=1, roi=self.robot_roi)
 
     if len(robot_pos) < 1:
+      if self.robot_roi is not None:
+        self.robot_misses += 1
       return None
+    self.robot_pos = robot_pos[0]
+    self.robot_misses = 0
     robot_pos[0].color = colors.Magenta # display robot circle as cyan
     return robot_pos[0]   
 
@@ -235,11 +805,71 @@ class BallTracker:
     @return robot The Circle object representing the robot
     @return robot_axis 2-elem list of Circle objects for the robot axis markers
     """
-    robot = self.find_robot(img_hsv.copy())
-    robot_axis = self.find_robot_markers(img_hsv.copy())
+    robot = self.find_robot(img_hsv)
+    robot_axis = self.find_robot_markers(img_hsv)
     return robot, robot_axis
 
 
+  def find_scene(self, img_hsv, color=colors.Red):
+    """
+    @brief Finds the fixed parts of the scene: robot markers, rails and axis
+
+    Wrapper for find_robot_markers and get_rails. If the scene cache is
+    enabled, detection is skipped on frames where the cache is locked and no
+    check is due, and the cached Line objects are reused.
+
+    @param img_hsv The HSV image to find the scene in
+    @param color The line color of the rails
+
+    @return robot_markers 2-elem list of Circle objects for the axis markers
+    @return walls 2-elem list of Line objects for the rails
+    @return robot_axis Line object between the robot markers
+    """
+    if self.scene is not None and not self.scene.due():
+      return self.scene.skip()
+
+    robot_markers = self.find_robot_markers(img_hsv)
+    walls = self.get_rails(img_hsv, robot_markers, color)
+    robot_axis = utils.line_between_circles(robot_markers)
+
+    if self.scene is None:
+      return robot_markers, walls, robot_axis
+    return self.scene.update(robot_markers, walls, robot_axis)
+
+
+  def find_all(self, img_hsv, planner, color=colors.Red):
+    """
+    @brief Finds the tracked objects, the robot and the scene
+
+    Wrapper for track_objects, find_robot and find_scene. If the tracker has
+    workers, the color passes they need are found in parallel first (see
+    prefetch).
+
+    @param img_hsv The frame in HSV, as returned by setup_frame
+    @param planner The TrajectoryPlanner fed with the tracked object
+    @param color The line color of the rails
+
+    @return object_list List of detected circles, as from track_objects
+    @return robot The Circle object representing the robot
+    @return robot_markers 2-elem list of Circle objects for the axis markers
+    @return walls 2-elem list of Line objects for the rails
+    @return robot_axis Line object between the robot markers
+    """
+    if self.pool is not None:
+      roi = self.get_search_roi(planner)
+      requests = [(c, self.num_objects, roi) for c in self.track_colors]
+      requests.append((self.robot_color, 1, self.get_robot_roi()))
+      if self.scene is None or self.scene.due():
+        requests.append((self.robot_marker_color, 2, None))
+        requests.append((self.rail_color, 2, None))
+      self.prefetch(img_hsv, requests)
+
+    object_list = self.track_objects(img_hsv, planner)
+    robot = self.find_robot(img_hsv)
+    robot_markers, walls, robot_axis = self.find_scene(img_hsv, color)
+    return object_list, robot, robot_markers, walls, robot_axis
+
+
   def get_rails(self, img_hsv, robot_markers, color=colors.Red):
     """
     @brief Gets the 2 lines representing the rails of the system
@@ -4,8 +4,10 @@
 @brief Contains trajectory class used to predict object trajectories
 
 Uses Points locations from n-previous frames to approximate a line of the 
-current object trajectory. Trajectory estimation is using numpy.polyfit with 
-a dimension of 1. Trajectories are created in the direction of the robot_axis
+current object trajectory. The best fit line is a least squares fit, solved
+in closed form from running sums of x, y, xy and x^2 that are updated as each
+point replaces the oldest one, so fitting costs the same however many frames
+are used. Trajectories are created in the direction of the robot_axis
 
 For multiple bounces, trajectory estimation will produce a list of Line objects
 representing each 'bounce.' The last element of this list is the line of the
@@ -14,6 +16,23 @@ final predicted trajectory (after n bounces)
 Note that a larger number of frames means a slower reaction - prediction will
 not occur until n frames have been added to the list.
 
+With timestamped points, get_intercepts also estimates when the object
+reaches each bounce point and the robot axis, from its speed along the
+trajectory, with the uncertainty of the estimate.
+
+Fitting y = m*x + b is poorly conditioned for objects moving mostly along y,
+which are straight shots at the robot. In 'param' mode, the planner instead
+fits x(t) and y(t) against the points' timestamps, both in one vectorized
+least squares solve, which works the same in any direction. The trajectory
+is the line from the fitted position at the latest sample along the fitted
+velocity.
+
+In 'kalman' mode, the planner instead follows the object with a KalmanFilter
+(see kalman.py), updated with each timestamped point. The trajectory is the
+line from the filtered position along the filtered velocity, available from
+the second point added. Points without timestamps are taken to be FRAME_TIME
+apart when tuning the filter's noise.
+
 If an object is stationary, noise in the video or location feed may cause
 noisy points to be added, resulting in incorrect and/or highly skewed best fit
 lines.
@@ -44,9 +63,21 @@ from IPython import embed
 import shapes
 import colors
 import utils
+from kalman import KalmanFilter
+
+# The running sums are recomputed from the stored points this often
+RESUM_POINTS = 1000
+# The fit is vertical when the variance of x is below this fraction of the
+# mean of x^2
+VERTICAL_EPS = 1e-9
+# Frame period in seconds assumed for points without a timestamp, to scale
+# the Kalman filter's noise to a clock counting frames
+FRAME_TIME = 1 / 60.0
+
 
 class TrajectoryPlanner:
-    def __init__(self, frames=5, bounce=0, walls=[], robot_axis=None):
+    def __init__(self, frames=5, bounce=0, walls=[], robot_axis=None,
+      mode='fit', drag=0.0):
       """
       @brief Initializes parameters
 
@@ -54,9 +85,18 @@ class TrajectoryPlanner:
       @param bounces How many bounces off of walls to predict
       @param walls A list of Line objects representing walls to bounce off of
       @param robot_axis The robot axis to be used
+      @param mode 'fit' to fit a line through the previous points, 'param'
+        to fit the position against time through them, or 'kalman' to follow
+        the object with a Kalman filter
+      @param drag In 'kalman' mode, the rate the velocity decays at, per
+        second. 0 for constant velocity
       """
       self.num_frames = frames
       self.bounce = bounce
+      if mode not in ['fit', 'param', 'kalman']:
+        print 'Invalid trajectory mode: ' + str(mode)
+        exit()
+      self.mode = mode
 
       ######## SCENE DEFINITION PARAMETERS #########
       # Line objects representing walls for bounce prediction
@@ -72,6 +112,28 @@ class TrajectoryPlanner:
       # Separate x and y list are kept for convenience when fitting line
       self.x_list = [None] * self.num_frames  # list of x-values for best fit
       self.y_list = [None] * self.num_frames # list of y-values for best fit
+      # Capture time in seconds of each point. Points without a timestamp
+      # use the number of points added, so time is in frames instead
+      self.t_list = [None] * self.num_frames
+      self.point_count = 0 # total number of points added
+
+      # Running sums over the stored points for the least squares fit, kept
+      # up to date by add_point. They are recomputed from the lists every
+      # RESUM_POINTS points so floating point error cannot build up
+      self.sum_x = 0.0
+      self.sum_y = 0.0
+      self.sum_xy = 0.0
+      self.sum_xx = 0.0
+      self.sum_count = 0 # number of points in the sums
+
+      ######### PARAMETRIC FIT PARAMETERS ########
+      self.param_fit = None # (x, y, vx, vy) at the latest point, or None
+      self.param_count = None # point_count when param_fit was found
+
+      ######### KALMAN PARAMETERS ########
+      self.kalman = None
+      if mode == 'kalman':
+        self.kalman = KalmanFilter(drag=drag)
 
       self.curr_index = None # Index of most recent point
       self.last_index = None # Index of oldest point
@@ -81,10 +143,12 @@ class TrajectoryPlanner:
       self.traj = None
       # List of lines representing all bounces of the trajectory prediction
       self.traj_list = []
-
-      ######## DEBUG PARAMETERS ########
-      self.debug_line=None
-      self.debug_pt = None
+      # Distance along the path at the end of each line in traj_list, and
+      # (x, y) unit direction the path starts along
+      self.traj_dists = []
+      self.traj_dir = None
+      # Intercept at the end of each line in traj_list, see get_intercepts
+      self.intercepts = []
 
 
     def add_point(self, point):
@@ -94,6 +158,9 @@ class TrajectoryPlanner:
       For optimal usage, it is generally recommended to add a point denoting 
       the updated location at every frame. A Point contains an x and y value
 
+      Points carrying a timestamp (see shapes.Circle) let the velocity be
+      found in pixels per second.
+
       @param The Point or Circle object to add as the current frame
       """
       if point is None:
@@ -108,10 +175,142 @@ class TrajectoryPlanner:
         self.curr_index = self.index
         self.last_index = (self.index + 1) % self.num_frames
 
+      # remove the point being overwritten from the sums
+      old_x = self.x_list[self.index]
+      if old_x is not None:
+        old_y = self.y_list[self.index]
+        self.sum_x -= old_x
+        self.sum_y -= old_y
+        self.sum_xy -= old_x * old_y
+        self.sum_xx -= old_x * old_x
+        self.sum_count -= 1
+
       self.pt_list[self.index] = point
       self.x_list[self.index] = point.x
       self.y_list[self.index] = point.y
 
+      x = float(point.x)
+      y = float(point.y)
+      self.sum_x += x
+      self.sum_y += y
+      self.sum_xy += x * y
+      self.sum_xx += x * x
+      self.sum_count += 1
+
+      timestamp = getattr(point, 'timestamp', None)
+      if timestamp is None:
+        if self.kalman is not None and self.point_count == 0:
+          # the filter is tuned in seconds, but the clock is in frames
+          self.kalman.scale_time(FRAME_TIME)
+        timestamp = self.point_count
+      self.t_list[self.index] = timestamp
+      self.point_count += 1
+
+      if self.kalman is not None:
+        self.kalman.update(point.x, point.y, timestamp)
+
+      if self.point_count % RESUM_POINTS is 0:
+        self.resum()
+
+
+    def resum(self):
+      """
+      @brief Recomputes the running sums from the stored points
+      """
+      self.sum_x = self.sum_y = self.sum_xy = self.sum_xx = 0.0
+      self.sum_count = 0
+      for x, y in zip(self.x_list, self.y_list):
+        if x is None:
+          continue
+        x = float(x)
+        y = float(y)
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xy += x * y
+        self.sum_xx += x * x
+        self.sum_count += 1
+
+
+    def get_velocity(self):
+      """
+      @brief Gets the velocity of the object over the stored points
+
+      Velocity is the displacement between the oldest and newest stored points
+      over the time between them. With timestamped points this is in pixels
+      per second, otherwise in pixels per frame.
+
+      In 'param' and 'kalman' modes, the fitted or filtered velocity is
+      returned instead (see get_state).
+
+      @return (vx, vy) tuple, or None if fewer than two points or no time
+        has passed between them
+      """
+      if self.mode != 'fit':
+        state = self.get_state()
+        if state is None:
+          return None
+        return (state[2], state[3])
+      if self.index is None:
+        return None
+
+      # oldest stored point, the slot after the newest if the list is full
+      oldest = self.last_index
+      if oldest is None or self.pt_list[oldest] is None:
+        oldest = 0
+      newest = self.curr_index
+
+      dt = self.t_list[newest] - self.t_list[oldest]
+      if dt <= 0:
+        return None
+      return ((self.x_list[newest] - self.x_list[oldest]) / float(dt),
+        (self.y_list[newest] - self.y_list[oldest]) / float(dt))
+
+
+    def predict_point(self, frames=1):
+      """
+      @brief Predicts where the object will be a number of frames from now
+
+      Extrapolates from the two most recent points, assuming the object keeps
+      the same velocity (in pixels per frame).
+
+      In 'param' and 'kalman' modes, the fitted or filtered estimate is
+      moved forward by the average time between the stored points per frame.
+
+      @param frames The number of frames ahead to predict
+
+      @return A Point of the predicted location, or None if no points added
+      """
+      if self.index is None:
+        return None
+
+      state = None
+      if self.mode != 'fit':
+        state = self.get_state()
+      if state is not None:
+        oldest = self.last_index
+        if oldest is None or self.pt_list[oldest] is None:
+          oldest = 0
+        count = min(self.point_count, self.num_frames)
+        frame_time = 0.0
+        if count > 1:
+          frame_time = (self.t_list[self.curr_index] - self.t_list[oldest]) / \
+            float(count - 1)
+        if self.kalman is not None: # moved forward with drag
+          x, y = self.kalman.get_position(self.kalman.t + frame_time * frames)
+          return shapes.Point(x, y)
+        x, y, vx, vy = state
+        return shapes.Point(x + vx * frame_time * frames,
+          y + vy * frame_time * frames)
+
+      curr_pt = self.pt_list[self.curr_index]
+      prev_pt = self.pt_list[(self.curr_index - 1) % self.num_frames]
+      if prev_pt is None: # only one point so far, assume stationary
+        return shapes.Point(curr_pt.x, curr_pt.y)
+
+      return shapes.Point(
+        curr_pt.x + (curr_pt.x - prev_pt.x) * frames,
+        curr_pt.y + (curr_pt.y - prev_pt.y) * frames)
+
 
     def add_wall(self, wall):
       """
@@ -141,15 +340,38 @@ class TrajectoryPlanner:
     def get_best_fit_line(self, color=colors.Cyan):
       """
       @brief Gets and returns a Line object representing the best fit line
+
+      Least squares fit of y = m*x + b over the stored points, from the
+      running sums:
+        m = (n*Sxy - Sx*Sy) / (n*Sxx - Sx*Sx)
+        b = (Sy - m*Sx) / n
+      If the x values (nearly) all match, the line is vertical and is placed
+      at their mean instead.
+
+      In 'param' and 'kalman' modes, the line is from the fitted or filtered
+      position along the velocity instead (see get_motion_line).
+
       @param The color for the best fit line
-      @return A Line object
+      @return A Line object, or None if no points have been added
       """
-      # get best fit line
-      fit = np.polyfit(self.x_list, self.y_list, 1, full=True)
-      m = fit[0][0] # slope of best fit line
-      b = fit[0][1] # intercept of best fit line
+      if self.mode != 'fit':
+        return self.get_motion_line(color)
+
+      n = self.sum_count
+      if n is 0:
+        return None
 
       x1 = self.x_list[self.index] # most recent x
+      denom = n * self.sum_xx - self.sum_x * self.sum_x
+      # relative to the spread of x, so the test does not depend on position
+      if denom <= VERTICAL_EPS * n * n * max(1.0, self.sum_xx / n):
+        x = self.sum_x / n
+        y1 = self.y_list[self.index] # most recent y
+        return shapes.Line(x1=x, y1=y1, x2=x, y2=y1 + 1.0, color=color)
+
+      m = (n * self.sum_xy - self.sum_x * self.sum_y) / denom # slope
+      b = (self.sum_y - m * self.sum_x) / n # intercept
+
       x2 = x1 + 1.0
       y1 = m * x1 + b
       y2 = m * x2 + b
@@ -158,98 +380,303 @@ class TrajectoryPlanner:
       return ln
 
 
-    def get_trajectory_list(self, color=colors.Cyan):
+    def get_param_fit(self):
+      """
+      @brief Fits the position against time through the stored points
+
+      Least squares fit of x(t) = x0 + vx*t and y(t) = y0 + vy*t, with
+      times taken from their mean so the solve is well conditioned. Both
+      axes are solved at once as columns of one array:
+        v = sum((t - mean_t) * (p - mean_p)) / sum((t - mean_t)^2)
+      The fit is kept until another point is added.
+
+      @return (x, y, vx, vy) tuple, the fitted position at the latest point's
+        time and the velocity, or None if fewer than two points or no time
+        has passed between them
+      """
+      if self.param_count == self.point_count:
+        return self.param_fit
+      self.param_count = self.point_count
+      self.param_fit = None
+
+      samples = [sample for sample in
+        zip(self.x_list, self.y_list, self.t_list) if sample[0] is not None]
+      if len(samples) < 2:
+        return None
+      samples = np.array(samples, dtype=np.float64)
+      t_mean = samples[:, 2].mean()
+      t = samples[:, 2] - t_mean
+      tt = np.dot(t, t)
+      if tt <= 0:
+        return None
+
+      pos_mean = samples[:, :2].mean(axis=0)
+      velocity = t.dot(samples[:, :2] - pos_mean) / tt
+      position = pos_mean + velocity * (self.t_list[self.curr_index] - t_mean)
+      self.param_fit = (position[0], position[1], velocity[0], velocity[1])
+      return self.param_fit
+
+
+    def get_state(self):
+      """
+      @brief Gets the estimated position and velocity of the object
+
+      @return (x, y, vx, vy) tuple from the parametric fit in 'param' mode or
+        the filter in 'kalman' mode, or None in 'fit' mode or if there is no
+        velocity yet
+      """
+      if self.mode == 'param':
+        return self.get_param_fit()
+      if self.kalman is not None:
+        velocity = self.kalman.get_velocity()
+        if velocity is None:
+          return None
+        return self.kalman.get_position() + velocity
+      return None
+
+
+    def get_motion_line(self, color=colors.Cyan):
+      """
+      @brief Gets the line from the estimated position along the velocity
+
+      @param color The color for the line
+
+      @return A Line object, or None if there is no velocity yet (see
+        get_state) or the object is not moving
+      """
+      state = self.get_state()
+      if state is None:
+        return None
+      x, y, vx, vy = state
+      if vx == 0 and vy == 0:
+        return None
+      return shapes.Line(x1=x, y1=y, x2=x + vx, y2=y + vy, color=color)
+
+
+    def get_trajectory_list(self, color=colors.Cyan, segments=1):
       """
       @brief Gets best fit traj from n-previous points and predicts bounces
 
-      Uses np.polyfit with dimension 1. Creates line from two points. Points
-      are generated using closest point to most recent frame (x1,y1) and 
-      a point (x1 + 1.0, y2). This works as a line can be represented by any
-      arbitrary two points along it. The actual points do not matter here or
-      for the goalie, unless specified/calculated otherwise.
+      Uses a least squares line fit (see get_best_fit_line). Creates line from
+      two points. Points are generated using closest point to most recent
+      frame (x1,y1) and a point (x1 + 1.0, y2). This works as a line can be
+      represented by any arbitrary two points along it. The actual points do
+      not matter here or for the goalie, unless specified/calculated
+      otherwise.
 
       self.traj is always the farthest-predicted line between the last impact
       point or object location and the robot axis
 
       self.traj_list contains, from oldest to farthest predicted, a list of 
       Lines representing each bounce. The lines go obj->wall, wall->wall, ...,
-      wall->robot_axis.
+      wall->robot_axis. Bounces are found by unfolding (see unfold).
 
       @param color The color to be used in the trajectory lines
+      @param segments If false, only the last line of a bounce path is made,
+        so the cost does not grow with the number of bounces
 
       @return list of Line objects representing trajectory path
       """
       # Not enough frames collected
-      if None in self.pt_list:
+      if self.kalman is not None:
+        if self.kalman.get_velocity() is None:
+          return []
+      elif None in self.pt_list:
         return []
+      state = self.get_state()
 
       # reset and get best fit line
       self.traj_list = []
+      self.traj_dists = []
+      self.traj_dir = None
       ln = self.get_best_fit_line()
-
-      # get trajectory towards robot axis, line from obj to axis
-      # if trajectory not moving towards robot axis, no prediction
-      if not self.traj_dir_toward_line(self.robot_axis):
-        ln = None
       start_pt = self.pt_list[self.curr_index]
-      traj_int_pt = utils.line_intersect(ln, self.robot_axis) # Point object
-      traj = utils.get_line(start_pt, traj_int_pt, color=colors.Blue)
-      self.traj = traj
-
-      # return straight-line trajectory (as a 1-elem list for consistency) if
-      # no bounces to be predicted
-      if self.bounce is 0: # no bounce prediction
+      if state is not None: # start from the fitted or filtered position
+        start_pt = shapes.Point(state[0], state[1])
+
+      # straight-line trajectory (as a 1-elem list for consistency) if no
+      # bounces to be predicted
+      if self.bounce is 0 or len(self.walls) < 2:
+        # get trajectory towards robot axis, line from obj to axis
+        # if trajectory not moving towards robot axis, no prediction
+        if not self.traj_dir_toward_line(self.robot_axis):
+          ln = None
+        traj_int_pt = utils.line_intersect(ln, self.robot_axis) # Point object
+        traj = utils.get_line(start_pt, traj_int_pt, color=colors.Blue)
+        self.traj = traj
         self.traj_list.append(self.traj)
+        if traj is not None and traj.length > 0:
+          self.traj_dists = [traj.length]
+          self.traj_dir = (traj.dx / traj.length, traj.dy / traj.length)
         return self.traj_list
 
+      self.traj_list, self.traj_dists, self.traj_dir = self.unfold(ln,
+        start_pt, segments, color)
+      self.traj = None
+      if self.traj_list:
+        self.traj = self.traj_list[-1]
+      return self.traj_list
 
-      #### BOUNCE (broken) ####
-      for wall in self.walls:
-        # Determine where bounce occurs and add line up to bounce
-        bounce_pt = utils.line_segment_intersect(self.traj, wall)
-        if bounce_pt is None:
-          continue
-
-        bounce_ln = utils.get_line(self.pt_list[self.curr_index],
-          bounce_pt, color=colors.Blue)
-        self.traj_list.append(bounce_ln)
-        self.debug_pt = bounce_pt
-
-
-        ### THIS IS BROKEN 
-        # Reflect line across wall and project to next wall or axis
-        # incoming d, normal n: outgoing r = d - 2(d dot n)*n
-        normal_dx = -wall.dy*1.0
-        normal_dy = wall.dx*1.0
-        normal_len = math.sqrt(normal_dx*normal_dx + normal_dy*normal_dy)
-
-        d = shapes.Point(bounce_ln.dx, bounce_ln.dy)
-        n = shapes.Point(normal_dx/normal_len, normal_dy/normal_len)
-        self.debug_line = shapes.Line(x1=bounce_pt.x, y1=bounce_pt.y,
-          x2=bounce_pt.x+n.x*20,y2=bounce_pt.y+n.y*20,color=colors.Red)
-
-        reflect_dx = (d.x - 2 * utils.dot(d, n) * n.x)
-        reflect_dy = (d.y - 2 * utils.dot(d, n) * n.y)
-
-
-        #### ONCE NEW DX AND DY ARE FOND, IT WORKS. GETTING DX/DY FAILS ####
-        new_x = bounce_pt.x + reflect_dx * 0.001
-        new_y = bounce_pt.y + reflect_dy * 0.001
-        new_pt = shapes.Point(new_x, new_y)
-
-        new_ln = utils.get_line(bounce_pt, new_pt) # small line
-        final_int = utils.line_intersect(new_ln, self.robot_axis)
-        final_ln = shapes.Line(
-          x1=bounce_pt.x, y1=bounce_pt.y,
-          x2=final_int.x, y2=final_int.y, color=colors.Cyan)
-
-        self.traj = final_ln
-        self.traj_list.append(final_ln)
-
-        # only one bounce
-        break
 
-      return self.traj_list
+    def unfold(self, ln, start_pt, segments=1, color=colors.Cyan):
+      """
+      @brief Predicts the path to the robot axis, bouncing between the walls
+
+      Uses the method of images: instead of reflecting the path at each
+      wall, the table is reflected across the walls over and over, and the
+      path is a straight line through the copies. Taking the first two walls
+      as parallel rails, in a frame with s along the rails and u across them
+      (0 to width), the unfolded path is u = u0 + du*t, s = s0 + ds*t, and
+      the real position across the table is u folded back into the table,
+      a triangle wave in u. The path meets the axis where its s matches the
+      axis at the folded u, which is linear within each copy of the table,
+      so the crossing is solved directly in each copy. Only the copies the
+      path passes through while within the range of s the axis spans are
+      checked, which is one copy if the axis is square to the rails, so the
+      cost does not grow with the number of bounces before the axis.
+
+      The object's radius narrows the table, as it bounces when its edge
+      reaches the wall.
+
+      @param ln A Line along the object's path
+      @param start_pt The Point the object is at
+      @param segments If true, gets every line of the path. Otherwise only the
+        line from the last bounce to the axis
+      @param color The color of the line reaching the axis. Lines between
+        bounces are blue
+
+      @return lines List of Line objects along the path, the last reaching
+        the axis. Empty if the object is not moving toward the axis along the
+        rails, the path does not reach the axis, or bounces more than
+        self.bounce times
+      @return dists Distance travelled along the path at the end of each line
+      @return direction (x, y) unit direction the object starts along, or None
+      """
+      axis = self.robot_axis
+      wall0 = self.walls[0]
+      wall1 = self.walls[1]
+      if ln is None or axis is None or wall0.length <= 0 or \
+        wall1.length <= 0:
+        return [], [], None
+
+      # rail frame, s along the average rail direction, u across toward wall1
+      d0x, d0y = wall0.dx / wall0.length, wall0.dy / wall0.length
+      d1x, d1y = wall1.dx / wall1.length, wall1.dy / wall1.length
+      if d0x*d1x + d0y*d1y < 0: # rails drawn in opposite directions
+        d1x, d1y = -d1x, -d1y
+      norm = math.sqrt((d0x + d1x) ** 2 + (d0y + d1y) ** 2)
+      dx, dy = (d0x + d1x) / norm, (d0y + d1y) / norm
+      ox, oy = (wall0.x1 + wall0.x2) / 2.0, (wall0.y1 + wall0.y2) / 2.0
+      nx, ny = -dy, dx
+      width = ((wall1.x1 + wall1.x2) / 2.0 - ox) * nx + \
+        ((wall1.y1 + wall1.y2) / 2.0 - oy) * ny
+      if width < 0:
+        nx, ny, width = -nx, -ny, -width
+
+      # u is measured from where the object's edge touches wall0
+      radius = getattr(self.pt_list[self.curr_index], 'radius', 0)
+      channel = width - 2 * radius
+      if channel <= 0:
+        return [], [], None
+
+      def to_rail(x, y):
+        return ((x - ox)*dx + (y - oy)*dy, (x - ox)*nx + (y - oy)*ny - radius)
+
+      def from_rail(s, u):
+        u += radius
+        return shapes.Point(ox + s*dx + u*nx, oy + s*dy + u*ny)
+
+      s0, u0 = to_rail(start_pt.x, start_pt.y)
+      # a detection a little inside its radius of a rail is still on the
+      # table, not in the mirrored copy past the rail
+      u0 = min(max(u0, 0.0), channel)
+      ds = ln.dx*dx + ln.dy*dy
+      du = ln.dx*nx + ln.dy*ny
+
+      # axis as s = axis_s + axis_c * u
+      s1, u1 = to_rail(axis.x1, axis.y1)
+      s2, u2 = to_rail(axis.x2, axis.y2)
+      if math.fabs(u2 - u1) < 1e-6: # axis along the rails
+        return [], [], None
+      axis_c = (s2 - s1) / (u2 - u1)
+      axis_s = s1 - axis_c * u1
+
+      # travel the way the object is moving, which must be toward the axis
+      velocity = self.get_velocity()
+      if velocity is None or math.fabs(ds) < 1e-9:
+        return [], [], None
+      velocity_s = velocity[0]*dx + velocity[1]*dy
+      if velocity_s * (axis_s + axis_c * u0 - s0) <= 0:
+        return [], [], None
+      if velocity_s * ds < 0:
+        ds, du = -ds, -du
+
+      # times the path enters and leaves the range of s the axis spans
+      s_lo = axis_s + min(0.0, axis_c * channel)
+      s_hi = axis_s + max(0.0, axis_c * channel)
+      if ds > 0:
+        t_enter, t_exit = (s_lo - s0) / ds, (s_hi - s0) / ds
+      else:
+        t_enter, t_exit = (s_hi - s0) / ds, (s_lo - s0) / ds
+      if t_exit < 0:
+        return [], [], None
+      t_enter = max(t_enter, 0.0)
+
+      # copy k of the table holds unfolded u in [k, k+1) * channel, where the
+      # folded u is u - k*channel (k even) or (k+1)*channel - u (k odd).
+      # Check each copy passed through in the range, in order
+      k0 = 0 # the start is clamped into the table
+      k_enter = int(math.floor((u0 + du * t_enter) / channel))
+      k_exit = int(math.floor((u0 + du * t_exit) / channel))
+      step = 1 if k_exit >= k_enter else -1
+      t = None
+      for k in range(k_enter, k_exit + step, step):
+        if k % 2 is 0:
+          sign, offset = 1.0, -k * channel
+        else:
+          sign, offset = -1.0, (k + 1) * channel
+        denom = ds - axis_c * sign * du
+        if math.fabs(denom) < 1e-9:
+          continue
+        tk = (axis_s + axis_c * (sign * u0 + offset) - s0) / denom
+        u = u0 + du * tk
+        if tk >= 0 and k * channel - 1e-6 <= u <= (k + 1) * channel + 1e-6:
+          t = tk
+          break
+      if t is None:
+        return [], [], None
+      k = int(math.floor((u0 + du * t) / channel))
+      if abs(k - k0) > self.bounce:
+        return [], [], None
+
+      def fold(u):
+        u = u % (2 * channel)
+        if u > channel:
+          return 2 * channel - u
+        return u
+
+      speed = math.sqrt(ds*ds + du*du)
+      direction = ((ds*dx + du*nx) / speed, (ds*dy + du*ny) / speed)
+      end_pt = from_rail(s0 + ds * t, fold(u0 + du * t))
+
+      # wall crossings of the unfolded path, each a bounce
+      crossings = range(k0 + 1, k + 1) if k > k0 else range(k0, k, -1)
+      if not segments:
+        crossings = crossings[-1:]
+
+      lines = []
+      dists = []
+      prev_pt = start_pt
+      for j in crossings:
+        tj = (j * channel - u0) / du
+        bounce_pt = from_rail(s0 + ds * tj, fold(j * channel))
+        if segments:
+          lines.append(utils.get_line(prev_pt, bounce_pt, color=colors.Blue))
+          dists.append(tj * speed)
+        prev_pt = bounce_pt
+      lines.append(utils.get_line(prev_pt, end_pt, color=color))
+      dists.append(t * speed)
+      return lines, dists, direction
 
 
     def get_trajectory(self, calculate=1, color=colors.Cyan):
@@ -275,6 +702,164 @@ class TrajectoryPlanner:
       return self.traj_list[len(self.traj_list) - 1]
 
 
+    def get_speed(self, ux, uy):
+      """
+      @brief Gets the speed of the object along a direction
+
+      In 'fit' and 'param' modes, the distance of each stored point along the
+      direction is fit against its time by least squares, and the speed is
+      the slope. In 'kalman' mode, it is the filtered velocity along the
+      direction.
+
+      @param ux The x component of the unit direction
+      @param uy The y component of the unit direction
+
+      @return (speed, speed_std) tuple, or None if fewer than two points or no
+        time has passed between them
+      """
+      if self.kalman is not None:
+        velocity = self.kalman.get_velocity()
+        if velocity is None:
+          return None
+        P = self.kalman.P
+        var = ux*ux*P[2, 2] + 2*ux*uy*P[2, 3] + uy*uy*P[3, 3]
+        return (velocity[0]*ux + velocity[1]*uy, math.sqrt(max(var, 0.0)))
+
+      samples = [sample for sample in
+        zip(self.x_list, self.y_list, self.t_list) if sample[0] is not None]
+      if len(samples) < 2:
+        return None
+      x, y, t = np.array(samples, dtype=np.float64).T
+      dist = x*ux + y*uy
+      dist -= dist.mean()
+      t -= t.mean()
+      tt = np.dot(t, t)
+      if tt <= 0:
+        return None
+
+      speed = np.dot(t, dist) / tt
+      speed_std = 0.0
+      if len(samples) > 2:
+        residual = dist - speed * t
+        speed_std = math.sqrt(np.dot(residual, residual) /
+          (len(samples) - 2) / tt)
+      return (speed, speed_std)
+
+
+    def get_lateral_std(self, ux, uy, dist):
+      """
+      @brief Gets the uncertainty of the path across a direction
+
+      @param ux The x component of the unit direction of travel
+      @param uy The y component of the unit direction of travel
+      @param dist How far along the direction from the latest position to
+        take the uncertainty at, in pixels
+
+      @return Standard deviation across the direction, in pixels
+      """
+      if self.kalman is not None:
+        # lateral position, and lateral velocity over the time to get there
+        P = self.kalman.P
+        pos_var = uy*uy*P[0, 0] - 2*ux*uy*P[0, 1] + ux*ux*P[1, 1]
+        vel_var = uy*uy*P[2, 2] - 2*ux*uy*P[2, 3] + ux*ux*P[3, 3]
+        speed = self.get_speed(ux, uy)[0]
+        time = dist / speed if speed > 0 else 0.0
+        return math.sqrt(max(pos_var + vel_var * time * time, 0.0))
+
+      # prediction error of the line fit at the given distance
+      samples = [sample for sample in zip(self.x_list, self.y_list)
+        if sample[0] is not None]
+      if len(samples) < 3:
+        return 0.0
+      x, y = np.array(samples, dtype=np.float64).T
+      along = x*ux + y*uy
+      across = y*ux - x*uy
+      end = self.x_list[self.curr_index]*ux + self.y_list[self.curr_index]*uy \
+        + dist
+      along_mean = along.mean()
+      along -= along_mean
+      across -= across.mean()
+      aa = np.dot(along, along)
+      if aa <= 0:
+        return 0.0
+      residual = across - np.dot(along, across) / aa * along
+      sigma = math.sqrt(np.dot(residual, residual) / (len(samples) - 2))
+      n = len(samples)
+      return sigma * math.sqrt(1.0/n + (end - along_mean) ** 2 / aa)
+
+
+    def get_intercepts(self):
+      """
+      @brief Estimates when the object reaches the end of each trajectory line
+
+      Uses the lines from the last get_trajectory_list call. The object is
+      taken to keep its speed along the trajectory through bounces, slowing
+      down with drag in 'kalman' mode. Times are from the latest sample (the
+      filtered estimate in 'kalman' mode).
+
+      @return List of Intercept objects, one per line in traj_list, the last
+        being on the robot axis. Empty if there is no trajectory, or the
+        object is not moving along it (or stops first, with drag)
+      """
+      self.intercepts = []
+      if self.traj_dir is None:
+        return self.intercepts
+      ux, uy = self.traj_dir
+
+      speed = self.get_speed(ux, uy)
+      if speed is None or speed[0] <= 0:
+        return self.intercepts
+      speed, speed_std = speed
+
+      if self.kalman is not None:
+        start_time = self.kalman.t
+        drag = self.kalman.drag
+        P = self.kalman.P
+        dist_std = math.sqrt(max(
+          ux*ux*P[0, 0] + 2*ux*uy*P[0, 1] + uy*uy*P[1, 1], 0.0))
+      else:
+        start_time = self.t_list[self.curr_index]
+        drag = 0.0
+        dist_std = 0.0
+      # frame counts are not a clock, so no absolute time
+      has_clock = getattr(self.pt_list[self.curr_index], 'timestamp',
+        None) is not None
+
+      for ln, dist in zip(self.traj_list, self.traj_dists):
+        # speed left on arrival. dist = speed*(1 - exp(-drag*t))/drag
+        arrive_speed = speed - drag * dist
+        if arrive_speed <= 0:
+          break
+        if drag > 0:
+          time = -math.log(arrive_speed / speed) / drag
+        else:
+          time = dist / speed
+
+        # first order propagation of the distance and speed uncertainty
+        time_std = math.sqrt((dist_std / arrive_speed) ** 2 +
+          (dist * speed_std / (speed * arrive_speed)) ** 2)
+
+        timestamp = None
+        if has_clock:
+          timestamp = start_time + time
+        self.intercepts.append(shapes.Intercept(x=ln.x2, y=ln.y2, time=time,
+          timestamp=timestamp, time_std=time_std,
+          pos_std=self.get_lateral_std(ux, uy, dist)))
+
+      return self.intercepts
+
+
+    def get_intercept(self):
+      """
+      @brief Estimates when and where the object reaches the robot axis
+      @return An Intercept object, or None (see get_intercepts)
+      """
+      intercepts = self.get_intercepts()
+      if len(intercepts) < len(self.traj_list) or not intercepts:
+        return None
+      return intercepts[-1]
+
+
     def traj_dir_toward_line(self, line):
       """
       @brief Determines if the current trajectory is moving toward the line
@@ -292,10 +877,23 @@ class TrajectoryPlanner:
           return 1
         else return 0
 
+      In 'param' and 'kalman' modes, the estimated position is compared with
+      a point one pixel further along the estimated velocity instead.
+
       @param line The Line object used
 
       @return 1 if moving towards line, 0 if not
       """
+      if self.mode != 'fit':
+        ln = self.get_motion_line()
+        if ln is None or line is None:
+          return 0
+        step = 1.0 / math.sqrt(ln.dx * ln.dx + ln.dy * ln.dy)
+        next_pt = shapes.Point(ln.x1 + ln.dx * step, ln.y1 + ln.dy * step)
+        unused, distances = utils.distance_from_line(
+          [next_pt, shapes.Point(ln.x1, ln.y1)], line, squared=1)
+        return 1 if distances[0] < distances[1] else 0
+
       if None in self.pt_list or line is None:
         return 0
 
@@ -14,6 +14,21 @@ import shapes
 import colors
 
 
+TICK_FREQ = cv2.getTickFrequency() # ticks per second of cv2.getTickCount
+
+
+def get_time():
+  """
+  @brief Gets the current time from a monotonic clock
+
+  OpenCV's tick counter is used, as it never jumps when the system clock is
+  changed. Only differences between times are meaningful.
+
+  @return The current time in seconds
+  """
+  return cv2.getTickCount() / TICK_FREQ
+
+
 def dot(p1, p2):
   """
   @brief Gets dot product of p1 and p2
@@ -277,7 +292,7 @@ def line_intersect(ln1, ln2):
     return a[0] * b[1] - a[1] * b[0]
 
   div = det(xdiff, ydiff)
-  if div < 0.0001: # no intersection
+  if math.fabs(div) < 0.0001: # parallel, no intersection
     return None
 
   ln1_list = [(ln1.x1,ln1.y1), (ln1.x2,ln1.y2)]
@@ -4,23 +4,151 @@
 
 @brief Polls frame data in a thread
 
-Used to poll for frames from the webcam in a thread. Adapted from 
+Used to poll for frames from the webcam in a thread. Adapted from
 http://www.pyimagesearch.com/2015/12/21/increasing-webcam-fps-with-python-and-opencv/
 
 This method of reading video frames should ONLY be used with the webcam, not
-with videos used to test
+with videos used to test. Use FileVideoStream for videos instead
+
+Frames are kept in a small ring, each tagged with its capture time (from
+utils.get_time) and sequence number. read_next blocks until a frame newer
+than the last one the caller processed is ready, so no frame is ever
+processed twice. Frames the caller never got to are counted as dropped.
+
+ProcessVideoStream has the same interface, but captures in a separate
+process, so capture keeps up with the camera no matter how busy the
+detection process is with Python code holding the GIL. Frames are written
+into a ring of preallocated slots in shared memory, and read as NumPy views
+of those slots, with no pickling or copying.
+
+FileVideoStream also has the same interface, and replays a video file. It
+decodes ahead in a thread into a bounded queue, and returns every frame in
+order, either paced to play back in real time or as fast as they can be
+decoded, optionally looping. This makes runs on recorded video repeatable.
+Its frame times are times in the video, so velocities come out the same at
+any playback speed, but get_age still measures wall clock time since the
+frame was read (see get_capture_time).
+
+A CaptureProfile configures the camera before capture starts: resolution
+and frame rate (so frames arrive at the processing size), FOURCC (MJPG
+allows higher frame rates over USB), a driver buffer of one frame (so
+frames are not queued up in the driver), and locked exposure. Cameras
+silently ignore settings they do not support, so the settings are read back
+after being applied, and reported.
 """
 
-from threading import Thread
+from threading import Thread, Condition
+import Queue
+import time
+from collections import OrderedDict
+import multiprocessing
+import ctypes
 import cv2
- 
+import numpy as np
+
+import utils
+
+# wait after a failed grab, doubling with each failure in a row, so an
+# unplugged camera does not spin the capture loop
+GRAB_RETRY_MIN = 0.005
+GRAB_RETRY_MAX = 0.5
+
+def get_retry_wait(failures):
+  # return the time in seconds to wait after the given number of failed grabs
+  # in a row
+  return min(GRAB_RETRY_MAX, GRAB_RETRY_MIN * 2 ** (failures - 1))
+
+
+class CaptureProfile:
+  def __init__(self, width=640, height=480, fps=60, fourcc='MJPG',
+    buffer_size=1, exposure=None):
+    # settings to apply to a camera, None leaves a setting at the camera's
+    # default. fourcc is the pixel format, uncompressed formats (YUYV) limit
+    # the frame rate over USB. buffer_size is the number of frames buffered
+    # by the driver, 1 keeps the newest frame from waiting behind older ones.
+    # exposure is locked at the given value in the camera's units, None
+    # leaves auto exposure on
+    self.width = width
+    self.height = height
+    self.fps = fps
+    self.fourcc = fourcc
+    self.buffer_size = buffer_size
+    self.exposure = exposure
+
+    self.applied = {} # settings read back after apply
+
+  def apply(self, stream):
+    # apply the settings to an opened cv2.VideoCapture, and return a dict of
+    # the settings read back from it
+    # the pixel format must be set first, as it limits the sizes and rates
+    if self.fourcc is not None:
+      stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+    if self.width is not None:
+      stream.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+    if self.height is not None:
+      stream.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+    if self.fps is not None:
+      stream.set(cv2.CAP_PROP_FPS, self.fps)
+    if self.buffer_size is not None:
+      stream.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+    if self.exposure is not None:
+      # V4L2 takes 0.25 for manual exposure (and 0.75 for auto)
+      stream.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)
+      stream.set(cv2.CAP_PROP_EXPOSURE, self.exposure)
+
+    fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
+    self.applied = {
+      'width': int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+      'height': int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+      'fps': stream.get(cv2.CAP_PROP_FPS),
+      'fourcc': ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)),
+      'buffer_size': int(stream.get(cv2.CAP_PROP_BUFFERSIZE)),
+      'exposure': stream.get(cv2.CAP_PROP_EXPOSURE),
+    }
+    return self.applied
+
+  def report(self):
+    # return a one-line report of the applied settings, flagging any that
+    # differ from the requested ones
+    items = []
+    for name in ['width', 'height', 'fps', 'fourcc', 'buffer_size',
+      'exposure']:
+      requested = getattr(self, name)
+      applied = self.applied.get(name)
+      item = '%s %s' % (name, applied)
+      if requested is not None and applied != requested:
+        item += ' (requested %s)' % requested
+      items.append(item)
+    return 'camera: ' + ', '.join(items)
+
+
 class WebcamVideoStream:
-  def __init__(self, camera=0):
-    # initialize the video camera stream and read the first frame
-    # from the stream
+  def __init__(self, camera=0, ring_size=4, profile=None):
+    # initialize the video camera stream, apply the capture profile if given,
+    # and read the first frame from the stream
     self.stream = cv2.VideoCapture(camera)
+    self.profile = profile
+    if profile is not None:
+      profile.apply(self.stream)
+      print profile.report()
     (self.grabbed, self.frame) = self.stream.read()
- 
+
+    # ring of (frame, timestamp, seq) tuples, the frame with sequence number
+    # seq is kept in slot seq % ring_size. Kept in one tuple, so readers never
+    # see a mismatched set
+    self.ring_size = ring_size
+    self.ring = [None] * ring_size
+    self.cond = Condition() # notified whenever a frame is added
+
+    # capture time and sequence number of the most recent frame
+    self.seq = 0
+    self.latest = (self.frame, utils.get_time(), self.seq)
+    self.ring[0] = self.latest
+
+    # Statistics
+    self.dropped = 0 # frames skipped over by read_next
+    self.failed = 0 # failed frame grabs
+
     # initialize the variable used to indicate if the thread should
     # be stopped
     self.stopped = False
@@ -29,21 +157,358 @@ class WebcamVideoStream:
     # start the thread to read frames from the video stream
     Thread(target=self.update, args=()).start()
     return self
- 
+
   def update(self):
     # keep looping infinitely until the thread is stopped
+    failures = 0 # failed grabs in a row
     while True:
       # if the thread indicator variable is set, stop the thread
       if self.stopped:
         return
- 
+
       # otherwise, read the next frame from the stream
-      (self.grabbed, self.frame) = self.stream.read()
- 
+      (grabbed, frame) = self.stream.read()
+      timestamp = utils.get_time()
+      self.grabbed = grabbed
+      if not grabbed:
+        self.failed += 1
+        failures += 1
+        time.sleep(get_retry_wait(failures))
+        continue
+      failures = 0
+
+      with self.cond:
+        self.seq += 1
+        self.frame = frame
+        self.latest = (frame, timestamp, self.seq)
+        self.ring[self.seq % self.ring_size] = self.latest
+        self.cond.notify_all()
+
   def read(self):
     # return the frame most recently read
     return self.frame
- 
+
+  def read_stamped(self):
+    # return the frame most recently read, with its capture time in seconds
+    # (from utils.get_time) and sequence number
+    return self.latest
+
+  def read_next(self, after_seq=None, timeout=None, latest=1):
+    # wait for a frame newer than sequence number after_seq, and return it
+    # with its capture time and sequence number. If latest, the newest frame
+    # is returned, otherwise the oldest one after after_seq still in the ring.
+    # Frames skipped over are counted as dropped. Returns (None, None, None)
+    # if no frame arrives within timeout seconds, or the stream is stopped
+    with self.cond:
+      if after_seq is None:
+        after_seq = self.seq - 1
+      if self.seq <= after_seq and not self.stopped:
+        self.cond.wait(timeout)
+      if self.seq <= after_seq:
+        return None, None, None
+
+      seq = self.seq
+      if not latest: # oldest frame after after_seq still in the ring
+        seq = max(after_seq + 1, self.seq - self.ring_size + 1)
+      self.dropped += seq - after_seq - 1
+      return self.ring[seq % self.ring_size]
+
+  def get_capture_time(self, timestamp):
+    # return the time (from utils.get_time) a frame with the given timestamp
+    # was captured. For a camera, that is the timestamp itself
+    return timestamp
+
+  def get_age(self, timestamp):
+    # return the time in seconds since a frame with the given capture time
+    return utils.get_time() - timestamp
+
+  def get_stats(self):
+    # return the number of frames dropped by read_next, and of failed grabs
+    return self.dropped, self.failed
+
+  def stop(self):
+    # indicate that the thread should be stopped
+    self.stopped = True
+    with self.cond:
+      self.cond.notify_all()
+
+
+def capture_frames(camera, profile, shared, shape, times, seq, failed, cond,
+  stopped):
+  # runs in the capture process of a ProcessVideoStream. Reads frames from the
+  # camera into the shared memory slots until stopped
+  ring_size = len(times)
+  h, w = shape[:2]
+  slots = np.frombuffer(shared, dtype=np.uint8).reshape(
+    (ring_size,) + tuple(shape))
+  stream = cv2.VideoCapture(camera)
+  if profile is not None:
+    profile.apply(stream)
+    print profile.report()
+  failures = 0 # failed grabs in a row
+  while not stopped.is_set():
+    (grabbed, frame) = stream.read()
+    timestamp = utils.get_time()
+    if not grabbed:
+      failed.value += 1
+      failures += 1
+      time.sleep(get_retry_wait(failures))
+      continue
+    failures = 0
+
+    # the slot is written outside the lock, readers check the frame's sequence
+    # number (see ProcessVideoStream.is_valid) to know if it was overwritten
+    next_seq = seq.value + 1
+    slot = slots[next_seq % ring_size]
+    if frame.shape == slot.shape:
+      slot[:] = frame
+    else:
+      cv2.resize(frame, (w, h), dst=slot, interpolation=cv2.INTER_NEAREST)
+
+    with cond:
+      times[next_seq % ring_size] = timestamp
+      seq.value = next_seq
+      cond.notify_all()
+  stream.release()
+
+
+class ProcessVideoStream:
+  def __init__(self, camera=0, ring_size=4, shape=(480,640,3), profile=None):
+    # allocate the shared memory ring. Frames of a different size are resized
+    # to shape as they are captured. The camera is only opened by the capture
+    # process, once started, and the capture profile applied there
+    self.camera = camera
+    self.ring_size = ring_size
+    self.shape = shape
+    self.profile = profile
+
+    size = ring_size * int(np.prod(shape))
+    self.shared = multiprocessing.RawArray(ctypes.c_uint8, size)
+    self.slots = np.frombuffer(self.shared, dtype=np.uint8).reshape(
+      (ring_size,) + tuple(shape))
+
+    # capture time of the frame in each slot, and the sequence number of the
+    # most recent frame. Sequence numbers start at 1
+    self.times = multiprocessing.RawArray(ctypes.c_double, ring_size)
+    self.seq = multiprocessing.RawValue(ctypes.c_long, 0)
+    self.cond = multiprocessing.Condition() # notified when a frame is added
+
+    # Statistics
+    self.dropped = 0 # frames skipped over by read_next
+    # failed grabs, counted by the capture process
+    self.failed_grabs = multiprocessing.RawValue(ctypes.c_long, 0)
+
+    self.stopped = multiprocessing.Event()
+    self.process = None
+
+  def start(self):
+    # start the process to read frames from the camera
+    self.process = multiprocessing.Process(target=capture_frames,
+      args=(self.camera, self.profile, self.shared, self.shape, self.times,
+        self.seq, self.failed_grabs, self.cond, self.stopped))
+    self.process.daemon = True
+    self.process.start()
+    return self
+
+  def get_frame(self, seq):
+    # return (frame, timestamp, seq) for the given sequence number. The frame
+    # is a view of its shared memory slot, valid until the ring wraps around
+    if seq < 1:
+      return None, None, None
+    slot = seq % self.ring_size
+    return self.slots[slot], self.times[slot], seq
+
+  def read(self):
+    # return the frame most recently read
+    return self.get_frame(self.seq.value)[0]
+
+  def read_stamped(self):
+    # return the frame most recently read, with its capture time in seconds
+    # (from utils.get_time) and sequence number
+    with self.cond:
+      return self.get_frame(self.seq.value)
+
+  def read_next(self, after_seq=None, timeout=None, latest=1):
+    # wait for a frame newer than sequence number after_seq, and return it
+    # with its capture time and sequence number. See
+    # WebcamVideoStream.read_next. The frame is a view of its shared memory
+    # slot, so check is_valid after using it, or copy it if it must outlive
+    # the next ring_size - 1 frames
+    with self.cond:
+      if after_seq is None:
+        after_seq = max(0, self.seq.value - 1)
+      if self.seq.value <= after_seq and not self.stopped.is_set():
+        self.cond.wait(timeout)
+      if self.seq.value <= after_seq:
+        return None, None, None
+
+      seq = self.seq.value
+      if not latest: # oldest frame after after_seq still in the ring
+        seq = max(after_seq + 1, seq - self.ring_size + 2)
+      self.dropped += seq - after_seq - 1
+      return self.get_frame(seq)
+
+  def is_valid(self, seq):
+    # return True if the frame with the given sequence number has not been
+    # overwritten. The slot being written is the one after the newest frame,
+    # so the newest ring_size - 1 frames are valid
+    return self.seq.value - seq < self.ring_size - 1
+
+  def get_capture_time(self, timestamp):
+    # return the time (from utils.get_time) a frame with the given timestamp
+    # was captured. For a camera, that is the timestamp itself
+    return timestamp
+
+  def get_age(self, timestamp):
+    # return the time in seconds since a frame with the given capture time
+    return utils.get_time() - timestamp
+
+  def get_stats(self):
+    # return the number of frames dropped by read_next, and of failed grabs
+    return self.dropped, self.failed_grabs.value
+
+  def stop(self):
+    # indicate that the process should be stopped, and wait for it to end
+    self.stopped.set()
+    with self.cond:
+      self.cond.notify_all()
+    if self.process is not None:
+      self.process.join(1.0)
+
+
+class FileVideoStream:
+  def __init__(self, path, queue_size=8, realtime=1, loop=0, fps=None):
+    # open the video file. If realtime, frames are returned no faster than
+    # the video's frame rate, otherwise as fast as they can be decoded. If
+    # loop, the video restarts from the beginning once it ends
+    self.stream = cv2.VideoCapture(path)
+    self.fps = fps
+    if not self.fps:
+      self.fps = self.stream.get(cv2.CAP_PROP_FPS)
+    if not self.fps:
+      self.fps = 30.0 # not all containers give a frame rate
+    self.realtime = realtime
+    self.loop = loop
+
+    # decoded (frame, seq) tuples waiting to be read, with None at the end
+    self.queue = Queue.Queue(maxsize=queue_size)
+
+    # frame times are those of the video, counted from the first read, so
+    # velocities come out the same whatever the playback speed
+    self.start_time = None
+    self.frame = None
+    self.latest = (None, None, 0)
+
+    # wall clock time (from utils.get_time) each recent frame was read at,
+    # by its time in the video. Without realtime, the two drift apart
+    self.read_times = OrderedDict()
+    self.read_times_size = 64
+    self.finished = False # True once every frame has been read
+
+    # Statistics
+    self.dropped = 0 # late frames skipped in realtime mode
+    self.failed = 0 # always 0, a failed read is taken as the end of video
+
+    self.stopped = False
+
+  def start(self):
+    # start the thread to decode frames from the video
+    thread = Thread(target=self.update, args=())
+    thread.daemon = True
+    thread.start()
+    return self
+
+  def update(self):
+    # decode frames until the video ends (and is not looped) or stopped
+    seq = 0
+    loop_start = 0 # seq of the last frame before the video last restarted
+    while not self.stopped:
+      (grabbed, frame) = self.stream.read()
+      if not grabbed:
+        if self.loop and seq > loop_start: # restart from the beginning
+          self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+          loop_start = seq
+          continue
+        self.put(None) # end of video
+        return
+
+      seq += 1
+      self.put((frame, seq))
+
+  def put(self, item):
+    # add a decoded item to the queue, waiting while it is full
+    while not self.stopped:
+      try:
+        self.queue.put(item, timeout=0.1)
+        return
+      except Queue.Full:
+        continue
+
+  def read(self):
+    # return the frame most recently read
+    return self.frame
+
+  def read_stamped(self):
+    # return the frame most recently read, with its time in the video and
+    # sequence number
+    return self.latest
+
+  def read_next(self, after_seq=None, timeout=None, latest=1):
+    # return the next frame in the video with its time and sequence number.
+    # Every frame is returned in order, so after_seq is only kept for the same
+    # interface as WebcamVideoStream. In realtime mode, this waits until the
+    # frame is due, and if latest, frames already a frame period late are
+    # dropped to catch up. Returns (None, None, None) if no frame is decoded
+    # within timeout seconds, or the video has ended
+    if self.start_time is None:
+      self.start_time = utils.get_time()
+
+    while not self.finished:
+      try:
+        item = self.queue.get(timeout=timeout)
+      except Queue.Empty:
+        return None, None, None
+      if item is None:
+        self.finished = True
+        break
+
+      frame, seq = item
+      timestamp = self.start_time + (seq - 1) / self.fps
+      if self.realtime:
+        wait = timestamp - utils.get_time()
+        if wait > 0:
+          time.sleep(wait)
+        elif latest and -wait > 1.0 / self.fps and not self.queue.empty():
+          self.dropped += 1 # too late, the next frame is already due
+          continue
+
+      self.frame = frame
+      self.latest = (frame, timestamp, seq)
+      self.read_times[timestamp] = utils.get_time()
+      if len(self.read_times) > self.read_times_size:
+        self.read_times.popitem(last=False)
+      return self.latest
+
+    if timeout is not None: # no frame is coming, wait as a camera would
+      time.sleep(timeout)
+    return None, None, None
+
+  def get_capture_time(self, timestamp):
+    # return the time (from utils.get_time) a frame with the given time in the
+    # video was read, standing in for its capture time. Frames no longer
+    # remembered are assumed to have been read when due
+    return self.read_times.get(timestamp, timestamp)
+
+  def get_age(self, timestamp):
+    # return the time in seconds since a frame with the given time in the
+    # video was read. Valid with or without realtime, unlike comparing the
+    # time in the video with utils.get_time
+    return utils.get_time() - self.get_capture_time(timestamp)
+
+  def get_stats(self):
+    # return the number of frames dropped by read_next, and of failed reads
+    return self.dropped, self.failed
+
   def stop(self):
     # indicate that the thread should be stopped
-    self.stopped = True
\ No newline at end of file
+    self.stopped = True
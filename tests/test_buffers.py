@@ -0,0 +1,70 @@
+"""
+@file test_buffers.py
+
+@brief Checks that BufferPool hands back the same memory for the same name
+"""
+import os # built-in packages
+import sys
+import unittest
+
+import numpy as np # 3rd party packages
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import colors # application-specific
+from buffers import BufferPool, get_buffer
+from segmentation import LabelSegmenter
+
+
+class TestBufferPool(unittest.TestCase):
+  def test_same_name_reused(self):
+    pool = BufferPool()
+    a = pool.get('mask', (480, 640))
+    b = pool.get('mask', (480, 640))
+    self.assertTrue(np.may_share_memory(a, b))
+    self.assertFalse(np.may_share_memory(a, pool.get(('mask', 1),
+      (480, 640))))
+
+  def test_smaller_shape_reuses_memory(self):
+    pool = BufferPool()
+    full = pool.get('small', (480, 640, 3))
+    half = pool.get('small', (240, 320, 3))
+    self.assertEqual(half.shape, (240, 320, 3))
+    self.assertTrue(half.flags['C_CONTIGUOUS'])
+    self.assertTrue(np.may_share_memory(full, half))
+
+  def test_grows_and_changes_type(self):
+    pool = BufferPool()
+    small = pool.get('buf', (10, 10))
+    large = pool.get('buf', (20, 20))
+    self.assertEqual(large.shape, (20, 20))
+    self.assertFalse(np.may_share_memory(small, large))
+
+    floats = pool.get('buf', (20, 20), np.float32)
+    self.assertEqual(floats.dtype, np.float32)
+
+  def test_get_buffer_without_pool(self):
+    self.assertEqual(get_buffer(None, 'buf', (10, 10)), None)
+    pool = BufferPool()
+    self.assertEqual(get_buffer(pool, 'buf', (10, 10)).shape, (10, 10))
+
+  def test_segmenter_writes_into_pool(self):
+    segmenter = LabelSegmenter([colors.Green, colors.Red])
+    rng = np.random.RandomState(4)
+    frame = rng.randint(0, 256, (60, 80, 3)).astype(np.uint8)
+    img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+    pool = BufferPool()
+    expected = segmenter.classify(img_hsv)
+    labels = segmenter.classify(img_hsv, pool)
+    self.assertTrue(np.array_equal(labels, expected))
+    self.assertTrue(np.may_share_memory(labels, pool.get('labels', (60, 80))))
+
+    # a second frame overwrites the same buffer
+    again = segmenter.classify(img_hsv[::-1].copy(), pool)
+    self.assertTrue(np.may_share_memory(labels, again))
+
+
+if __name__ == '__main__':
+  unittest.main()
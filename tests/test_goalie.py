@@ -0,0 +1,59 @@
+"""
+@file test_goalie.py
+
+@brief Runs the Goalie stages over the recorded bounce video
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import colors # application-specific
+import tracker as bt
+from goalie import Goalie, TRAJECTORY_MODE
+from videostream import FileVideoStream
+
+VIDEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+  'media', 'bounce.mp4')
+
+
+def get_tracker():
+  return bt.BallTracker(robot_color=colors.Blue,
+    robot_marker_color=colors.Green, rail_color=colors.Magenta,
+    track_colors=[colors.Red], radius=13, fused=1, roi_tracking=1,
+    scene_cache=1, pyramid_scale=2)
+
+
+class TestGoalie(unittest.TestCase):
+  def run_video(self, goalie, frames):
+    for i in range(frames):
+      data = goalie.capture()
+      if data is not None:
+        goalie.send(goalie.plan(goalie.detect(data)))
+
+  def test_latency_without_realtime(self):
+    # the video runs ahead of the wall clock, delays must not
+    cap = FileVideoStream(VIDEO, realtime=0).start()
+    goalie = Goalie(get_tracker(), cap)
+    self.run_video(goalie, 40)
+    cap.stop()
+    p50, p95, p99 = goalie.latency.get_percentiles('detect')
+    self.assertTrue(0.0 <= p50 <= p99 < 1.0, (p50, p99))
+
+  def test_planner_settings(self):
+    cap = FileVideoStream(VIDEO, realtime=0)
+    goalie = Goalie(get_tracker(), cap, mode='kalman', drag=0.5)
+    self.assertEqual(goalie.planner.kalman.drag, 0.5)
+    self.assertEqual(goalie.tracks.mode, 'kalman')
+    self.assertEqual(goalie.tracks.drag, 0.5)
+
+  def test_default_mode(self):
+    cap = FileVideoStream(VIDEO, realtime=0)
+    goalie = Goalie(get_tracker(), cap)
+    self.assertEqual(goalie.planner.mode, TRAJECTORY_MODE)
+    self.assertEqual(goalie.tracks.mode, TRAJECTORY_MODE)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,101 @@
+"""
+@file test_kalman.py
+
+@brief Checks the KalmanFilter and the planner's 'kalman' mode
+"""
+import math # built-in packages
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import shapes # application-specific
+from kalman import KalmanFilter
+from trajectory import TrajectoryPlanner, FRAME_TIME
+
+
+class TestKalmanFilter(unittest.TestCase):
+  def test_velocity_from_second_update(self):
+    kf = KalmanFilter()
+    kf.update(100.0, 50.0, 0.0)
+    self.assertEqual(kf.get_velocity(), None)
+    kf.update(105.0, 60.0, 1 / 60.0)
+    vx, vy = kf.get_velocity()
+    self.assertAlmostEqual(vx, 300.0, delta=15.0)
+    self.assertAlmostEqual(vy, 600.0, delta=30.0)
+
+  def test_predicts_through_misses(self):
+    kf = KalmanFilter()
+    for i in range(10):
+      if i in [4, 5, 6]: # missed frames
+        continue
+      t = i / 60.0
+      kf.update(100 + 300 * t, 50 + 600 * t, t)
+    x, y = kf.get_position(20 / 60.0)
+    self.assertAlmostEqual(x, 200.0, delta=1.0)
+    self.assertAlmostEqual(y, 250.0, delta=1.0)
+
+  def test_drag_slows_prediction(self):
+    kf = KalmanFilter(drag=1.0)
+    for i in range(10):
+      t = i / 60.0
+      distance = 300 * (1 - math.exp(-t)) # velocity decays as exp(-t)
+      kf.update(100 + distance, 50.0, t)
+    # from the last point, the object can only go 300*exp(-t) further
+    remaining = 300 * math.exp(-9 / 60.0)
+    x, y = kf.get_position(100.0)
+    self.assertAlmostEqual(x, 100 + 300 * (1 - math.exp(-9 / 60.0)) +
+      remaining, delta=5.0)
+
+  def test_scale_time(self):
+    # the same motion, stamped in seconds and in frames
+    seconds = KalmanFilter(drag=0.5)
+    frames = KalmanFilter(drag=0.5)
+    frames.scale_time(1 / 60.0)
+    for i in range(6):
+      seconds.update(100 + 5 * i, 50.0, i / 60.0)
+      frames.update(100 + 5 * i, 50.0, i)
+    self.assertAlmostEqual(frames.get_velocity()[0] * 60,
+      seconds.get_velocity()[0], places=6)
+    self.assertAlmostEqual(frames.get_position(10)[0],
+      seconds.get_position(10 / 60.0)[0], places=6)
+
+
+class TestKalmanPlanner(unittest.TestCase):
+  def test_trajectory_from_second_point(self):
+    axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+    planner = TrajectoryPlanner(frames=5, mode='kalman', robot_axis=axis)
+    for i in range(2):
+      t = i / 60.0
+      planner.add_point(shapes.Circle(100 + 300 * t, 50 + 600 * t, 13,
+        timestamp=t))
+    traj_list = planner.get_trajectory_list()
+    self.assertEqual(len(traj_list), 1)
+    self.assertAlmostEqual(traj_list[-1].y2, 400.0, places=3)
+    # x = 100 + 300 * t, where 50 + 600 * t = 400
+    self.assertAlmostEqual(traj_list[-1].x2, 275.0, delta=10.0)
+
+  def test_frame_clock_matches_seconds(self):
+    # points a frame apart without timestamps give the same estimate as
+    # timestamped ones, in frames instead of seconds
+    axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+    intercepts = []
+    for timed in [1, 0]:
+      planner = TrajectoryPlanner(frames=4, mode='kalman', robot_axis=axis)
+      for i in range(4):
+        timestamp = i * FRAME_TIME if timed else None
+        planner.add_point(shapes.Circle(100 + 5 * i, 50 + 10 * i, 13,
+          timestamp=timestamp))
+      planner.get_trajectory_list()
+      intercepts.append(planner.get_intercept())
+    seconds, frames = intercepts
+    self.assertAlmostEqual(frames.time, seconds.time / FRAME_TIME, places=3)
+    self.assertAlmostEqual(frames.time_std, seconds.time_std / FRAME_TIME,
+      places=3)
+    self.assertAlmostEqual(frames.pos_std, seconds.pos_std, places=3)
+    self.assertLess(frames.time_std, 5.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,68 @@
+"""
+@file test_latency.py
+
+@brief Checks the delays LatencyTracker derives from frame stamps and replies
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+from latency import LatencyTracker # application-specific
+
+
+class TestLatencyTracker(unittest.TestCase):
+  def test_stage_delays(self):
+    latency = LatencyTracker()
+    latency.add_frame(10.0, detect_time=10.008, plan_time=10.010,
+      sent_time=10.011)
+    for stage, delay in [('detect', 0.008), ('plan', 0.010),
+      ('sent', 0.011)]:
+      for p in latency.get_percentiles(stage):
+        self.assertAlmostEqual(p, delay)
+    self.assertEqual(latency.get_percentiles('received'), None)
+
+  def test_percentiles_over_window(self):
+    latency = LatencyTracker(window=100)
+    for i in range(200):
+      latency.add_frame(float(i), detect_time=i + (i % 100) / 1000.0)
+    p50, p95, p99 = latency.get_percentiles('detect')
+    self.assertAlmostEqual(p50, 0.0495, places=4)
+    self.assertAlmostEqual(p95, 0.09405, places=4)
+    self.assertAlmostEqual(p99, 0.09801, places=4)
+
+    # only the newest frames are kept
+    for i in range(100):
+      latency.add_frame(float(i), detect_time=i + 0.5)
+    self.assertAlmostEqual(latency.get_percentiles('detect')[0], 0.5)
+
+  def test_reply_splits_round_trip(self):
+    # sent 11 ms after capture, reply 9 ms later, of which the pi took 3 ms
+    latency = LatencyTracker()
+    latency.add_frame(10.0, sent_time=10.011, seq=7)
+    latency.add_reply(7, 0.003, reply_time=10.020)
+    self.assertAlmostEqual(latency.get_percentiles('received')[0], 0.014)
+    self.assertAlmostEqual(latency.get_percentiles('step')[0], 0.017)
+
+    # a second reply to the same packet, or one never sent, is ignored
+    latency.add_reply(7, 0.003, reply_time=10.030)
+    latency.add_reply(8, 0.003, reply_time=10.030)
+    self.assertEqual(len(latency.delays['received']), 1)
+
+  def test_lost_replies_forgotten(self):
+    latency = LatencyTracker(max_pending=4)
+    for seq in range(10):
+      latency.add_frame(float(seq), sent_time=seq + 0.01, seq=seq)
+    self.assertEqual(sorted(latency.pending), [6, 7, 8, 9])
+
+  def test_report(self):
+    latency = LatencyTracker()
+    self.assertEqual(latency.report(), 'latency p50/p95/p99 ms: ')
+    latency.add_frame(10.0, detect_time=10.005)
+    self.assertEqual(latency.report(),
+      'latency p50/p95/p99 ms: detect 5.0/5.0/5.0')
+
+
+if __name__ == '__main__':
+  unittest.main()
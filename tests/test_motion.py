@@ -0,0 +1,74 @@
+"""
+@file test_motion.py
+
+@brief Checks which frames MotionGate lets through
+"""
+import os # built-in packages
+import sys
+import unittest
+
+import numpy as np # 3rd party packages
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+from motion import MotionGate # application-specific
+
+
+def get_frame(x=None, noise=0, seed=0):
+  """
+  @brief Gets a gray table frame, with a puck at column x if given
+  """
+  frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+  if noise:
+    rng = np.random.RandomState(seed)
+    frame = cv2.add(frame, rng.randint(0, noise, frame.shape).astype(np.uint8))
+  if x is not None:
+    cv2.circle(frame, (x, 240), 13, (0, 255, 0), -1)
+  return frame
+
+
+class TestMotionGate(unittest.TestCase):
+  def test_first_frame_processed(self):
+    gate = MotionGate()
+    self.assertTrue(gate.check(get_frame()))
+
+  def test_still_frames_skipped(self):
+    gate = MotionGate(refresh_frames=100)
+    gate.check(get_frame(x=100))
+    for i in range(5):
+      self.assertFalse(gate.check(get_frame(x=100, noise=4, seed=i)))
+    self.assertEqual(gate.skipped, 5)
+    self.assertEqual(gate.total_skipped, 5)
+
+  def test_moving_puck_processed(self):
+    gate = MotionGate()
+    gate.check(get_frame(x=100))
+    self.assertTrue(gate.check(get_frame(x=130)))
+    self.assertEqual(gate.skipped, 0)
+
+  def test_compares_to_last_processed_frame(self):
+    # slow drift is caught once it adds up against the reference
+    gate = MotionGate(refresh_frames=100)
+    gate.check(get_frame(x=100))
+    results = [gate.check(get_frame(x=100 + i)) for i in range(1, 20)]
+    self.assertFalse(results[0])
+    self.assertTrue(True in results)
+
+  def test_refresh(self):
+    gate = MotionGate(refresh_frames=3)
+    gate.check(get_frame())
+    results = [gate.check(get_frame()) for i in range(8)]
+    self.assertEqual(results, [False, False, False, True,
+      False, False, False, True])
+
+  def test_reset(self):
+    gate = MotionGate()
+    gate.check(get_frame())
+    self.assertFalse(gate.check(get_frame()))
+    gate.reset()
+    self.assertTrue(gate.check(get_frame()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,105 @@
+"""
+@file test_multitracker.py
+
+@brief Checks that MultiObjectTracker keeps ids on the pucks they started on
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import shapes # application-specific
+from multitracker import MultiObjectTracker
+
+
+def get_puck(x, y, frame):
+  return shapes.Circle(x, y, 13, timestamp=frame / 60.0)
+
+
+class TestMultiObjectTracker(unittest.TestCase):
+  def test_ids_follow_pucks(self):
+    tracker = MultiObjectTracker()
+    ids = {}
+    for i in range(10):
+      # detections come back in a different order every frame
+      pucks = [('a', get_puck(100 + 10 * i, 100, i)),
+        ('b', get_puck(500 - 10 * i, 300, i))]
+      if i % 2:
+        pucks.reverse()
+      tracker.update([puck for name, puck in pucks])
+      for name, puck in pucks:
+        self.assertEqual(ids.setdefault(name, puck.track_id), puck.track_id)
+    self.assertNotEqual(ids['a'], ids['b'])
+    self.assertEqual(len(tracker.get_tracks()), 2)
+
+  def test_passing_pucks(self):
+    # from frame 5 on, puck b is closer to where a was last frame than a
+    # is, but not to where a is predicted to be
+    tracker = MultiObjectTracker()
+    for i in range(8):
+      a = get_puck(100 + 40 * i, 200, i)
+      b = get_puck(350 - 20 * i, 215, i)
+      tracker.update([a, b])
+      if i == 0:
+        a_id, b_id = a.track_id, b.track_id
+      self.assertEqual((a.track_id, b.track_id), (a_id, b_id))
+
+  def test_missed_track_dropped(self):
+    tracker = MultiObjectTracker(max_misses=2)
+    for i in range(3):
+      tracker.update([get_puck(100 + 10 * i, 100, i)])
+    track = tracker.get_tracks()[0]
+    for i in range(3, 5):
+      tracker.update([])
+      self.assertEqual(tracker.get_tracks(), [track])
+    self.assertEqual(track.misses, 2)
+    tracker.update([])
+    self.assertEqual(tracker.get_tracks(), [])
+
+  def test_coasts_through_missed_frame(self):
+    tracker = MultiObjectTracker()
+    for i in [0, 1, 2, 4]: # frame 3 missed
+      puck = get_puck(100 + 30 * i, 100, i)
+      tracker.update([puck])
+    self.assertEqual(len(tracker.tracks), 1)
+    self.assertEqual(tracker.get_track(puck).hits, 4)
+
+  def test_far_detection_starts_new_track(self):
+    tracker = MultiObjectTracker(max_dist=80)
+    first = get_puck(100, 100, 0)
+    tracker.update([first])
+    second = get_puck(300, 100, 1)
+    tracker.update([second])
+    self.assertNotEqual(first.track_id, second.track_id)
+
+  def test_confirmed_after_min_hits(self):
+    tracker = MultiObjectTracker(min_hits=3)
+    for i in range(3):
+      self.assertEqual(tracker.get_tracks(), [])
+      tracker.update([get_puck(100, 100 + 10 * i, i)])
+    self.assertEqual(len(tracker.get_tracks()), 1)
+    self.assertEqual(len(tracker.get_tracks(confirmed=0)), 1)
+
+  def test_scene_given_to_tracks(self):
+    tracker = MultiObjectTracker()
+    tracker.update([get_puck(100, 100, 0)])
+    walls = [shapes.Line(x1=0, y1=0, x2=0, y2=400)]
+    axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+    tracker.set_scene(walls, axis)
+    tracker.update([get_puck(100, 110, 1), get_puck(400, 100, 1)])
+    for track in tracker.get_tracks(confirmed=0):
+      self.assertTrue(track.planner.walls is walls)
+      self.assertTrue(track.planner.robot_axis is axis)
+
+  def test_planner_settings_given_to_tracks(self):
+    tracker = MultiObjectTracker(frames=4, mode='kalman', drag=0.5)
+    tracker.update([get_puck(100, 100, 0), get_puck(400, 100, 0)])
+    for track in tracker.get_tracks(confirmed=0):
+      self.assertEqual(track.planner.num_frames, 4)
+      self.assertEqual(track.planner.mode, 'kalman')
+      self.assertEqual(track.planner.kalman.drag, 0.5)
+
+
+if __name__ == '__main__':
+  unittest.main()
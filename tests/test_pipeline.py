@@ -0,0 +1,144 @@
+"""
+@file test_pipeline.py
+
+@brief Checks LatestQueue backpressure, in dropping and blocking modes, and
+  items flowing through a Pipeline
+"""
+import os # built-in packages
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+from pipeline import LatestQueue, Pipeline # application-specific
+
+
+class Counter:
+  """
+  @brief Source function giving 0 to count - 1, then nothing
+  """
+  def __init__(self, count, delay=0.0):
+    self.count = count
+    self.delay = delay
+    self.next = 0
+
+  def __call__(self):
+    time.sleep(self.delay)
+    if self.next >= self.count:
+      time.sleep(0.01)
+      return None
+    self.next += 1
+    return self.next - 1
+
+
+def collect(pipeline, count, timeout=2.0):
+  """
+  @brief Gets outputs from a pipeline until count arrive or it goes quiet
+  """
+  results = []
+  while len(results) < count:
+    item = pipeline.get(timeout)
+    if item is None:
+      break
+    results.append(item)
+  return results
+
+
+class TestLatestQueue(unittest.TestCase):
+  def test_full_queue_drops_oldest(self):
+    queue = LatestQueue(maxsize=2)
+    for i in range(5):
+      queue.put(i)
+    self.assertEqual(queue.depth(), 2)
+    self.assertEqual(queue.dropped, 3)
+    self.assertEqual(queue.get(), 3)
+    self.assertEqual(queue.get(), 4)
+
+  def test_get_timeout(self):
+    queue = LatestQueue()
+    start_time = time.time()
+    self.assertEqual(queue.get(timeout=0.05), None)
+    self.assertGreaterEqual(time.time() - start_time, 0.04)
+
+  def test_blocking_put(self):
+    queue = LatestQueue(maxsize=1, drop=0)
+    queue.put(0)
+    thread = threading.Thread(target=queue.put, args=(1,))
+    thread.start()
+    time.sleep(0.05)
+    self.assertTrue(thread.is_alive()) # waiting for room
+    self.assertEqual(queue.get(), 0)
+    thread.join(1.0)
+    self.assertFalse(thread.is_alive())
+    self.assertEqual(queue.get(), 1)
+    self.assertEqual(queue.dropped, 0)
+
+  def test_close_wakes_get(self):
+    queue = LatestQueue()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(queue.get()))
+    thread.start()
+    time.sleep(0.05)
+    queue.close()
+    thread.join(1.0)
+    self.assertFalse(thread.is_alive())
+    self.assertEqual(results, [None])
+
+
+class TestPipeline(unittest.TestCase):
+  def test_stages_in_order(self):
+    pipeline = Pipeline()
+    pipeline.add_source('count', Counter(20, delay=0.005))
+    pipeline.add_stage('double', lambda x: 2 * x)
+    pipeline.add_stage('odd', lambda x: x + 1)
+    pipeline.start()
+    results = collect(pipeline, 20, timeout=0.5)
+    pipeline.stop()
+
+    # frames can be dropped, but never reordered
+    self.assertTrue(len(results) > 0)
+    self.assertEqual(results, sorted(results))
+    self.assertEqual(set(x % 2 for x in results), set([1]))
+
+    stats = pipeline.get_stats()
+    self.assertEqual([stat[0] for stat in stats], ['count', 'double', 'odd'])
+    self.assertGreaterEqual(stats[0][1], 20)
+
+  def test_slow_stage_drops(self):
+    pipeline = Pipeline()
+    pipeline.add_source('count', Counter(50))
+    pipeline.add_stage('slow', lambda x: time.sleep(0.01) or x)
+    pipeline.start()
+    results = collect(pipeline, 50, timeout=0.5)
+    pipeline.stop()
+
+    # the slow stage always works on the newest frame
+    self.assertEqual(results[-1], 49)
+    self.assertLess(len(results), 50)
+    self.assertGreater(pipeline.queues[0].dropped, 0)
+    self.assertTrue('dropped' in pipeline.report())
+
+  def test_blocking_processes_every_item(self):
+    pipeline = Pipeline(drop=0)
+    pipeline.add_source('count', Counter(50))
+    pipeline.add_stage('slow', lambda x: time.sleep(0.002) or x)
+    pipeline.start()
+    results = collect(pipeline, 50, timeout=0.5)
+    pipeline.stop()
+    self.assertEqual(results, range(50))
+    self.assertEqual(pipeline.queues[0].dropped, 0)
+
+  def test_none_results_not_passed_on(self):
+    pipeline = Pipeline(queue_size=10)
+    pipeline.add_source('count', Counter(10, delay=0.002))
+    pipeline.add_stage('even', lambda x: x if x % 2 == 0 else None)
+    pipeline.start()
+    results = collect(pipeline, 5, timeout=0.5)
+    pipeline.stop()
+    self.assertEqual(results, [0, 2, 4, 6, 8])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,65 @@
+"""
+@file test_quality.py
+
+@brief Checks how QualityController steps between levels to hold its budget
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+from quality import QualityController, LEVELS, get_level # application-specific
+
+
+def run(quality, frame_time, frames):
+  """
+  @brief Feeds the same processing time for a number of frames
+
+  @return The levels changed to, in order
+  """
+  changes = []
+  for i in range(frames):
+    if quality.update(frame_time):
+      changes.append(quality.level)
+  return changes
+
+
+class TestQualityController(unittest.TestCase):
+  def test_over_budget_steps_down(self):
+    quality = QualityController(budget=0.025, window=10)
+    self.assertEqual(run(quality, 0.030, 9), [])
+    self.assertEqual(run(quality, 0.030, 1), [1])
+    self.assertEqual(run(quality, 0.030, 100), range(2, len(LEVELS)))
+    self.assertEqual(quality.level, len(LEVELS) - 1) # stays at the lowest
+
+  def test_headroom_steps_up_after_hold(self):
+    quality = QualityController(budget=0.025, level=3, window=10,
+      hold_frames=60)
+    self.assertEqual(run(quality, 0.005, 59), [])
+    self.assertEqual(run(quality, 0.005, 1), [2])
+    self.assertEqual(run(quality, 0.005, 59), [])
+    self.assertEqual(run(quality, 0.005, 1), [1])
+
+  def test_within_budget_holds(self):
+    quality = QualityController(budget=0.025, level=2, headroom=0.6)
+    self.assertEqual(run(quality, 0.020, 300), [])
+    self.assertEqual(quality.changes, 0)
+
+  def test_settings(self):
+    quality = QualityController(level=len(LEVELS) - 1)
+    settings = quality.get_settings()
+    self.assertEqual((settings['pyramid_scale'], settings['blur_window'],
+      settings['morph_iterations']), LEVELS[-1])
+    self.assertTrue('level %d' % (len(LEVELS) - 1) in quality.report())
+
+
+  def test_start_level_from_pyramid_scale(self):
+    self.assertEqual(LEVELS[get_level(1)][0], 1)
+    self.assertEqual(get_level(2), 1)
+    self.assertEqual(LEVELS[get_level(4)][0], 4)
+    self.assertEqual(get_level(8), len(LEVELS) - 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
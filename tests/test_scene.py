@@ -0,0 +1,102 @@
+"""
+@file test_scene.py
+
+@brief Checks when SceneCache locks onto, and lets go of, the static scene
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import shapes # application-specific
+from scene import SceneCache
+
+
+def get_scene(dx=0, dy=0):
+  """
+  @brief Gets robot markers, rails and axis, shifted by (dx, dy)
+  """
+  markers = [shapes.Circle(100 + dx, 400 + dy, 10),
+    shapes.Circle(540 + dx, 400 + dy, 10)]
+  walls = [shapes.Line(x1=60 + dx, y1=0 + dy, x2=60 + dx, y2=400 + dy),
+    shapes.Line(x1=580 + dx, y1=0 + dy, x2=580 + dx, y2=400 + dy)]
+  axis = shapes.Line(x1=100 + dx, y1=400 + dy, x2=540 + dx, y2=400 + dy)
+  return markers, walls, axis
+
+
+class TestSceneCache(unittest.TestCase):
+  def lock(self, cache):
+    for i in range(cache.warmup_frames):
+      self.assertFalse(cache.locked)
+      self.assertTrue(cache.due())
+      cache.update(*get_scene())
+    self.assertTrue(cache.locked)
+
+  def test_locks_after_warmup(self):
+    cache = SceneCache(warmup_frames=3, check_interval=5)
+    self.lock(cache)
+
+    # detection only runs every check_interval frames once locked
+    due = []
+    for i in range(10):
+      if cache.due():
+        due.append(i)
+        cache.update(*get_scene())
+      else:
+        markers, walls, axis = cache.skip()
+        self.assertEqual(len(markers), 2)
+    self.assertEqual(due, [4, 9])
+
+  def test_small_move_keeps_cache(self):
+    cache = SceneCache(warmup_frames=3, tolerance=5)
+    self.lock(cache)
+    cached = cache.robot_markers
+    version = cache.version
+    markers, walls, axis = cache.update(*get_scene(dx=3, dy=-2))
+    self.assertTrue(cache.locked)
+    self.assertTrue(markers is cached)
+    self.assertEqual(cache.version, version)
+
+  def test_moved_scene_unlocks(self):
+    cache = SceneCache(warmup_frames=3, tolerance=5)
+    self.lock(cache)
+    moved = get_scene(dx=20)
+    markers, walls, axis = cache.update(*moved)
+    self.assertFalse(cache.locked)
+    self.assertTrue(markers is moved[0])
+
+    # and locks again once the new position holds
+    for i in range(2):
+      cache.update(*get_scene(dx=20))
+    self.assertTrue(cache.locked)
+
+  def test_detection_order_ignored(self):
+    cache = SceneCache(warmup_frames=3)
+    self.lock(cache)
+    markers, walls, axis = get_scene()
+    cache.update(markers[::-1], walls[::-1], axis)
+    self.assertTrue(cache.locked)
+
+  def test_one_detection_matches_one_marker(self):
+    # both markers within tolerance of the same detection, and neither
+    # near the other, so the scene has moved
+    cache = SceneCache(warmup_frames=1, tolerance=5)
+    unused, walls, axis = get_scene()
+    markers = [shapes.Circle(100, 400, 10), shapes.Circle(104, 400, 10)]
+    cache.update(markers, walls, axis)
+    self.assertTrue(cache.locked)
+    moved = [shapes.Circle(102, 400, 10), shapes.Circle(300, 400, 10)]
+    self.assertFalse(cache.matches(moved, walls))
+    self.assertTrue(cache.matches(markers[::-1], walls))
+
+  def test_incomplete_scene_never_locks(self):
+    cache = SceneCache(warmup_frames=2)
+    markers, walls, axis = get_scene()
+    for i in range(5):
+      cache.update(markers[:1], walls, None)
+    self.assertFalse(cache.locked)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,122 @@
+"""
+@file test_segmentation.py
+
+@brief Checks LabelSegmenter masks against cv2.inRange, and the cached BGR
+  table against HSV classification
+"""
+import os # built-in packages
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np # 3rd party packages
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import colors # application-specific
+from segmentation import LabelSegmenter
+
+
+def in_range(img_hsv, color):
+  """
+  @brief Thresholds an HSV image the way the tracker did before fusing
+  """
+  mask = cv2.inRange(img_hsv, np.array(color.lower0), np.array(color.upper0))
+  if tuple(color.lower1) != (0,0,0) or tuple(color.upper1) != (0,0,0):
+    mask |= cv2.inRange(img_hsv, np.array(color.lower1),
+      np.array(color.upper1))
+  return mask
+
+
+def random_hsv(shape, seed):
+  """
+  @brief Gets a random HSV image, with hue on OpenCV's 0 to 179 scale
+  """
+  rng = np.random.RandomState(seed)
+  img = rng.randint(0, 256, shape + (3,)).astype(np.uint8)
+  img[:, :, 0] %= 180
+  return img
+
+
+class TestClassify(unittest.TestCase):
+  def setUp(self):
+    # Red and Magenta overlap in hue, and Red has two ranges
+    self.color_list = [colors.Green, colors.Red, colors.White, colors.Magenta]
+    self.segmenter = LabelSegmenter(self.color_list)
+
+  def test_masks_match_in_range(self):
+    img_hsv = random_hsv((120, 160), 1)
+    labels = self.segmenter.classify(img_hsv)
+    for color in self.color_list:
+      mask = self.segmenter.mask(labels, color)
+      self.assertTrue(np.array_equal(mask, in_range(img_hsv, color)),
+        color.__name__)
+
+  def test_overlapping_colors_keep_both_bits(self):
+    img_hsv = np.array([[[150, 200, 200]]], dtype=np.uint8)
+    labels = self.segmenter.classify(img_hsv)
+    self.assertEqual(self.segmenter.mask(labels, colors.Red)[0, 0], 255)
+    self.assertEqual(self.segmenter.mask(labels, colors.Magenta)[0, 0], 255)
+    self.assertEqual(self.segmenter.mask(labels, colors.Green)[0, 0], 0)
+
+  def test_unused_range_ignores_black(self):
+    img_hsv = np.zeros((1, 1, 3), dtype=np.uint8)
+    labels = self.segmenter.classify(img_hsv)
+    self.assertEqual(labels[0, 0], 0)
+
+  def test_duplicates_and_none_skipped(self):
+    segmenter = LabelSegmenter([colors.Green, None, colors.Green])
+    self.assertEqual(segmenter.colors, [colors.Green])
+    self.assertTrue(colors.Green in segmenter)
+    self.assertFalse(colors.Red in segmenter)
+
+
+class TestBgrTable(unittest.TestCase):
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.color_list = [colors.Green, colors.Red, colors.White]
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def test_bin_centers_match_hsv(self):
+    # pixels at their bin centers have exactly the label of that center
+    bits = 5
+    segmenter = LabelSegmenter(self.color_list, bgr_bits=bits,
+      cache_dir=self.cache_dir)
+    rng = np.random.RandomState(2)
+    img = rng.randint(0, 256, (120, 160, 3)).astype(np.uint8)
+    img = (img >> (8 - bits) << (8 - bits)) + (1 << (7 - bits))
+    expected = segmenter.classify(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+    self.assertTrue(np.array_equal(segmenter.classify_bgr(img), expected))
+
+  def test_table_cached(self):
+    first = LabelSegmenter(self.color_list, bgr_bits=4,
+      cache_dir=self.cache_dir)
+    names = os.listdir(self.cache_dir)
+    self.assertEqual(len(names), 1)
+
+    second = LabelSegmenter(self.color_list, bgr_bits=4,
+      cache_dir=self.cache_dir)
+    self.assertEqual(os.listdir(self.cache_dir), names)
+    self.assertTrue(np.array_equal(first.bgr_table, second.bgr_table))
+
+    # different colors or bits get their own table
+    LabelSegmenter(self.color_list, bgr_bits=5, cache_dir=self.cache_dir)
+    LabelSegmenter([colors.Green], bgr_bits=4, cache_dir=self.cache_dir)
+    self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+  def test_stale_cache_rebuilt(self):
+    segmenter = LabelSegmenter(self.color_list, bgr_bits=4,
+      cache_dir=self.cache_dir)
+    path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+    np.save(path, np.zeros(10, dtype=np.uint8))
+    rebuilt = LabelSegmenter(self.color_list, bgr_bits=4,
+      cache_dir=self.cache_dir)
+    self.assertTrue(np.array_equal(rebuilt.bgr_table, segmenter.bgr_table))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,97 @@
+"""
+@file test_tracker.py
+
+@brief Checks BallTracker's search windows on drawn frames
+"""
+import os # built-in packages
+import sys
+import unittest
+
+import numpy as np # 3rd party packages
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import colors # application-specific
+from tracker import BallTracker
+from trajectory import TrajectoryPlanner
+
+
+def draw_table(puck, robot):
+  """
+  @brief Draws a frame with the puck and robot at the given (x, y) centers,
+    and the robot markers and rails at fixed places
+  """
+  frame = np.full((480, 640, 3), 60, dtype=np.uint8)
+  cv2.circle(frame, puck, 15, (0, 0, 255), -1)
+  cv2.circle(frame, robot, 15, (255, 0, 0), -1)
+  for x in [100, 540]:
+    cv2.circle(frame, (x, 420), 16, (0, 255, 0), -1) # robot markers
+    cv2.circle(frame, (x, 30), 16, (255, 255, 255), -1) # rails
+  return frame
+
+
+class TestSearchWindows(unittest.TestCase):
+  def setUp(self):
+    self.tracker = BallTracker(robot_color=colors.Blue,
+      robot_marker_color=colors.Green, rail_color=colors.White,
+      track_colors=[colors.Red], radius=10, fused=1, roi_tracking=1,
+      scene_cache=1)
+    self.planner = TrajectoryPlanner()
+
+    # names of the label images classified, 'labels' for the full frame
+    self.classified = []
+    classify = self.tracker.classify
+    def record(img_hsv, name):
+      self.classified.append(name)
+      return classify(img_hsv, name)
+    self.tracker.classify = record
+
+  def step(self, i, puck, robot):
+    frame, img_hsv = self.tracker.setup_frame(draw_table(puck, robot),
+      w=640, h=480, timestamp=i / 60.0)
+    object_list, robot, markers, walls, axis = self.tracker.find_all(img_hsv,
+      self.planner)
+    if object_list:
+      self.planner.add_point(object_list[0])
+    return object_list, robot
+
+  def test_robot_found_in_window(self):
+    for i in range(40):
+      object_list, robot = self.step(i, (200 + 3 * i, 100 + 2 * i),
+        (300 + 5 * i, 420))
+      self.assertEqual(len(object_list), 1)
+      self.assertAlmostEqual(robot.x, 300 + 5 * i, delta=1.0)
+      if i > 0:
+        x, y, w, h = self.tracker.robot_roi
+        self.assertTrue(x < robot.x < x + w and y < robot.y < y + h)
+
+  def test_no_full_frame_labels_once_scene_locked(self):
+    for i in range(20):
+      self.step(i, (200 + 3 * i, 100 + 2 * i), (300, 420))
+    self.assertTrue(self.tracker.scene.locked)
+
+    del self.classified[:]
+    for i in range(20, 40):
+      if self.tracker.scene.due():
+        break
+      self.step(i, (200 + 3 * i, 100 + 2 * i), (300, 420))
+    self.assertTrue(len(self.classified) > 0)
+    self.assertFalse('labels' in self.classified)
+
+  def test_robot_lost_from_window(self):
+    for i in range(5):
+      self.step(i, (200, 100 + 10 * i), (300, 420))
+    self.assertNotEqual(self.tracker.robot_roi, None)
+
+    # robot moved further than its window allows
+    for i in range(5, 5 + self.tracker.roi_miss_limit):
+      object_list, robot = self.step(i, (200, 100 + 10 * i), (500, 420))
+      self.assertEqual(robot, None)
+    object_list, robot = self.step(i + 1, (200, 100 + 10 * i), (500, 420))
+    self.assertEqual(self.tracker.robot_roi, None)
+    self.assertAlmostEqual(robot.x, 500, delta=1.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,216 @@
+"""
+@file test_trajectory.py
+
+@brief Checks TrajectoryPlanner predictions against known geometry
+"""
+import os # built-in packages
+import random
+import sys
+import unittest
+
+import numpy as np # 3rd party packages
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import shapes # application-specific
+from trajectory import TrajectoryPlanner, RESUM_POINTS
+
+
+def get_slope(ln):
+  """
+  @brief Gets the slope of a non-vertical Line from its two points
+  """
+  return (ln.y2 - ln.y1) / (ln.x2 - ln.x1)
+
+
+class TestBestFitLine(unittest.TestCase):
+  def test_matches_polyfit(self):
+    random.seed(1)
+    for frames in [4, 20]:
+      planner = TrajectoryPlanner(frames=frames)
+      for i in range(3 * frames):
+        planner.add_point(shapes.Point(random.randint(0, 640),
+          random.randint(0, 480)))
+        if None in planner.x_list:
+          continue
+        m, b = np.polyfit(planner.x_list, planner.y_list, 1)
+        ln = planner.get_best_fit_line()
+        self.assertAlmostEqual(get_slope(ln), m, places=6)
+        self.assertAlmostEqual(ln.y1, m * ln.x1 + b, places=6)
+
+  def test_sums_after_resum(self):
+    random.seed(2)
+    planner = TrajectoryPlanner(frames=5)
+    for i in range(RESUM_POINTS + 3):
+      planner.add_point(shapes.Point(random.uniform(0, 640),
+        random.uniform(0, 480)))
+    self.assertEqual(planner.sum_count, 5)
+    self.assertAlmostEqual(planner.sum_x, sum(planner.x_list), places=6)
+    self.assertAlmostEqual(planner.sum_xy,
+      sum(x * y for x, y in zip(planner.x_list, planner.y_list)), places=3)
+
+  def test_vertical_line(self):
+    planner = TrajectoryPlanner(frames=4)
+    for i in range(4):
+      planner.add_point(shapes.Point(100, 50 + 10 * i))
+    ln = planner.get_best_fit_line()
+    self.assertEqual(ln.x1, 100)
+    self.assertEqual(ln.x2, 100)
+    self.assertNotEqual(ln.y1, ln.y2)
+
+
+def add_shot(planner, x, y, vx, vy, count, start_time=0.0, fps=60.0,
+  radius=13):
+  """
+  @brief Adds timestamped points of an object moving at constant velocity
+
+  @return Time of the last point added
+  """
+  for i in range(count):
+    t = i / fps
+    planner.add_point(shapes.Circle(x + vx * t, y + vy * t, radius,
+      timestamp=start_time + t))
+  return start_time + (count - 1) / fps
+
+
+class TestIntercept(unittest.TestCase):
+  def setUp(self):
+    self.axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+
+  def test_straight_shot(self):
+    # crosses y = 400 at x = 275, 350/600 s after the first point
+    for mode in ['fit', 'kalman']:
+      planner = TrajectoryPlanner(frames=4, mode=mode, robot_axis=self.axis)
+      last_time = add_shot(planner, 100, 50, 300, 600, 4, start_time=1000.0)
+      planner.get_trajectory_list()
+      intercept = planner.get_intercept()
+      self.assertAlmostEqual(intercept.x, 275.0, delta=1.0)
+      self.assertAlmostEqual(intercept.y, 400.0, places=3)
+      self.assertAlmostEqual(intercept.timestamp, 1000.0 + 350 / 600.0,
+        delta=0.005)
+      self.assertAlmostEqual(intercept.time, intercept.timestamp - last_time,
+        places=6)
+
+  def test_frames_without_timestamps(self):
+    planner = TrajectoryPlanner(frames=4, robot_axis=self.axis)
+    for i in range(4):
+      planner.add_point(shapes.Point(100 + 5 * i, 50 + 10 * i))
+    planner.get_trajectory_list()
+    intercept = planner.get_intercept()
+    self.assertEqual(intercept.timestamp, None)
+    self.assertAlmostEqual(intercept.time, (400 - 80) / 10.0, places=3)
+
+  def test_moving_away(self):
+    planner = TrajectoryPlanner(frames=4, robot_axis=self.axis)
+    add_shot(planner, 100, 300, 100, -600, 4)
+    planner.get_trajectory_list()
+    self.assertEqual(planner.get_intercept(), None)
+
+
+def reflect_to_axis(x, y, vx, vy, radius, width, axis_y, dt=1e-5):
+  """
+  @brief Steps an object between rails at x = 0 and x = width, reflecting
+    its edge off them, until its center reaches y = axis_y
+
+  @return (x, bounces) where it reaches the axis
+  """
+  bounces = 0
+  while y < axis_y:
+    x += vx * dt
+    y += vy * dt
+    if x < radius:
+      x, vx = 2 * radius - x, -vx
+      bounces += 1
+    elif x > width - radius:
+      x, vx = 2 * (width - radius) - x, -vx
+      bounces += 1
+  return x, bounces
+
+
+class TestUnfold(unittest.TestCase):
+  def setUp(self):
+    self.walls = [shapes.Line(x1=0, y1=0, x2=0, y2=400),
+      shapes.Line(x1=200, y1=400, x2=200, y2=0)]
+    self.axis = shapes.Line(x1=0, y1=400, x2=200, y2=400)
+
+  def get_planner(self, mode='fit', bounce=20):
+    return TrajectoryPlanner(frames=4, bounce=bounce, walls=self.walls,
+      robot_axis=self.axis, mode=mode)
+
+  def test_bounces_match_reflection(self):
+    for vx in [50, 300, -700, 1500]:
+      for mode in ['fit', 'param', 'kalman']:
+        planner = self.get_planner(mode)
+        last_time = add_shot(planner, 100, 50, vx, 300, 4)
+        traj_list = planner.get_trajectory_list()
+        x, bounces = reflect_to_axis(100 + vx * last_time,
+          50 + 300 * last_time, vx, 300, 13, 200, 400)
+        self.assertEqual(len(traj_list) - 1, bounces)
+        self.assertAlmostEqual(traj_list[-1].x2, x, delta=0.5)
+        self.assertAlmostEqual(traj_list[-1].y2, 400.0, delta=0.5)
+
+        # the same end without the segments, and the time along the path
+        planner.get_trajectory_list(segments=0)
+        self.assertAlmostEqual(planner.traj.x2, x, delta=0.5)
+        self.assertAlmostEqual(planner.get_intercept().time,
+          (400 - 50) / 300.0 - last_time, delta=0.005)
+
+  def test_start_within_radius_of_rail(self):
+    # detected 2 pixels closer to the rail than its radius allows
+    for x, vx, end_x in [(11, 300, 26.0), (189, -300, 174.0)]:
+      planner = self.get_planner('param', bounce=1)
+      add_shot(planner, x - vx * 3 / 60.0, 50, vx, 300, 4)
+      traj_list = planner.get_trajectory_list()
+      self.assertEqual(len(traj_list), 2)
+      self.assertAlmostEqual(traj_list[-1].x2, end_x, delta=0.5)
+
+  def test_too_many_bounces(self):
+    planner = self.get_planner(bounce=1)
+    add_shot(planner, 100, 50, 1500, 300, 4)
+    self.assertEqual(planner.get_trajectory_list(), [])
+    self.assertEqual(planner.traj, None)
+
+  def test_moving_away(self):
+    planner = self.get_planner()
+    add_shot(planner, 100, 300, 300, -300, 4)
+    self.assertEqual(planner.get_trajectory_list(), [])
+
+
+class TestParamFit(unittest.TestCase):
+  def setUp(self):
+    self.axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+
+  def test_exact_on_constant_velocity(self):
+    planner = TrajectoryPlanner(frames=6, mode='param')
+    last_time = add_shot(planner, 100, 50, 200, -150, 6, start_time=1000.0)
+    x, y, vx, vy = planner.get_state()
+    self.assertAlmostEqual(vx, 200.0, places=4)
+    self.assertAlmostEqual(vy, -150.0, places=4)
+    self.assertAlmostEqual(x, 100 + 200 * (last_time - 1000.0), places=4)
+    self.assertAlmostEqual(y, 50 - 150 * (last_time - 1000.0), places=4)
+
+  def test_vertical_shot(self):
+    planner = TrajectoryPlanner(frames=6, mode='param', robot_axis=self.axis)
+    add_shot(planner, 300, 50, 0, 600, 6)
+    planner.get_trajectory_list()
+    intercept = planner.get_intercept()
+    self.assertAlmostEqual(intercept.x, 300.0, places=3)
+    self.assertAlmostEqual(intercept.y, 400.0, places=3)
+
+  def test_noisy_vertical_shot(self):
+    # 1 pixel of noise barely moves a fit against time, unlike y = m*x + b
+    random.seed(3)
+    errors = []
+    for trial in range(50):
+      planner = TrajectoryPlanner(frames=6, mode='param', robot_axis=self.axis)
+      for i in range(6):
+        t = i / 60.0
+        planner.add_point(shapes.Circle(300 + random.gauss(0, 1),
+          50 + 600 * t + random.gauss(0, 1), 13, timestamp=t))
+      planner.get_trajectory_list()
+      errors.append(abs(planner.get_intercept().x - 300.0))
+    self.assertLess(sorted(errors)[len(errors) // 2], 15.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,33 @@
+"""
+@file test_utils.py
+
+@brief Checks geometry helpers in utils
+"""
+import os # built-in packages
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import shapes # application-specific
+import utils
+
+
+class TestLineIntersect(unittest.TestCase):
+  def test_either_direction(self):
+    axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+    down = shapes.Line(x1=100, y1=50, x2=110, y2=70)
+    up = shapes.Line(x1=110, y1=70, x2=100, y2=50)
+    for ln in [down, up]:
+      pt = utils.line_intersect(ln, axis)
+      self.assertAlmostEqual(pt.x, 275.0)
+      self.assertAlmostEqual(pt.y, 400.0)
+
+  def test_parallel(self):
+    axis = shapes.Line(x1=0, y1=400, x2=640, y2=400)
+    ln = shapes.Line(x1=0, y1=50, x2=640, y2=50)
+    self.assertEqual(utils.line_intersect(ln, axis), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
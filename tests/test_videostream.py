@@ -0,0 +1,64 @@
+"""
+@file test_videostream.py
+
+@brief Checks the capture loops of the video streams without a camera
+"""
+import os # built-in packages
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  '..', 'src'))
+import videostream # application-specific
+
+MISSING = '/nonexistent/camera.avi' # every grab fails, as if unplugged
+VIDEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+  'media', 'bounce.mp4')
+
+
+class TestFailedGrabs(unittest.TestCase):
+  def test_retry_wait(self):
+    waits = [videostream.get_retry_wait(n) for n in range(1, 20)]
+    self.assertEqual(waits[0], videostream.GRAB_RETRY_MIN)
+    self.assertEqual(waits, sorted(waits))
+    self.assertEqual(waits[-1], videostream.GRAB_RETRY_MAX)
+
+  def test_webcam_backs_off(self):
+    cap = videostream.WebcamVideoStream(camera=MISSING).start()
+    time.sleep(0.3)
+    cap.stop()
+    dropped, failed = cap.get_stats()
+    self.assertGreater(failed, 0)
+    self.assertLess(failed, 20)
+
+  def test_process_backs_off(self):
+    cap = videostream.ProcessVideoStream(camera=MISSING).start()
+    time.sleep(0.3)
+    cap.stop()
+    dropped, failed = cap.get_stats()
+    self.assertGreater(failed, 0)
+    self.assertLess(failed, 20)
+
+
+class TestFileVideoStream(unittest.TestCase):
+  def test_age_without_realtime(self):
+    # frames decode far faster than the video plays, so their times in the
+    # video run ahead of the wall clock, but their ages do not
+    cap = videostream.FileVideoStream(VIDEO, realtime=0).start()
+    stamps = []
+    for i in range(30):
+      frame, timestamp, seq = cap.read_next(timeout=1.0)
+      self.assertEqual(seq, i + 1)
+      stamps.append(timestamp)
+      age = cap.get_age(timestamp)
+      self.assertTrue(0.0 <= age < 0.5, age)
+    cap.stop()
+    self.assertAlmostEqual(stamps[-1] - stamps[0], 29 / cap.fps, places=6)
+    self.assertTrue(0.0 <= cap.get_age(stamps[0]) < 1.0)
+    self.assertLessEqual(cap.get_capture_time(stamps[0]),
+      cap.get_capture_time(stamps[-1]))
+
+
+if __name__ == '__main__':
+  unittest.main()